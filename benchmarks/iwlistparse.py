@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# iwlistparse.py
+# Times parsing of `iwlist scan` output: wifiscan's single pass parse_cell()
+# against the old parser, which ran every rule over every line of a cell.
+#
+# Without arguments, outputs of 10 to 800 cells are synthesized. Recorded
+# outputs can be given instead, and recorded from a real interface with
+# --record (needs root for a fresh scan):
+#
+# $ python benchmarks/iwlistparse.py --record wlan0 iwlist.txt
+# $ python benchmarks/iwlistparse.py iwlist.txt
+
+import os
+import sys
+import subprocess
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                ".."))
+
+import wifiscan
+
+
+CELL = """          Cell %(cell)02d - Address: 02:00:00:00:%(hi)02X:%(lo)02X
+                    Channel:%(channel)d
+                    Frequency:%(frequency).3f GHz (Channel %(channel)d)
+                    Quality=%(quality)d/70  Signal level=%(signal)d dBm
+                    Encryption key:%(key)s
+                    ESSID:"network-%(cell)d"
+                    Bit Rates:1 Mb/s; 2 Mb/s; 5.5 Mb/s; 11 Mb/s; 6 Mb/s
+                              9 Mb/s; 12 Mb/s; 18 Mb/s
+                    Bit Rates:24 Mb/s; 36 Mb/s; 48 Mb/s; 54 Mb/s
+                    Mode:Master
+                    Extra:tsf=0000000000000000
+                    Extra: Last beacon: 100ms ago
+                    IE: Unknown: 0009686F6D652D77696669
+                    IE: Unknown: 010882848B960C121824
+                    IE: Unknown: 030101
+%(ies)s"""
+
+WPA2 = """                    IE: IEEE 802.11i/WPA2 Version 1
+                        Group Cipher : CCMP
+                        Pairwise Ciphers (1) : CCMP
+                        Authentication Suites (1) : PSK
+"""
+
+WPA = """                    IE: WPA Version 1
+                        Group Cipher : TKIP
+                        Pairwise Ciphers (1) : TKIP
+                        Authentication Suites (1) : PSK
+"""
+
+def synthesize(count):
+    """returns iwlist scan output with count cells, a mix of open, WEP,
+       WPA and WPA2 networks
+    """
+    cells = ["wlan0     Scan completed :\n"]
+    for i in xrange(count):
+        channel = 1 + i % 13
+        kind = i % 4
+        cells.append(CELL % {
+            'cell': i + 1, 'hi': i >> 8 & 0xff, 'lo': i & 0xff,
+            'channel': channel, 'frequency': (2407 + 5 * channel) / 1000.0,
+            'quality': 20 + i % 50, 'signal': -90 + i % 50,
+            'key': "off" if kind == 0 else "on",
+            'ies': {2: WPA, 3: WPA2 + WPA}.get(kind, ""),
+        })
+    return "".join(cells)
+
+def rulesParse(lines):
+    """the parser as it was before the single pass parse_cell() """
+    cells = [[]]
+    for line in lines:
+        cell_line = wifiscan.match(line, "Cell ")
+        if cell_line != None:
+            cells.append([])
+            line = cell_line[-27:]
+        cells[-1].append(line.rstrip())
+    parsed_cells = []
+    for cell in cells[1:]:
+        parsed_cell = {}
+        for key, rule in wifiscan._builtin_rules.iteritems():
+            parsed_cell[key] = rule(cell)
+        parsed_cells.append(parsed_cell)
+    return parsed_cells
+
+def record(ifname, path):
+    data = subprocess.check_output(['iwlist', ifname, "scan"])
+    fp = open(path, 'w')
+    try:
+        fp.write(data)
+    finally:
+        fp.close()
+    print "recorded %d bytes, %d cells" % (len(data),
+        len(list(wifiscan.iter_cells(data.split('\n')))))
+
+def bench(name, data, repeat=5):
+    lines = data.split('\n')
+    old = rulesParse(lines)
+    new = list(wifiscan.iter_cells(lines))
+    if old != new:
+        raise AssertionError("parsers disagree on %s" % name)
+    number = max(1, 2000 / (len(new) + 1))
+    oldTime = min(timeit.repeat(lambda: rulesParse(lines), number=number,
+                                repeat=repeat)) / number
+    newTime = min(timeit.repeat(lambda: list(wifiscan.iter_cells(lines)),
+                                number=number, repeat=repeat)) / number
+    print "%-20s %4d cells %8d bytes  rules %8.3f ms  single pass %8.3f ms  x%.1f" % (
+        name, len(new), len(data), oldTime * 1000, newTime * 1000,
+        oldTime / newTime)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--record"]:
+        record(args[1], args[2])
+    elif args:
+        for path in args:
+            bench(os.path.basename(path), open(path, 'r').read())
+    else:
+        for count in (10, 100, 200, 400, 800):
+            bench("synthetic", synthesize(count))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# scanparse.py
+# Times parsing of SIOCGIWSCAN event streams: the offset based
+# parseScanEvents() against the old parser, which re-sliced the remaining
+# stream after every event.
+#
+# Without arguments, streams of 10 to 400 access points are synthesized.
+# Recorded streams (raw bytes of Iwscan.stream) can be given instead, and
+# recorded from a real interface with --record (needs root):
+#
+# $ python benchmarks/scanparse.py --record wlan0 scan.bin
+# $ python benchmarks/scanparse.py scan.bin
+
+import os
+import sys
+import struct
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "..", "wifilib"))
+
+import pythonwifi.flags
+from interfaces import Iwscan, Iwscanresult, parseScanEvents
+
+
+def event(cmd, payload):
+    return struct.pack('HH', pythonwifi.flags.IW_EV_LCP_LEN + len(payload),
+                       cmd) + payload
+
+def synthesize(count):
+    """returns a scan stream with count access points, with the events
+       a typical mac80211 driver reports for each
+    """
+    flags = pythonwifi.flags
+    events = []
+    for i in xrange(count):
+        mac = struct.pack('>HI', 0x0200, i)
+        essid = "network-%d" % i
+        events.append(event(flags.SIOCGIWAP, struct.pack('H', 1) + mac + '\0'*8))
+        events.append(event(flags.SIOCGIWNAME, "IEEE 802.11bgn\0\0"))
+        events.append(event(flags.SIOCGIWFREQ, struct.pack('ihBB', 2412 + 5*(i % 13), 6, 0, 0)))
+        events.append(event(flags.SIOCGIWMODE, struct.pack('i', 3)))
+        events.append(event(flags.IWEVQUAL, struct.pack('BBBB', 40 + i % 30, 200 - i % 60, 0, 0x0f)))
+        events.append(event(flags.SIOCGIWENCODE, struct.pack('HH', 0, 0x8000)))
+        events.append(event(flags.SIOCGIWESSID, struct.pack('HH', len(essid), 1) + essid))
+        rates = ''.join(struct.pack('ihBB', r * 500000, 0, 0, 0)
+                        for r in (2, 4, 11, 22, 12, 18, 24, 36))
+        events.append(event(flags.SIOCGIWRATE, rates))
+        events.append(event(flags.IWEVCUSTOM, struct.pack('HH', 18, 0) + "tsf=0000000000000000"))
+        events.append(event(flags.IWEVCUSTOM, struct.pack('HH', 26, 0) + "Last beacon: 100ms ago"))
+    return ''.join(events)
+
+def slicingParse(data):
+    """the parser as it was before parseScanEvents() """
+    flags = pythonwifi.flags
+    scanresult = None
+    aplist = []
+    while len(data) >= flags.IW_EV_LCP_LEN:
+        length, cmd = struct.unpack('HH', data[:4])
+        if length < flags.IW_EV_LCP_LEN:
+            break
+        if cmd == flags.SIOCGIWAP:
+            if scanresult is not None:
+                aplist.append(scanresult)
+            scanresult = Iwscanresult(data[flags.IW_EV_LCP_LEN:length], None)
+        else:
+            scanresult.addEvent(cmd, data[flags.IW_EV_LCP_LEN:length])
+        data = data[length:]
+    aplist.append(scanresult)
+    return aplist
+
+def record(ifname, path):
+    iwscan = Iwscan(ifname)
+    iwscan.scan()
+    fp = open(path, 'wb')
+    try:
+        fp.write(iwscan.stream)
+    finally:
+        fp.close()
+    print "recorded %d bytes, %d access points" % (len(iwscan.stream),
+                                                   len(iwscan.aplist))
+
+def bench(name, data, repeat=5):
+    number = max(1, 20000 / (len(data) / 100 + 1))
+    old = min(timeit.repeat(lambda: slicingParse(data), number=number,
+                            repeat=repeat)) / number
+    new = min(timeit.repeat(lambda: list(parseScanEvents(data)),
+                            number=number, repeat=repeat)) / number
+    count = len(list(parseScanEvents(data)))
+    print "%-20s %4d APs %7d bytes  slicing %8.3f ms  offsets %8.3f ms  x%.1f" % (
+        name, count, len(data), old * 1000, new * 1000, old / new)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--record"]:
+        record(args[1], args[2])
+    elif args:
+        for path in args:
+            bench(os.path.basename(path), open(path, 'rb').read())
+    else:
+        for count in (10, 50, 100, 200, 400):
+            bench("synthetic", synthesize(count))
@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+#
+# replay.py
+# Replays the recorded nl80211 conversations in this directory through
+# nl80211.Nl80211 (over ReplaySocket) and checks the parsed results
+# against those stored with each recording.
+#
+# Every <scenario>.json holds the chunks the request socket received, the
+# chunks received by the scan event socket, the interface indexes looked
+# up and the expected results (family id, multicast groups and the
+# InterfaceInfo/StationInfo/Nl80211Result attributes). All of them start
+# with the nl80211 family resolve.
+#
+# $ python fixtures/nl80211/replay.py
+# $ python fixtures/nl80211/replay.py --record wlan0     (needs root)
+# $ python fixtures/nl80211/replay.py --synthesize
+#
+# --synthesize writes conversations built message by message in the
+# kernel's wire format (as checked in, for machines without an nl80211
+# device), --record replaces them with a real device's.
+
+import os
+import sys
+import json
+import glob
+import struct
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "..", "wifilib"))
+
+import nl80211
+from nl80211 import Nl80211, Nl80211Scan, RecordingSocket, ReplaySocket, \
+    packAttr
+
+
+SCENARIOS = {
+    'interfaces': lambda nl, ifname: nl.getInterfaces(),
+    'stations': lambda nl, ifname: nl.getStations(ifname),
+    'scan': lambda nl, ifname: Nl80211Scan(ifname, nl).scan(),
+}
+
+# skipped are the Iwquality/Iwfreq views Nl80211Result keeps for
+# compatibility with Iwscanresult, they hold nothing of their own
+PLAIN = (type(None), bool, int, long, float, str, list)
+
+def describe(obj):
+    """returns the JSON-able attributes of a result object """
+    result = {}
+    for name in obj.__slots__:
+        value = getattr(obj, name)
+        if not isinstance(value, PLAIN):
+            continue
+        if name == 'ies':
+            value = value.encode('hex')
+        elif isinstance(value, str):
+            value = value.decode('latin1')
+        result[name] = value
+    return result
+
+def run(scenario, nl, ifname):
+    results = SCENARIOS[scenario](nl, ifname)
+    # round trip, so the results compare equal to loaded ones
+    return json.loads(json.dumps({
+        'family': nl.familyId,
+        'groups': nl.groups,
+        'results': [describe(result) for result in results],
+    }))
+
+def save(scenario, ifname, chunks, events, ifindexes, expected):
+    fp = open(os.path.join(HERE, scenario + '.json'), 'w')
+    try:
+        json.dump({
+            'ifname': ifname,
+            'ifindexes': ifindexes,
+            'chunks': [chunk.encode('hex') for chunk in chunks],
+            'events': [chunk.encode('hex') for chunk in events],
+            'expected': expected,
+        }, fp, indent=1, sort_keys=True)
+        fp.write('\n')
+    finally:
+        fp.close()
+
+def record(ifname):
+    for scenario in sorted(SCENARIOS):
+        sock = RecordingSocket()
+        nl = Nl80211(sock)
+        expected = run(scenario, nl, ifname)
+        sock.ifindex(ifname) # so every recording has it
+        save(scenario, ifname, sock.chunks, sock.events, sock.ifindexes,
+             expected)
+        nl.close()
+        print "recorded %s: %d chunks, %d events, %d results" % (scenario,
+            len(sock.chunks), len(sock.events), len(expected['results']))
+
+def replay(path):
+    fp = open(path)
+    try:
+        fixture = json.load(fp)
+    finally:
+        fp.close()
+    scenario = os.path.splitext(os.path.basename(path))[0]
+    sock = ReplaySocket([chunk.decode('hex') for chunk in fixture['chunks']],
+                        [chunk.decode('hex') for chunk in fixture['events']],
+                        fixture['ifindexes'])
+    actual = run(scenario, Nl80211(sock), str(fixture['ifname']))
+    if sock.chunks or sock.events:
+        return "%d chunks and %d events left over" % (len(sock.chunks),
+                                                       len(sock.events))
+    if actual != fixture['expected']:
+        return "results differ:\n  expected %r\n  got      %r" % (
+            fixture['expected'], actual)
+    return None
+
+
+# --synthesize: the messages a mac80211 driver's cfg80211 sends
+
+FAMILY = 0x1c
+GROUPS = [('config', 5), ('scan', 6), ('regulatory', 7), ('mlme', 8),
+          ('vendor', 9)]
+IFINDEX = 3
+
+CTRL_CMD_NEWFAMILY = 1
+NL80211_CMD_NEW_INTERFACE = 7
+NL80211_CMD_NEW_STATION = 19
+NL80211_ATTR_GENERATION = 46
+
+u8 = lambda value: struct.pack('B', value)
+s8 = lambda value: struct.pack('b', value)
+u16 = lambda value: struct.pack('H', value)
+u32 = lambda value: struct.pack('I', value)
+s32 = lambda value: struct.pack('i', value)
+u64 = lambda value: struct.pack('Q', value)
+mac = lambda text: ''.join(chr(int(byte, 16)) for byte in text.split(':'))
+
+def message(msgtype, flags, seq, payload):
+    length = nl80211.NLMSG_HDRLEN + len(payload)
+    return struct.pack('IHHII', length, msgtype, flags, seq, 4242) + payload + \
+        '\0' * ((length + 3 & ~3) - length)
+
+def genl(cmd, attrs, flags=0, seq=1, family=FAMILY, version=1):
+    payload = struct.pack('BBH', cmd, version, 0) + \
+        ''.join(packAttr(atype, value) for atype, value in attrs)
+    return message(family, flags, seq, payload)
+
+def ack(seq=1):
+    # the error code and the header of the request acknowledged
+    return message(nl80211.NLMSG_ERROR, 0, seq, s32(0) + '\0' * 16)
+
+def done(seq=1):
+    return message(nl80211.NLMSG_DONE, nl80211.NLM_F_MULTI, seq, s32(0))
+
+def familyReply():
+    groups = ''.join(packAttr(i + 1,
+        packAttr(nl80211.CTRL_ATTR_MCAST_GRP_ID, u32(gid)) +
+        packAttr(nl80211.CTRL_ATTR_MCAST_GRP_NAME, name + '\0'))
+        for i, (name, gid) in enumerate(GROUPS))
+    return [genl(CTRL_CMD_NEWFAMILY, [
+        (nl80211.CTRL_ATTR_FAMILY_NAME, 'nl80211\0'),
+        (nl80211.CTRL_ATTR_FAMILY_ID, u16(FAMILY)),
+        (nl80211.CTRL_ATTR_MCAST_GROUPS, groups),
+    ], family=nl80211.GENL_ID_CTRL, version=2), ack()]
+
+def ies(essid, channel, rsn):
+    data = '\x00' + chr(len(essid)) + essid
+    data += '\x01\x08\x82\x84\x8b\x96\x0c\x12\x18\x24'
+    data += '\x03\x01' + chr(channel)
+    data += '\x32\x04\x30\x48\x60\x6c'
+    if rsn:
+        data += '\x30\x14\x01\x00\x00\x0f\xac\x04\x01\x00\x00\x0f\xac\x04' \
+                '\x01\x00\x00\x0f\xac\x02\x00\x00'
+    return data
+
+def bss(bssid, mhz, channel, essid, mbm, capability, seen, associated=False):
+    attrs = packAttr(nl80211.NL80211_BSS_BSSID, mac(bssid))
+    attrs += packAttr(nl80211.NL80211_BSS_FREQUENCY, u32(mhz))
+    attrs += packAttr(nl80211.NL80211_BSS_TSF, u64(0x1234567890 + seen))
+    attrs += packAttr(nl80211.NL80211_BSS_BEACON_INTERVAL, u16(100))
+    attrs += packAttr(nl80211.NL80211_BSS_CAPABILITY, u16(capability))
+    attrs += packAttr(nl80211.NL80211_BSS_INFORMATION_ELEMENTS,
+                      ies(essid, channel, capability & 0x10))
+    attrs += packAttr(nl80211.NL80211_BSS_SIGNAL_MBM, s32(mbm))
+    attrs += packAttr(nl80211.NL80211_BSS_SEEN_MS_AGO, u32(seen))
+    if associated:
+        attrs += packAttr(nl80211.NL80211_BSS_STATUS, u32(1))
+    return genl(nl80211.NL80211_CMD_NEW_SCAN_RESULTS, [
+        (NL80211_ATTR_GENERATION, u32(17)),
+        (nl80211.NL80211_ATTR_IFINDEX, u32(IFINDEX)),
+        (nl80211.NL80211_ATTR_BSS, attrs),
+    ], flags=nl80211.NLM_F_MULTI)
+
+def station(address, signal, rxBytes, txBytes):
+    rate = packAttr(nl80211.NL80211_RATE_INFO_BITRATE, u16(1300)) + \
+        packAttr(nl80211.NL80211_RATE_INFO_BITRATE32, u32(1300))
+    info = ''.join([
+        packAttr(nl80211.NL80211_STA_INFO_INACTIVE_TIME, u32(40)),
+        packAttr(nl80211.NL80211_STA_INFO_RX_BYTES, u32(rxBytes)),
+        packAttr(nl80211.NL80211_STA_INFO_TX_BYTES, u32(txBytes)),
+        packAttr(nl80211.NL80211_STA_INFO_SIGNAL, s8(signal)),
+        packAttr(nl80211.NL80211_STA_INFO_TX_BITRATE, rate),
+        packAttr(nl80211.NL80211_STA_INFO_RX_PACKETS, u32(rxBytes // 500)),
+        packAttr(nl80211.NL80211_STA_INFO_TX_PACKETS, u32(txBytes // 500)),
+        packAttr(nl80211.NL80211_STA_INFO_TX_RETRIES, u32(12)),
+        packAttr(nl80211.NL80211_STA_INFO_TX_FAILED, u32(1)),
+        packAttr(nl80211.NL80211_STA_INFO_SIGNAL_AVG, s8(signal - 2)),
+        packAttr(nl80211.NL80211_STA_INFO_RX_BITRATE, rate),
+    ])
+    return genl(NL80211_CMD_NEW_STATION, [
+        (nl80211.NL80211_ATTR_IFINDEX, u32(IFINDEX)),
+        (nl80211.NL80211_ATTR_MAC, mac(address)),
+        (NL80211_ATTR_GENERATION, u32(17)),
+        (nl80211.NL80211_ATTR_STA_INFO, info),
+    ], flags=nl80211.NLM_F_MULTI)
+
+def interface(ifindex, ifname, iftype, address, mhz=None):
+    attrs = [
+        (nl80211.NL80211_ATTR_IFINDEX, u32(ifindex)),
+        (nl80211.NL80211_ATTR_IFNAME, ifname + '\0'),
+        (nl80211.NL80211_ATTR_WIPHY, u32(0)),
+        (nl80211.NL80211_ATTR_IFTYPE, u32(iftype)),
+        (nl80211.NL80211_ATTR_MAC, mac(address)),
+        (NL80211_ATTR_GENERATION, u32(5)),
+    ]
+    if mhz:
+        attrs.append((nl80211.NL80211_ATTR_WIPHY_FREQ, u32(mhz)))
+    return genl(NL80211_CMD_NEW_INTERFACE, attrs, flags=nl80211.NLM_F_MULTI)
+
+def synthesize():
+    ifname = 'wlan0'
+    ifindexes = {ifname: IFINDEX}
+    conversations = {
+        'interfaces': (familyReply() + [
+            interface(IFINDEX, 'wlan0', 2, '00:1c:bf:aa:bb:01', 2437) +
+            interface(4, 'mon0', 6, '00:1c:bf:aa:bb:01'),
+            done()], []),
+        'stations': (familyReply() + [
+            station('00:11:22:33:44:55', -48, 981234, 123456) + done()], []),
+        'scan': (familyReply() + [ack()] + [
+            # a dump spread over two recv()s
+            bss('00:11:22:33:44:55', 2437, 6, 'home', -4800, 0x0411, 20, True) +
+            bss('00:11:22:33:44:66', 2412, 1, 'cafe', -7100, 0x0401, 340),
+            bss('02:aa:bb:cc:dd:ee', 5180, 36, 'office-5g', -6300, 0x1111, 80) +
+            done()], [
+            # TRIGGER_SCAN first, then NEW_SCAN_RESULTS, both multicast
+            genl(nl80211.NL80211_CMD_TRIGGER_SCAN,
+                 [(nl80211.NL80211_ATTR_IFINDEX, u32(IFINDEX))], seq=0),
+            genl(nl80211.NL80211_CMD_NEW_SCAN_RESULTS,
+                 [(nl80211.NL80211_ATTR_WIPHY, u32(0)),
+                  (nl80211.NL80211_ATTR_IFINDEX, u32(IFINDEX))], seq=0)]),
+    }
+    for scenario, (chunks, events) in sorted(conversations.items()):
+        expected = run(scenario, Nl80211(ReplaySocket(chunks, events,
+                                                      ifindexes)), ifname)
+        save(scenario, ifname, chunks, events, ifindexes, expected)
+        print "synthesized %s: %d results" % (scenario,
+                                              len(expected['results']))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args[:1] == ["--record"]:
+        record(args[1])
+    elif args[:1] == ["--synthesize"]:
+        synthesize()
+    else:
+        failed = 0
+        for path in sorted(glob.glob(os.path.join(HERE, '*.json'))):
+            error = replay(path)
+            print "%-12s %s" % (os.path.basename(path), error or "ok")
+            failed += error is not None
+        sys.exit(1 if failed else 0)
@@ -2,61 +2,70 @@
 #GJ cnelson!
 #
 #Also added the ability to detect the driver which is being used for the interface using the getDriverName(<interface>) function.
-import subprocess
 
-def getDriverName(interface):
-	data = ""
-	try:
-		data = subprocess.check_output(['ls', "/sys/class/net/" + interface + "/device/driver/module/drivers"]).split('\n')
-	except:
-		return []#not all interfaces have drivers
-	ret = []
-	for entry in data:
-		spl = entry.split(":")
-		if len(spl) < 2:
-			continue
-		ret.append((spl[1],spl[0]))
-	return ret
+from wifilib.discovery import getDriverName
 
+import time
 from datetime import datetime
  
 class ProcNetDev(object):
     """Parses /proc/net/dev into a usable python datastructure.
     
     By default each time you access the structure, /proc/net/dev is re-read 
-    and parsed so data is always current.
+    and parsed so data is always current. Reads closer together than
+    min_interval seconds reuse the last one, so pnd['eth0']['receive'] and
+    pnd['eth0']['transmit'] come from the same read.
     
     If you want to disable this feature, pass auto_update=False to the constructor.
     
+    Pass interfaces=['wlan0', ...] to only parse those interfaces.
+    
     >>> pnd = ProcNetDev()
     >>> pnd['eth0']['receive']['bytes']
     976329938704
     
+    The flat counters of the last read are in pnd.counters (name -> tuple
+    of ints, in the order of pnd.columns) for callers sampling at a high rate.
+    
     """
     
-    def __init__(self, auto_update=True):
+    def __init__(self, auto_update=True, min_interval=0.1, interfaces=None):
         """Opens a handle to /proc/net/dev and sets up the initial object."""
         
         #we don't wrap this in a try as we want to raise an IOError if it's not there
-        self.proc = open('/proc/net/dev', 'rb')
+        #unbuffered, update() reads the whole file into self.buffer itself
+        self.proc = open('/proc/net/dev', 'rb', 0)
+        self.buffer = bytearray(4096)
+    
+        #header layout, parsed once in _parse_header()
+        self.header = None
+        self.sections = None
+        self.columns = None
     
         #we store our data here, this is populated in update()
-        self.data = None
+        self.counters = {}
+        self._data = {}
         self.updated = None
+        self._last = None
         self.auto_update = auto_update
+        self.min_interval = min_interval
+        self.interfaces = set(interfaces) if interfaces is not None else None
     
         self.update()
         
     def __getitem__(self, key):
         """Allows accessing the interfaces as self['eth0']"""
         if self.auto_update:
-            self.update()
+            self._refresh()
         
-        return self.data[key]
+        data = self._data.get(key)
+        if data is None:
+            data = self._data[key] = self._nest(self.counters[key])
+        return data
         
     def __len__(self):
         """Returns the number of interfaces available."""
-        return len(self.data.keys())
+        return len(self.counters)
  
     def __contains__(self, key):
         """Implements contains by testing for a KeyError."""
@@ -81,14 +90,34 @@ class ProcNetDev(object):
         except AttributeError:
             pass
     
-    def update(self):
-        """Updates the instances internal datastructures."""
-        
-        #reset our location
-        self.proc.seek(0)
-        
-        #read our first line, and note the character positions, it's important for later
-        headerline = self.proc.readline()
+    @property
+    def data(self):
+        """All interfaces as nested dicts, e.g. data['eth0']['receive']['bytes']"""
+        for name in self.counters:
+            if name not in self._data:
+                self._data[name] = self._nest(self.counters[name])
+        return self._data
+    
+    def index(self, section, label):
+        """Returns the position of a counter in the tuples of self.counters."""
+        return self.columns.index((section, label))
+    
+    def _nest(self, values):
+        """Turns a counters tuple into {section: {label: value}}"""
+        nested = {}
+        for name, labels, first in self.sections:
+            nested[name] = dict(zip(labels, values[first:first + len(labels)]))
+        return nested
+    
+    def _refresh(self):
+        """update()s unless the last read is less than min_interval old."""
+        now = time.time()
+        #a clock stepping back counts as stale, too
+        if self._last is None or not 0 <= now - self._last < self.min_interval:
+            self.update()
+    
+    def _parse_header(self, headerline, labelline):
+        """Works out the sections and their labels from the two header lines."""
         if not headerline.count('|'):
             raise ValueError("Header was not in the expected format")
         
@@ -109,42 +138,53 @@ class ProcNetDev(object):
         sections.pop(0)
     
         #now get the labels
-        labelline = self.proc.readline().strip("\n")
-        labels = []
-        for section in sections:
-            labels.append(labelline[section[0]:section[1]].split())
+        #they aren't always the same!  transmit doesn't have multicast for example
+        self.sections = []
+        self.columns = []
+        for start, end, name in sections:
+            labels = labelline[start:end].split()
+            self.sections.append((name, labels, len(self.columns)))
+            self.columns.extend((name, label) for label in labels)
+        self.header = (headerline, labelline)
+    
+    def update(self):
+        """Updates the instances internal datastructures."""
+        
+        #read the whole file, until readinto() says there is nothing left:
+        #seq files may return less than asked for (a page per read on older
+        #kernels). The buffer only grows when a read fills it.
+        self.proc.seek(0)
+        length = 0
+        while True:
+            if length == len(self.buffer):
+                buff = bytearray(2 * len(self.buffer))
+                buff[:length] = self.buffer
+                self.buffer = buff
+            count = self.proc.readinto(memoryview(self.buffer)[length:])
+            if not count:
+                break
+            length += count
         
-        interfaces = {}
+        lines = str(self.buffer[:length]).split('\n')
+        if (lines[0], lines[1]) != self.header:
+            self._parse_header(lines[0], lines[1])
+        
+        wanted = self.interfaces
+        counters = {}
         #now get the good stuff
-        for info in self.proc.readlines():
-            info = info.strip("\n")
+        for info in lines[2:]:
+            if not info:
+                continue
             
             #split the data into interface name and counters
             (name, data) = info.split(":", 1)
-            
-            #clean them up
             name = name.strip()
-            data = data.split()
-            
-            interfaces[name] = {}
-            absolute_position = 0
-            
-            #loop through each section, receive, transmit, etc
-            for section_number in range(len(sections)):
-                tmp = {}
-                
-                #now loop through each label in that section
-                #they aren't always the same!  transmit doesn't have multicast for example
-                for label_number in range(len(labels[section_number])):
-                    #for each label, we need to associate it with it's data
-                    #we use absolute position since the label_number resets for each section
-                    tmp[labels[section_number][label_number]] = int(data[absolute_position])
-                    absolute_position += 1
-                
-                #push our data into the final location
-                #name=eth0, section[i][2] = receive (for example)
-                interfaces[name][sections[section_number][2]] = tmp
+            if wanted is not None and name not in wanted:
+                continue
+            counters[name] = tuple(map(int, data.split()))
         
         #update the instance level variables.
-        self.data = interfaces
+        self.counters = counters
+        self._data = {}
         self.updated = datetime.utcnow()
+        self._last = time.time()
@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+#
+# ratemonitor.py
+# Per second rx/tx rates of network interfaces, from /proc/net/dev.
+#
+# One background thread reads /proc/net/dev once per tick (ProcNetDev) for
+# all interfaces and turns the counters into rates, using a monotonic clock
+# so NTP steps don't produce bogus rates. /proc/net/dev counters are 64
+# bits wide on 64-bit kernels, where a counter going backwards was reset
+# (driver reload, interface re-created). On 32-bit kernels it is taken as
+# a wrap if that implies a plausible rate, see counterDelta(). Every
+# interface keeps the last `history` samples in fixed-size rings, and
+# interfaces gone for longer than `grace` seconds are dropped.
+#
+# >>> monitor = RateMonitor(['wlan0'], interval=1.0, history=300)
+# >>> monitor.start()
+# >>> monitor.last('wlan0')['rxBytes']
+# 18231.7
+# >>> monitor.history('wlan0').series('txPackets', 60)
+# array('d', [12.0, 15.0, ...])
+
+import time
+import struct
+import threading
+from array import array
+
+from interfaces import ProcNetDev
+from wifilib.clock import monotonic
+
+
+# /proc/net/dev prints the kernel's unsigned longs
+COUNTER_BITS = struct.calcsize('L') * 8
+
+# highest believable rates per second (10 Gbit/s, and minimum size frames
+# at that speed), which a 32-bit wrap must not exceed
+MAX_BYTES = 1.25e9
+MAX_PACKETS = 15e6
+
+# name, /proc/net/dev section, /proc/net/dev label, highest rate
+FIELDS = (
+    ('rxBytes', 'receive', 'bytes', MAX_BYTES),
+    ('rxPackets', 'receive', 'packets', MAX_PACKETS),
+    ('rxErrors', 'receive', 'errs', MAX_PACKETS),
+    ('rxDrops', 'receive', 'drop', MAX_PACKETS),
+    ('txBytes', 'transmit', 'bytes', MAX_BYTES),
+    ('txPackets', 'transmit', 'packets', MAX_PACKETS),
+    ('txErrors', 'transmit', 'errs', MAX_PACKETS),
+    ('txDrops', 'transmit', 'drop', MAX_PACKETS),
+)
+
+WRAP32 = 2**32
+
+
+def counterDelta(old, new, elapsed, bits=COUNTER_BITS, maxRate=None):
+    """Increase of a counter from old to new over elapsed seconds.
+
+       A counter going back wrapped if it is 32 bits wide, old fits in 32
+       bits and the increase that implies is at most maxRate per second.
+       Otherwise it was reset and has counted new since."""
+    if new >= old:
+        return new - old
+    if bits == 32 and old < WRAP32:
+        wrapped = new + WRAP32 - old
+        if maxRate is None or wrapped <= maxRate * elapsed:
+            return wrapped
+    return new
+
+
+class RateHistory(object):
+    """The last `capacity` rates of one interface, a ring per field."""
+
+    def __init__(self, ifname, capacity):
+        self.ifname = ifname
+        self.capacity = capacity
+        self.count = 0 # samples appended in total
+        self.resets = 0 # counters seen going back to (near) zero
+        self.wraps = 0 # 32-bit counters seen wrapping
+        self.wide = set() # counters seen above 32 bits, they never wrap
+        self.lastSeen = None
+        self.times = array('d', [0.0]) * capacity
+        self.rates = dict((name, array('d', [0.0]) * capacity)
+                          for name, section, label, limit in FIELDS)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, now, rates):
+        pos = self.count % self.capacity
+        for name, value in rates.iteritems():
+            self.rates[name][pos] = value
+        self.times[pos] = now
+        self.count += 1 # last, so readers never see a partial sample
+
+    def last(self):
+        """Returns the latest rates as a dict, None before the first one."""
+        if not self.count:
+            return None
+        pos = (self.count - 1) % self.capacity
+        return dict((name, ring[pos]) for name, ring in self.rates.iteritems())
+
+    def _window(self, ring, samples):
+        n = len(self)
+        if samples is None or samples > n:
+            samples = n
+        end = self.count % self.capacity or self.capacity
+        start = end - samples
+        if start >= 0:
+            return ring[start:end]
+        return ring[start + self.capacity:] + ring[:end]
+
+    def series(self, name, samples=None):
+        """The last samples rates of one field, oldest first."""
+        return self._window(self.rates[name], samples)
+
+    def timestamps(self, samples=None):
+        return self._window(self.times, samples)
+
+
+class RateMonitor(object):
+    """Samples /proc/net/dev every `interval` seconds and keeps `history`
+       seconds of rates per interface (all interfaces if ifnames is None).
+       The history of an interface missing for `grace` seconds is dropped.
+
+       The sampler thread adds and drops histories, read them through
+       ifnames(), history() and last().
+    """
+
+    def __init__(self, ifnames=None, interval=1.0, history=300.0,
+                 grace=60.0, counterBits=COUNTER_BITS, clock=monotonic):
+        self.interval = interval
+        self.grace = grace
+        self.counterBits = counterBits
+        self.clock = clock
+        self.capacity = max(1, int(history / interval))
+        self.procnetdev = ProcNetDev(auto_update=False, interfaces=ifnames)
+        self.columns = [(name, self.procnetdev.index(section, label), limit)
+                        for name, section, label, limit in FIELDS]
+        self.histories = {}
+        self._lock = threading.Lock() # guards changes to histories
+        self._previous = {} # ifname -> (time, counters)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def sample(self, now=None):
+        """Reads the counters once, appends the rates since the previous
+           sample of every interface."""
+        pnd = self.procnetdev
+        pnd.update()
+        if now is None:
+            now = self.clock()
+        previous = self._previous
+        current = {}
+        for ifname, counters in pnd.counters.iteritems():
+            current[ifname] = (now, counters)
+            history = self.histories.get(ifname)
+            if history is None:
+                history = RateHistory(ifname, self.capacity)
+                self._lock.acquire()
+                try:
+                    self.histories[ifname] = history
+                finally:
+                    self._lock.release()
+            history.lastSeen = now
+            if ifname not in previous:
+                continue # new interface, nothing to compare against yet
+            then, old = previous[ifname]
+            elapsed = now - then
+            if elapsed <= 0:
+                continue
+            rates = {}
+            for name, index, limit in self.columns:
+                new = counters[index]
+                if new >= WRAP32:
+                    history.wide.add(name)
+                if new >= old[index]:
+                    rates[name] = (new - old[index]) / elapsed
+                    continue
+                bits = 64 if name in history.wide else self.counterBits
+                delta = counterDelta(old[index], new, elapsed, bits, limit)
+                if delta == new:
+                    history.resets += 1
+                else:
+                    history.wraps += 1
+                rates[name] = delta / elapsed
+            history.append(now, rates)
+        # interfaces which went away start over if they come back
+        self._previous = current
+        if len(current) < len(self.histories):
+            self._lock.acquire()
+            try:
+                for ifname, history in self.histories.items():
+                    if ifname not in current and \
+                            now - history.lastSeen > self.grace:
+                        del self.histories[ifname]
+            finally:
+                self._lock.release()
+
+    def ifnames(self):
+        """Names of the interfaces with a history, sorted."""
+        self._lock.acquire()
+        try:
+            return sorted(self.histories)
+        finally:
+            self._lock.release()
+
+    def history(self, ifname):
+        """The RateHistory of ifname, None if there is none."""
+        return self.histories.get(ifname)
+
+    def last(self, ifname):
+        history = self.history(ifname)
+        return history.last() if history is not None else None
+
+    def run(self):
+        """Samples until stop() is called."""
+        deadline = self.clock()
+        while not self._stop.isSet():
+            self.sample()
+            deadline += self.interval
+            delay = deadline - self.clock()
+            if delay < 0:
+                # fell behind, don't try to catch up with a burst
+                deadline = self.clock()
+                delay = 0
+            self._stop.wait(delay)
+
+    def start(self):
+        """Runs the monitor on a daemon thread and returns immediately."""
+        if self._thread is not None and self._thread.isAlive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="RateMonitor")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    import sys
+    monitor = RateMonitor(sys.argv[1:] or None)
+    monitor.start()
+    try:
+        while True:
+            time.sleep(monitor.interval)
+            for ifname in monitor.ifnames():
+                rates = monitor.last(ifname)
+                if rates is None:
+                    continue
+                print "%s: rx %.0f B/s %.0f p/s, tx %.0f B/s %.0f p/s" % (ifname,
+                    rates['rxBytes'], rates['rxPackets'],
+                    rates['txBytes'], rates['txPackets'])
+    except KeyboardInterrupt:
+        monitor.stop()
@@ -102,13 +102,54 @@ class WifiFrame(object):
 
 
 
-if __name__ == "__main__":
-	rawSocket = createPacketSink()
-	while True:
-		pkt = rawSocket.recvfrom(2548)[0] #each recv from call gets a most one packet
-		version, length, fields, frame = parseRadioTapHeader(pkt)
-		obj = WifiFrame(frame, True)
-		#if obj.isBeacon():
-		if not obj.isBeacon():
-			obj.display()
+def main(interface="mon0", output=None, fields=None):
+	"""Captures from interface and prints every frame but beacons.
+
+	output - None for display(), or a format name from wifilib's
+	         output.SINKS (jsonl, csv, text) for buffered structured output
+	         of all frames, decoded with wifilib's wifistruct. Frames the
+	         driver flagged as failing the FCS check are dropped, as
+	         wifistruct.main() does.
+	"""
+	rawSocket = createPacketSink(interface)
+	sink = None
+	if output:
+		from wifilib import output as outputmod
+		from wifilib import wifistruct
+		sink = outputmod.getSink(output, fields=fields)
+		# wake up now and then to flush what a quiet channel left buffered
+		rawSocket.settimeout(sink.maxDelay)
+	try:
+		while True:
+			try:
+				pkt = rawSocket.recvfrom(2548)[0] #each recv from call gets a most one packet
+			except socket.timeout:
+				sink.flushDue()
+				continue
+			if sink:
+				radioFrame = wifistruct.RadiotapFrame(pkt)
+				if radioFrame.badFCS():
+					continue
+				obj = wifistruct.WifiFrame(radioFrame.payload, hasFCS=radioFrame.hasFCS())
+				if sink.deepDecode:
+					obj.deepDecode()
+				sink.write(radioFrame, obj, time.time())
+				continue
+			version, length, fields, frame = parseRadioTapHeader(pkt)
+			obj = WifiFrame(frame, True)
+			#if obj.isBeacon():
+			if not obj.isBeacon():
+				obj.display()
+	finally:
+		if sink:
+			sink.close()
 
+
+if __name__ == "__main__":
+	import argparse
+	parser = argparse.ArgumentParser(description="Print 802.11 frames from a monitor interface")
+	parser.add_argument("interface", nargs="?", default="mon0")
+	parser.add_argument("--format", choices=["jsonl", "csv", "text"], help="structured output format")
+	parser.add_argument("--fields", help="comma separated list of fields to output")
+	args = parser.parse_args()
+	main(args.interface, args.format, args.fields.split(",") if args.fields else None)
@@ -0,0 +1,496 @@
+#!/usr/bin/env python
+#
+# captureindex.py
+# Sidecar indexes over pcap captures, so queries by MAC, BSSID or time can
+# seek straight to the matching records instead of decoding every frame.
+#
+# Each capture foo.pcap gets a foo.pcap.idx next to it, holding:
+#	- a sparse time index: (ts, offset) of every SPARSE_STRIDE'th record
+#	- posting lists: address -> offsets of the records it appears in, one
+#	  map for the addresses the frame carries and one for the BSSID.
+#	  Offsets are delta encoded as varints.
+# The file starts with a header naming the capture it was built from, and
+# every update() appends a chunk with what it added: new sparse entries and
+# the varints continuing each posting list. Chunks are packed with struct,
+# little endian, and zlib compressed. An index is only used while the
+# capture still starts with the same headers and is at least as long as
+# what was indexed, otherwise (capture rotated, truncated) it is rebuilt.
+#
+# Indexing reads the capture once, front to back, and only reads the
+# radiotap and 802.11 headers of each record, seeking over the bodies. An
+# index remembers how far into the file it got, so a capture which is still
+# being written is picked up where the last update() stopped, at a cost of
+# the new records only. Loaded indexes are kept in memory whole, which the
+# varint encoding keeps to a few bytes per record and address.
+
+import os
+import math
+import bisect
+import glob
+import zlib
+import struct
+
+import pcap
+from macaddr import macToInt
+
+INDEX_SUFFIX = ".idx"
+INDEX_VERSION = 3
+SPARSE_STRIDE = 1024
+
+# every record prefix read covers this much of the 802.11 header (addr4)
+FRAME_HEADER_SIZE = 30
+PREFIX_SIZE = 128 # radiotap header and 802.11 header, usually
+
+INDEX_MAGIC = "WIDX"
+# magic, version, len(signature), followed by the signature
+_HEADER = struct.Struct('<4sHH')
+# then chunks, each len(compressed) and the zlib compressed chunk, holding
+# end, count, lastTs (NaN for None), new sparse entries, macs, bssids
+_CHUNK = struct.Struct('<I')
+_STATE = struct.Struct('<QQd')
+_COUNT = struct.Struct('<I')
+_POSTING = struct.Struct('<QQI') # address, last offset, len(encoded)
+
+# control frame subtypes: (addresses carried, which of them is the BSSID)
+_CONTROL = {
+	4: (2, None), # Beamforming Report Poll: RA, TA
+	5: (2, None), # VHT NDP Announcement: RA, TA
+	8: (2, None), # BlockAckReq: RA, TA
+	9: (2, None), # BlockAck: RA, TA
+	10: (2, 0), # PS-Poll: BSSID, TA
+	11: (2, None), # RTS: RA, TA
+	12: (1, None), # CTS: RA
+	13: (1, None), # ACK: RA
+	14: (2, 1), # CF-End: RA, BSSID
+	15: (2, 1), # CF-End + CF-Ack: RA, BSSID
+}
+
+
+def frameAddresses(frame):
+	"""Returns (addresses, bssid) of a raw 802.11 frame, as 48 bit ints.
+	   Only the addresses the frame type carries are looked at, e.g. an ACK
+	   has just the receiver. bssid is None when the frame doesn't carry one."""
+	if len(frame) < 10:
+		return (), None
+	fc0 = ord(frame[0])
+	ftype = (fc0 >> 2) & 3
+	if ftype == 1:
+		count, bssid = _CONTROL.get(fc0 >> 4, (1, None))
+		addrs = [macToInt(frame[4 + 6 * i:10 + 6 * i]) for i in range(count)]
+		if None in addrs:
+			return (), None # truncated
+		return set(addrs), addrs[bssid] if bssid is not None else None
+	if ftype == 3 or len(frame) < 24:
+		return (), None # reserved type, or truncated
+	fc1 = ord(frame[1])
+	toDS = fc1 & 1
+	fromDS = fc1 & 2
+	addrs = [macToInt(frame[4:10]), macToInt(frame[10:16]),
+		macToInt(frame[16:22])]
+	if ftype == 0:
+		return set(addrs), addrs[2]
+	bssid = None
+	if toDS and fromDS:
+		addr4 = macToInt(frame[24:30])
+		if addr4 is not None:
+			addrs.append(addr4)
+	elif fromDS:
+		bssid = addrs[1]
+	elif toDS:
+		bssid = addrs[0]
+	else:
+		bssid = addrs[2]
+	return set(addrs), bssid
+
+def _encode(offsets, last):
+	"""Delta + varint encodes ascending offsets following last."""
+	out = bytearray()
+	for value in offsets:
+		delta = value - last
+		last = value
+		while delta >= 0x80:
+			out.append((delta & 0x7f) | 0x80)
+			delta >>= 7
+		out.append(delta)
+	return str(out)
+
+def _decode(data):
+	"""Inverse of _encode(), yields absolute offsets."""
+	value = shift = last = 0
+	for byte in bytearray(data):
+		value |= (byte & 0x7f) << shift
+		if byte & 0x80:
+			shift += 7
+			continue
+		last += value
+		yield last
+		value = shift = 0
+
+
+class _Postings(object):
+	"""address -> offsets. Encoded lists plus offsets added since loading."""
+
+	def __init__(self, encoded=None, last=None):
+		self.encoded = encoded or {}
+		self.last = last or {}
+		self.pending = {}
+
+	def add(self, key, offset):
+		try:
+			self.pending[key].append(offset)
+		except KeyError:
+			self.pending[key] = [offset]
+
+	def compact(self):
+		"""Folds the pending offsets into the encoded lists. Returns the
+		   bytes added to each list."""
+		added = {}
+		for key, offsets in self.pending.iteritems():
+			data = _encode(offsets, self.last.get(key, 0))
+			self.encoded[key] = self.encoded.get(key, '') + data
+			self.last[key] = offsets[-1]
+			added[key] = data
+		self.pending = {}
+		return added
+
+	def get(self, key):
+		result = list(_decode(self.encoded.get(key, '')))
+		result.extend(self.pending.get(key, ()))
+		return result
+
+	def pack(self, full=False):
+		"""Compacts and returns the offsets added since the last pack()
+		   (all of them if full) as a string, see merge()."""
+		added = self.compact()
+		items = self.encoded if full else added
+		parts = [_COUNT.pack(len(items))]
+		for key, data in items.iteritems():
+			parts.append(_POSTING.pack(key, self.last[key], len(data)))
+			parts.append(data)
+		return "".join(parts)
+
+	@staticmethod
+	def unpack(data, offset):
+		"""Returns ([(key, last, encoded)], offset after them) of what
+		   pack() wrote."""
+		count, = _COUNT.unpack_from(data, offset)
+		offset += _COUNT.size
+		items = []
+		for i in xrange(count):
+			key, last, length = _POSTING.unpack_from(data, offset)
+			offset += _POSTING.size
+			items.append((key, last, data[offset:offset + length]))
+			offset += length
+		if offset > len(data):
+			raise ValueError("Truncated postings")
+		return items, offset
+
+	def merge(self, items):
+		"""Appends what unpack() returned to the encoded lists."""
+		for key, last, data in items:
+			self.encoded[key] = self.encoded.get(key, '') + data
+			self.last[key] = last
+
+
+class CaptureIndex(object):
+	"""Index of a single capture file.
+
+	>>> idx = CaptureIndex('capture.pcap')
+	>>> idx.update()
+	>>> for ts, offset, pkt in idx.frames(mac=0x001122334455):
+	...     obj = WifiFrame(RadiotapFrame(pkt).payload, True)
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.indexPath = path + INDEX_SUFFIX
+		self.reset()
+		self._load()
+
+	def reset(self):
+		"""Forgets everything indexed, the next update() starts over."""
+		self.end = pcap.GLOBAL_HEADER_SIZE # offset indexing resumes from
+		self.count = 0
+		self.lastTs = None
+		self.times = []
+		self.offsets = []
+		self.macs = _Postings()
+		self.bssids = _Postings()
+		self.signature = None
+		self._indexSize = None # length of the index file, None to rewrite it
+		self._indexSignature = None # signature in its header
+		self._savedEntries = 0 # sparse entries in the index file
+
+	def _signature(self):
+		"""The global header and first record header of the capture, which
+		   tell a rotated capture from the one that was indexed."""
+		fp = open(self.path, 'rb')
+		try:
+			return fp.read(pcap.GLOBAL_HEADER_SIZE + pcap.RECORD_HEADER_SIZE)
+		finally:
+			fp.close()
+
+	def stale(self):
+		"""True if the capture was truncated or replaced since indexing."""
+		try:
+			size = os.path.getsize(self.path)
+			signature = self._signature()
+		except (IOError, OSError):
+			return True
+		if size < self.end:
+			return True
+		return self.signature is not None and self.count > 0 and \
+			signature[:len(self.signature)] != self.signature
+
+	def _load(self):
+		try:
+			fp = open(self.indexPath, 'rb')
+		except IOError:
+			return
+		try:
+			data = fp.read()
+		finally:
+			fp.close()
+		try:
+			magic, version, length = _HEADER.unpack_from(data, 0)
+		except struct.error:
+			return # damaged, rebuild
+		if magic != INDEX_MAGIC or version != INDEX_VERSION:
+			return # stale format, rebuild
+		offset = _HEADER.size + length
+		signature = data[_HEADER.size:offset]
+		chunks = []
+		while offset + _CHUNK.size <= len(data):
+			size, = _CHUNK.unpack_from(data, offset)
+			start = offset + _CHUNK.size
+			if start + size > len(data):
+				break # torn by a crash while appending, cut off below
+			try:
+				chunk = zlib.decompress(data[start:start + size])
+				chunks.append(self._unpackChunk(chunk))
+			except (zlib.error, struct.error, ValueError):
+				break
+			offset = start + size
+		if not chunks:
+			return # nothing indexed yet
+		for end, count, lastTs, times, offsets, macs, bssids in chunks:
+			self.end = end
+			self.count = count
+			self.lastTs = None if math.isnan(lastTs) else lastTs
+			self.times.extend(times)
+			self.offsets.extend(offsets)
+			self.macs.merge(macs)
+			self.bssids.merge(bssids)
+		self.signature = signature or None
+		self._indexSize = offset
+		self._indexSignature = self.signature
+		self._savedEntries = len(self.times)
+		if self.stale():
+			self.reset()
+
+	def _unpackChunk(self, data):
+		end, count, lastTs = _STATE.unpack_from(data, 0)
+		offset = _STATE.size
+		entries, = _COUNT.unpack_from(data, offset)
+		offset += _COUNT.size
+		fmt = '<%dd%dQ' % (entries, entries)
+		values = struct.unpack_from(fmt, data, offset)
+		offset += struct.calcsize(fmt)
+		macs, offset = _Postings.unpack(data, offset)
+		bssids, offset = _Postings.unpack(data, offset)
+		return (end, count, lastTs, values[:entries], values[entries:],
+			macs, bssids)
+
+	def _packChunk(self, full):
+		"""What was indexed since the last save (everything if full)."""
+		lastTs = self.lastTs if self.lastTs is not None else float('nan')
+		first = 0 if full else self._savedEntries
+		times = self.times[first:]
+		offsets = self.offsets[first:]
+		data = zlib.compress("".join([
+			_STATE.pack(self.end, self.count, lastTs),
+			_COUNT.pack(len(times)),
+			struct.pack('<%dd%dQ' % (len(times), len(times)),
+				*(times + offsets)),
+			self.macs.pack(full),
+			self.bssids.pack(full),
+		]))
+		return _CHUNK.pack(len(data)) + data
+
+	def save(self):
+		"""Appends what was indexed since the last save to the index file.
+		   A new or rebuilt index is written whole, atomically."""
+		if self._indexSize is not None and \
+				self._indexSignature == self.signature:
+			try:
+				fp = open(self.indexPath, 'r+b')
+			except IOError:
+				pass
+			else:
+				try:
+					chunk = self._packChunk(False)
+					fp.seek(self._indexSize)
+					fp.write(chunk)
+					fp.truncate() # a torn chunk of an earlier crash
+				finally:
+					fp.close()
+				self._indexSize += len(chunk)
+				self._savedEntries = len(self.times)
+				return
+		signature = self.signature or ''
+		data = "".join([
+			_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, len(signature)),
+			signature,
+			self._packChunk(True),
+		])
+		tmp = self.indexPath + ".tmp"
+		fp = open(tmp, 'wb')
+		try:
+			fp.write(data)
+		finally:
+			fp.close()
+		os.rename(tmp, self.indexPath)
+		self._indexSize = len(data)
+		self._indexSignature = self.signature
+		self._savedEntries = len(self.times)
+
+	def update(self, save=True):
+		"""Indexes records added to the capture since the last update.
+		   Returns the number of records indexed. A capture that was
+		   truncated or replaced is indexed from the start again."""
+		if self.count and self.stale():
+			self.reset()
+		reader = pcap.PcapReader(self.path)
+		try:
+			radiotap = reader.linktype == pcap.LINKTYPE_IEEE802_11_RADIOTAP
+			added = 0
+			records = reader.recordPrefixes(self.end, size=PREFIX_SIZE)
+			for ts, offset, caplen, data in records:
+				if self.count % SPARSE_STRIDE == 0:
+					self.times.append(ts)
+					self.offsets.append(offset)
+				self.end = offset + pcap.RECORD_HEADER_SIZE + caplen
+				if self.lastTs is None or ts > self.lastTs:
+					self.lastTs = ts
+				if radiotap and len(data) >= 4:
+					skip = struct.unpack('<H', data[2:4])[0]
+					want = min(caplen, skip + FRAME_HEADER_SIZE)
+					if len(data) < want:
+						# a long radiotap header, read up to the addresses
+						reader.fp.seek(offset + pcap.RECORD_HEADER_SIZE)
+						data = reader.fp.read(want)
+					data = data[skip:]
+				addrs, bssid = frameAddresses(data)
+				for addr in addrs:
+					self.macs.add(addr, offset)
+				if bssid is not None:
+					self.bssids.add(bssid, offset)
+				self.count += 1
+				added += 1
+		finally:
+			reader.close()
+		if added and self.signature is None:
+			self.signature = self._signature()
+		if added and save:
+			self.save()
+		return added
+
+	def _offsetRange(self, start, end):
+		"""Returns (lo, hi) offsets bounding records in [start, end).
+
+		   Relies on records being roughly in time order, which holds for
+		   captures written by a single capture process."""
+		lo, hi = pcap.GLOBAL_HEADER_SIZE, None
+		if start is not None:
+			i = bisect.bisect_right(self.times, start) - 1
+			if i >= 0:
+				lo = self.offsets[i]
+		if end is not None:
+			i = bisect.bisect_right(self.times, end)
+			if i < len(self.offsets):
+				hi = self.offsets[i]
+		return lo, hi
+
+	def lookup(self, mac=None, bssid=None, start=None, end=None):
+		"""Returns offsets of candidate records, in file order.
+
+		   Time bounds are applied at the granularity of the sparse index,
+		   frames() checks them exactly."""
+		lo, hi = self._offsetRange(start, end)
+		result = None
+		if mac is not None:
+			result = self.macs.get(mac)
+		if bssid is not None:
+			found = self.bssids.get(bssid)
+			if result is None:
+				result = found
+			else:
+				found = set(found)
+				result = [o for o in result if o in found]
+		if result is None:
+			return None # no address filter, every record in range matches
+		return [o for o in result if o >= lo and (hi is None or o < hi)]
+
+	def frames(self, mac=None, bssid=None, start=None, end=None):
+		"""Yields (ts, offset, data) of the records matching the query."""
+		reader = pcap.PcapReader(self.path)
+		try:
+			offsets = self.lookup(mac, bssid, start, end)
+			if offsets is None:
+				lo, hi = self._offsetRange(start, end)
+				records = reader.records(lo, hi)
+			else:
+				records = self._seek(reader, offsets)
+			for ts, offset, data in records:
+				if start is not None and ts < start:
+					continue
+				if end is not None and ts >= end:
+					continue
+				yield ts, offset, data
+		finally:
+			reader.close()
+
+	def _seek(self, reader, offsets):
+		for offset in offsets:
+			ts, data = reader.readAt(offset)
+			yield ts, offset, data
+
+
+class ArchiveIndex(object):
+	"""Indexes every capture in a directory, picking up new files as they
+	   roll in.
+
+	>>> archive = ArchiveIndex('/var/captures')
+	>>> archive.update()
+	>>> for path, ts, offset, pkt in archive.frames(bssid=0x001122334455):
+	...     pass
+	"""
+
+	def __init__(self, directory, pattern="*.pcap"):
+		self.directory = directory
+		self.pattern = pattern
+		self.indexes = {}
+
+	def update(self):
+		"""Indexes new captures and new records in existing ones."""
+		added = 0
+		for path in sorted(glob.glob(os.path.join(self.directory, self.pattern))):
+			index = self.indexes.get(path)
+			if index is None:
+				index = self.indexes[path] = CaptureIndex(path)
+			if os.path.getsize(path) != index.end:
+				added += index.update()
+		return added
+
+	def frames(self, mac=None, bssid=None, start=None, end=None):
+		"""Yields (path, ts, offset, data) across all captures."""
+		for path in sorted(self.indexes):
+			index = self.indexes[path]
+			if not index.count:
+				continue
+			if start is not None and index.lastTs < start:
+				continue
+			if end is not None and index.times[0] >= end:
+				continue
+			for ts, offset, data in index.frames(mac, bssid, start, end):
+				yield path, ts, offset, data
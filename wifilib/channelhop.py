@@ -0,0 +1,215 @@
+#!/usr/bin/env python
+#
+# channelhop.py
+# Moves a monitor interface across channels so captures see more than one.
+#
+# The time spent on each channel (the dwell) adapts to what was heard there:
+# channels with lots of frames or new access points get visited for longer,
+# quiet channels are passed over quickly.
+#
+# The hopper never touches the capture socket. Capture code calls observe()
+# for each frame and tag() to stamp the frame with the channel it was
+# captured on: radiotap's, as the frame may have waited in the socket queue
+# across a hop, or the hopper's where radiotap has none. All scheduling
+# decisions live in step(), which takes the current time as an argument, so
+# the logic can be driven at any speed with a stubbed setChannel() and a
+# fake clock.
+
+import time
+import threading
+from collections import OrderedDict
+
+
+CHANNELS_24GHZ = [1, 6, 11, 2, 7, 3, 8, 4, 9, 5, 10, 12, 13]
+CHANNELS_5GHZ = [36, 40, 44, 48, 52, 56, 60, 64, 100, 104, 108, 112, 116,
+				 120, 124, 128, 132, 136, 140, 149, 153, 157, 161, 165]
+
+
+class ChannelStats(object):
+	"""Activity seen on a single channel."""
+
+	__slots__ = ('channel', 'visits', 'frames', 'newBSS', 'errors',
+				 'score', 'dwell')
+
+	def __init__(self, channel, dwell):
+		self.channel = channel
+		self.visits = 0
+		self.frames = 0
+		self.newBSS = 0
+		self.errors = 0
+		self.score = 0.0
+		self.dwell = dwell
+
+	def __repr__(self):
+		return "<ChannelStats %s visits=%d frames=%d newBSS=%d dwell=%.3f>" % (
+			self.channel, self.visits, self.frames, self.newBSS, self.dwell)
+
+
+class ChannelHopper(object):
+	"""Adaptive channel hop scheduler.
+
+	setChannel - callable taking a channel number. Returning a tuple is
+				 treated as an (errno, message) failure, which is how the
+				 Wireless.set*() methods report errors.
+	channels   - channels to cycle through, in order.
+	minDwell / maxDwell - bounds of the dwell time, in seconds.
+	frameRate  - frames per second which counts as a 'busy' channel.
+	bssWeight  - how many frames' worth of activity a new BSS is worth.
+	smoothing  - weight given to the latest visit when updating a channel's
+				 activity score (0 < smoothing <= 1).
+
+	>>> wifi = Wireless('mon0')
+	>>> hopper = ChannelHopper(wifi.setChannel)
+	>>> hopper.start()
+	"""
+
+	def __init__(self, setChannel, channels=CHANNELS_24GHZ, minDwell=0.1,
+				 maxDwell=1.0, frameRate=200.0, bssWeight=50.0,
+				 smoothing=0.5, maxBSS=4096, clock=time.time):
+		if not channels:
+			raise ValueError("No channels to hop over")
+		if minDwell <= 0 or maxDwell < minDwell:
+			raise ValueError("Invalid dwell bounds")
+		self.setChannel = setChannel
+		self.channels = list(channels)
+		self.minDwell = minDwell
+		self.maxDwell = maxDwell
+		self.frameRate = float(frameRate)
+		self.bssWeight = bssWeight
+		self.smoothing = smoothing
+		self.maxBSS = maxBSS
+		self.clock = clock
+		self.stats = dict((c, ChannelStats(c, minDwell))
+						  for c in self.channels)
+
+		# the channel the interface is tuned to, None until the first hop.
+		# Read by the capture thread, only written by step().
+		self.current = None
+		self.deadline = None
+		self._index = -1
+		self._visitStart = 0
+		self._visiting = False
+
+		# Counters written only by the capture thread (observe()), the
+		# scheduler works on the difference between two readings so the
+		# two threads never write the same attribute.
+		self._frames = 0
+		self._newBSS = 0
+		self._seen = OrderedDict() # bssid -> None, least recently heard first
+		self._framesMark = 0
+		self._newBSSMark = 0
+
+		self._stop = threading.Event()
+		self._thread = None
+
+	def observe(self, bssid=None, channel=None):
+		"""Records a captured frame against the current channel.
+
+		   bssid   - if given, frames from a BSS not seen before count as a
+		             discovery, which lengthens future dwells on the channel.
+		             Frames without one ('', 0, None) only count as frames.
+		   channel - the channel the frame was captured on, if known. Frames
+		             of another channel than the current one are left out.
+		"""
+		if channel is not None and channel != self.current:
+			return
+		self._frames += 1
+		if not bssid:
+			return
+		seen = self._seen
+		if bssid in seen:
+			del seen[bssid] # move to the most recent end
+		else:
+			self._newBSS += 1
+			if len(seen) >= self.maxBSS:
+				seen.popitem(last=False)
+		seen[bssid] = None
+
+	def tag(self, frame):
+		"""Stamps frame.hopChannel with the channel frame was captured on,
+		   from its radiotap header, or the channel active right now if that
+		   has none. Returns frame."""
+		channel = frame.getChannelNumber()
+		frame.hopChannel = channel if channel is not None else self.current
+		return frame
+
+	def dwellFor(self, channel):
+		"""Returns the dwell time (seconds) the next visit to channel gets."""
+		return self.stats[channel].dwell
+
+	def _finishVisit(self, now):
+		"""Folds the activity of the visit which just ended into the stats
+		   of the current channel."""
+		stats = self.stats[self.current]
+		frames = self._frames - self._framesMark
+		newBSS = self._newBSS - self._newBSSMark
+		self._framesMark += frames
+		self._newBSSMark += newBSS
+
+		elapsed = max(now - self._visitStart, 1e-6)
+		self._visitStart = now
+		stats.visits += 1
+		stats.frames += frames
+		stats.newBSS += newBSS
+
+		activity = (frames + newBSS * self.bssWeight) / elapsed
+		activity = activity / self.frameRate
+		stats.score = (self.smoothing * activity
+					   + (1 - self.smoothing) * stats.score)
+		# score 0 -> minDwell, approaching maxDwell as activity grows
+		span = self.maxDwell - self.minDwell
+		stats.dwell = self.minDwell + span * stats.score / (1.0 + stats.score)
+
+	def step(self, now=None):
+		"""Hops if the current dwell is over.
+
+		   Returns the number of seconds until the next hop is due.
+		"""
+		if now is None:
+			now = self.clock()
+		if self.deadline is not None and now < self.deadline:
+			return self.deadline - now
+
+		if self._visiting:
+			self._finishVisit(now)
+			self._visiting = False
+
+		self._index = (self._index + 1) % len(self.channels)
+		channel = self.channels[self._index]
+		result = self.setChannel(channel)
+		if isinstance(result, tuple):
+			# leave current alone, frames are still arriving on it
+			self.stats[channel].errors += 1
+			self.deadline = now + self.minDwell
+			return self.minDwell
+
+		# discard anything counted during the switch
+		self._framesMark = self._frames
+		self._newBSSMark = self._newBSS
+		self.current = channel
+		self._visitStart = now
+		self._visiting = True
+		dwell = self.stats[channel].dwell
+		self.deadline = now + dwell
+		return dwell
+
+	def run(self):
+		"""Hops until stop() is called."""
+		while not self._stop.isSet():
+			self._stop.wait(self.step())
+
+	def start(self):
+		"""Runs the hopper on a daemon thread and returns immediately."""
+		if self._thread is not None and self._thread.isAlive():
+			return
+		self._stop.clear()
+		self._thread = threading.Thread(target=self.run,
+										name="ChannelHopper")
+		self._thread.setDaemon(True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+		if self._thread is not None:
+			self._thread.join()
+			self._thread = None
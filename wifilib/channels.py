@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# channels.py
+# Frequency <-> channel <-> band tables for the 2.4, 5 and 6 GHz bands,
+# built once at import so every conversion is a single dict lookup.
+#
+# Shared by the ioctl layer (Iwfreq.getChannel) and the radiotap layer
+# (RadiotapFrame.getChannelNumber/getBand), which also decodes the
+# channel flags radiotap carries in the upper half of its CHANNEL field.
+#
+# >>> frequencyToChannel(2437), frequencyToBand(2437)
+# (6, '2.4GHz')
+# >>> channelToFrequency(36), channelToFrequency(37, BAND_6GHZ)
+# (5180, 6135)
+
+import radiotap
+
+BAND_2GHZ = "2.4GHz"
+BAND_5GHZ = "5GHz"
+BAND_6GHZ = "6GHz"
+
+
+def _build():
+	channels = []
+	for channel in range(1, 14):
+		channels.append((BAND_2GHZ, channel, 2407 + 5 * channel))
+	channels.append((BAND_2GHZ, 14, 2484))
+	for channel in range(183, 197): # 4.9GHz, Japan
+		channels.append((BAND_5GHZ, channel, 4000 + 5 * channel))
+	for channel in range(32, 178):
+		channels.append((BAND_5GHZ, channel, 5000 + 5 * channel))
+	channels.append((BAND_6GHZ, 2, 5935))
+	for channel in range(1, 234, 4):
+		channels.append((BAND_6GHZ, channel, 5950 + 5 * channel))
+
+	toChannel = {}
+	toBand = {}
+	toFrequency = {}
+	for band, channel, freq in channels:
+		toChannel[freq] = channel # the bands don't overlap in MHz
+		toBand[freq] = band
+		toFrequency[(band, channel)] = freq
+	return toChannel, toBand, toFrequency
+
+FREQ_TO_CHANNEL, FREQ_TO_BAND, CHANNEL_TO_FREQ = _build()
+
+
+def frequencyToChannel(mhz):
+	"""Returns the channel number of a frequency in MHz, None if unknown."""
+	return FREQ_TO_CHANNEL.get(mhz)
+
+def frequencyToBand(mhz):
+	return FREQ_TO_BAND.get(mhz)
+
+def channelToFrequency(channel, band=None):
+	"""Returns the frequency in MHz of a channel. Without a band, channels
+	   1-14 are taken as 2.4GHz and the rest as 5GHz."""
+	if band is None:
+		band = BAND_2GHZ if channel <= 14 else BAND_5GHZ
+	return CHANNEL_TO_FREQ.get((band, channel))
+
+
+# radiotap channel flags, as returned by RadiotapFrame.getChannelFlags()
+CHANNEL_FLAG_NAMES = (
+	(radiotap.RTAP_CHAN_TURBO, "turbo"),
+	(radiotap.RTAP_CHAN_CCK, "cck"),
+	(radiotap.RTAP_CHAN_OFDM, "ofdm"),
+	(radiotap.RTAP_CHAN_2GHZ, "2ghz"),
+	(radiotap.RTAP_CHAN_5GHZ, "5ghz"),
+	(radiotap.RTAP_CHAN_PASSIVE, "passive"),
+	(radiotap.RTAP_CHAN_DYN, "dynamic"),
+	(radiotap.RTAP_CHAN_GFSK, "gfsk"),
+	(radiotap.RTAP_CHAN_GSM, "gsm"),
+	(radiotap.RTAP_CHAN_STURBO, "static-turbo"),
+	(radiotap.RTAP_CHAN_HALF, "half"),
+	(radiotap.RTAP_CHAN_QUARTER, "quarter"),
+)
+
+_flagNames = {}
+
+def channelFlagNames(flags):
+	"""Returns the names of the radiotap channel flags set, e.g.
+	   ('ofdm', '5ghz'). Cached, drivers only ever use a handful."""
+	names = _flagNames.get(flags)
+	if names is None:
+		names = _flagNames[flags] = tuple(name for bit, name in CHANNEL_FLAG_NAMES
+			if flags & bit)
+	return names
+
+def flagsToBand(flags):
+	"""Band from the radiotap channel flags, for when the frequency isn't
+	   in the tables."""
+	if flags & radiotap.RTAP_CHAN_2GHZ:
+		return BAND_2GHZ
+	if flags & radiotap.RTAP_CHAN_5GHZ:
+		return BAND_5GHZ
+	return None
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+#
+# clock.py
+# A monotonic clock for Python 2, which has no time.monotonic().
+#
+# Samplers keep their sample times in ascending order and bisect them, so
+# they must not see the wall clock step back (NTP, date -s). monotonic() is
+# time.monotonic where it exists, clock_gettime(CLOCK_MONOTONIC) through
+# ctypes otherwise, and time.time as the last resort.
+#
+# >>> start = monotonic()
+# >>> elapsed = monotonic() - start
+
+import os
+import time
+
+
+def _clockGettime():
+    """CLOCK_MONOTONIC through ctypes, None if it isn't available."""
+    try:
+        import ctypes
+        import ctypes.util
+    except ImportError:
+        return None
+
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    CLOCK_MONOTONIC = 1
+    for name in ('rt', 'c'):
+        path = ctypes.util.find_library(name)
+        if path is None:
+            continue
+        try:
+            clock_gettime = ctypes.CDLL(path, use_errno=True).clock_gettime
+        except (OSError, AttributeError):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+
+        def monotonic():
+            ts = timespec() # per call, samplers call this from their threads
+            if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts)) != 0:
+                errno = ctypes.get_errno()
+                raise OSError(errno, os.strerror(errno))
+            return ts.tv_sec + ts.tv_nsec * 1e-9
+        return monotonic
+    return None
+
+monotonic = getattr(time, 'monotonic', None) or _clockGettime() or time.time
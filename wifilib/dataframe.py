@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+#
+# dataframe.py
+# Dissection of 802.11 data frame bodies: LLC/SNAP encapsulation, the
+# ethertype it carries and EAPOL-Key frames, plus tracking of WPA 4-way
+# handshakes.
+#
+# Encrypted bodies can't be dissected, so frames with the protected bit set
+# are rejected before their body is even sliced. On bulk encrypted traffic
+# that is the only work done per frame.
+#
+# >>> tracker = HandshakeTracker()
+# >>> obj = WifiFrame(radioFrame.payload, hasFCS=radioFrame.hasFCS())
+# >>> handshake = tracker.add(obj)
+# >>> if handshake:
+# ...     print handshake
+
+import time
+import struct
+from collections import OrderedDict
+
+from macaddr import macToInt, formatMac
+
+
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_ARP = 0x0806
+ETHERTYPE_IPV6 = 0x86DD
+ETHERTYPE_EAPOL = 0x888E
+
+LLC_SNAP = '\xaa\xaa\x03'
+_SNAP_HEADER_LEN = 8 # DSAP, SSAP, control, OUI(3), ethertype(2)
+
+EAPOL_TYPE_KEY = 3
+_EAPOL_HEADER = struct.Struct('>BBH')
+# descriptor type, key information, key length, replay counter, nonce
+_EAPOL_KEY = struct.Struct('>BHHQ32s')
+_EAPOL_MIC_OFFSET = 4 + 77 # after the EAPOL header and the fields up to the key ID
+_EAPOL_MIC_LEN = 16
+
+# key information bits
+KEY_INFO_PAIRWISE = 0x0008
+KEY_INFO_INSTALL = 0x0040
+KEY_INFO_ACK = 0x0080
+KEY_INFO_MIC = 0x0100
+KEY_INFO_SECURE = 0x0200
+
+_ZERO_NONCE = '\0' * 32
+
+
+class DataPayload(object):
+	"""Dissected body of an unprotected data frame."""
+
+	__slots__ = ('ethertype', 'payload', 'eapolKey')
+
+	def __init__(self, ethertype, payload):
+		self.ethertype = ethertype
+		self.payload = payload # the body after LLC/SNAP
+		self.eapolKey = None
+		if ethertype == ETHERTYPE_EAPOL:
+			self.eapolKey = parseEapolKey(payload)
+
+
+class EapolKey(object):
+	"""The fields of an EAPOL-Key frame needed to follow a handshake."""
+
+	__slots__ = ('descriptor', 'keyInfo', 'keyLength', 'replayCounter',
+		'nonce', 'mic', 'raw')
+
+	def __init__(self, descriptor, keyInfo, keyLength, replayCounter, nonce,
+			mic, raw):
+		self.descriptor = descriptor
+		self.keyInfo = keyInfo
+		self.keyLength = keyLength
+		self.replayCounter = replayCounter
+		self.nonce = nonce
+		self.mic = mic
+		self.raw = raw
+
+	def message(self):
+		"""Returns which message (1-4) of the 4-way handshake this is, or
+		   None for group key and other EAPOL-Key frames."""
+		info = self.keyInfo
+		if not info & KEY_INFO_PAIRWISE:
+			return None
+		if info & KEY_INFO_ACK:
+			if info & KEY_INFO_MIC:
+				return 3 if info & KEY_INFO_INSTALL else None
+			return 1
+		if not info & KEY_INFO_MIC or info & KEY_INFO_INSTALL:
+			return None
+		# message 4 has the secure bit set under WPA2, but not under WPA1,
+		# where it is told apart by its empty nonce
+		if info & KEY_INFO_SECURE or self.nonce == _ZERO_NONCE:
+			return 4
+		return 2
+
+
+def dissect(wifiFrame):
+	"""Returns the DataPayload of a data frame, or None if the frame isn't
+	   data, is protected, carries no payload or isn't LLC/SNAP."""
+	if wifiFrame.type != 2 or wifiFrame.WEPFlag:
+		return None
+	if wifiFrame.subtype & 0x04:
+		return None # null function frames carry no data
+	body = wifiFrame.body()
+	if body[:3] != LLC_SNAP or len(body) < _SNAP_HEADER_LEN:
+		return None
+	ethertype = struct.unpack('>H', body[6:8])[0]
+	return DataPayload(ethertype, body[_SNAP_HEADER_LEN:])
+
+def parseEapolKey(payload):
+	"""Returns an EapolKey for an EAPOL-Key packet, None for other EAPOL
+	   packet types or truncated ones."""
+	if len(payload) < _EAPOL_MIC_OFFSET + _EAPOL_MIC_LEN:
+		return None
+	version, ptype, length = _EAPOL_HEADER.unpack_from(payload)
+	if ptype != EAPOL_TYPE_KEY:
+		return None
+	descriptor, keyInfo, keyLength, replay, nonce = \
+		_EAPOL_KEY.unpack_from(payload, _EAPOL_HEADER.size)
+	mic = payload[_EAPOL_MIC_OFFSET:_EAPOL_MIC_OFFSET + _EAPOL_MIC_LEN]
+	return EapolKey(descriptor, keyInfo, keyLength, replay, nonce, mic,
+		payload[:_EAPOL_HEADER.size + length])
+
+
+class Handshake(object):
+	"""EAPOL-Key messages seen between one AP and one station (48 bit ints)."""
+
+	__slots__ = ('ap', 'sta', 'started', 'updated', 'messages')
+
+	def __init__(self, ap, sta, now):
+		self.ap = ap
+		self.sta = sta
+		self.started = now
+		self.updated = now
+		self.messages = {} # message number -> EapolKey
+
+	def complete(self):
+		"""True once all four messages, with matching replay counters, are in."""
+		m = self.messages
+		if len(m) < 4:
+			return False
+		return (m[2].replayCounter == m[1].replayCounter
+			and m[4].replayCounter == m[3].replayCounter)
+
+	def __str__(self):
+		return "Handshake %s <-> %s messages %s" % (formatMac(self.ap),
+			formatMac(self.sta), sorted(self.messages))
+
+
+class HandshakeTracker(object):
+	"""Correlates EAPOL-Key messages into 4-way handshakes per (AP, STA).
+
+	At most maxPending handshakes are followed at once (oldest dropped),
+	and a handshake which hasn't progressed for timeout seconds is dropped.
+	"""
+
+	def __init__(self, timeout=5.0, maxPending=1024, clock=time.time):
+		self.timeout = timeout
+		self.maxPending = maxPending
+		self.clock = clock
+		self.pending = OrderedDict() # (ap, sta) -> Handshake
+		self.completed = 0
+		self.expired = 0
+
+	def add(self, wifiFrame, now=None):
+		"""Feeds a frame to the tracker. Returns the Handshake if the frame
+		   completed one, None otherwise."""
+		if wifiFrame.type != 2 or wifiFrame.WEPFlag:
+			return None # cheap exit for everything but plaintext data
+		data = dissect(wifiFrame)
+		if data is None or data.eapolKey is None:
+			return None
+		number = data.eapolKey.message()
+		if number is None:
+			return None
+
+		if now is None:
+			now = self.clock()
+		self.expire(now)
+
+		bssid = wifiFrame.bssid()
+		ap = macToInt(bssid)
+		sta = macToInt(wifiFrame.addr1 if wifiFrame.addr2 == bssid else wifiFrame.addr2)
+		key = (ap, sta)
+		handshake = self.pending.pop(key, None)
+		if handshake is None or number == 1:
+			# a new message 1 restarts the exchange
+			if handshake is None and len(self.pending) >= self.maxPending:
+				self.pending.popitem(last=False)
+				self.expired += 1
+			handshake = Handshake(ap, sta, now)
+		handshake.messages[number] = data.eapolKey
+		handshake.updated = now
+
+		if handshake.complete():
+			self.completed += 1
+			return handshake
+		self.pending[key] = handshake # (re)insert as most recently updated
+		return None
+
+	def expire(self, now=None):
+		"""Drops handshakes which haven't progressed within the timeout."""
+		if now is None:
+			now = self.clock()
+		limit = now - self.timeout
+		while self.pending:
+			key, handshake = next(self.pending.iteritems())
+			if handshake.updated > limit:
+				break
+			del self.pending[key]
+			self.expired += 1
@@ -0,0 +1,316 @@
+#!/usr/bin/env python
+#
+# discovery.py
+# Finds the network interfaces and what they are (wireless, phy, driver,
+# monitor mode, ...) from /sys/class/net, without forking or ioctls.
+#
+# The result is cached until rtnetlink reports an interface being added,
+# removed or changed, so repeated calls cost a non-blocking recv(). The
+# events are read whenever the interfaces are asked for, or continuously
+# on a background thread after start(). Listeners registered with
+# addListener(), or handed to start(), hear about every change, e.g.
+# interfaces.watchLinks() starts the shared Discovery with a listener
+# dropping the cached Iwrange of interfaces which changed.
+#
+# >>> for ifname, iface in getInterfaces().iteritems():
+# ...     print ifname, iface.phy, iface.driver, iface.monitor
+# wlan0 phy0 iwlwifi False
+# mon0 phy0 iwlwifi True
+# >>> getDriverName('wlan0')
+# [('iwlwifi', 'pci')]
+
+import os
+import errno
+import select
+import socket
+import struct
+import threading
+
+
+
+SYSFS_NET = "/sys/class/net"
+
+# rtnetlink, which python-wifi's flags don't have
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1 # multicast group of link messages
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+NLMSG_HDRLEN = 16
+IFINFOMSG_LEN = 16
+IFLA_IFNAME = 3
+IFLA_WIRELESS = 11 # wireless events travel as link messages too
+
+# link types (/sys/class/net/<ifname>/type) of monitor mode interfaces
+ARPHRD_IEEE80211_PRISM = 802
+ARPHRD_IEEE80211_RADIOTAP = 803
+
+# callback(ifname, event) for link changes, see addListener()
+_listeners = []
+
+
+def addListener(callback):
+    """callback(ifname, event) is called for every link change seen by a
+       Discovery, event being "new" or "del". After lost events both are
+       None, anything may have changed.
+    """
+    _listeners.append(callback)
+
+def removeListener(callback):
+    _listeners.remove(callback)
+
+
+def _read(path):
+    """contents of a sysfs attribute, None if it can't be read """
+    try:
+        fp = open(path, 'r')
+        try:
+            return fp.read().strip()
+        finally:
+            fp.close()
+    except (IOError, OSError):
+        return None
+
+def _link(path):
+    """name of what a sysfs symlink points to, None without it """
+    try:
+        return os.path.basename(os.readlink(path))
+    except OSError:
+        return None
+
+
+class NetInterface(object):
+    """What /sys/class/net says about one interface."""
+
+    __slots__ = ('name', 'ifindex', 'type', 'address', 'operstate',
+                 'wireless', 'phy', 'driver')
+
+    def __init__(self, name, root=SYSFS_NET):
+        path = os.path.join(root, name)
+        self.name = name
+        ifindex = _read(os.path.join(path, 'ifindex'))
+        self.ifindex = int(ifindex) if ifindex else None
+        linktype = _read(os.path.join(path, 'type'))
+        self.type = int(linktype) if linktype else None
+        self.address = _read(os.path.join(path, 'address'))
+        self.operstate = _read(os.path.join(path, 'operstate'))
+        self.phy = _link(os.path.join(path, 'phy80211'))
+        self.driver = _link(os.path.join(path, 'device', 'driver'))
+        # nl80211 only drivers have no wireless/ without CONFIG_CFG80211_WEXT
+        self.wireless = self.phy is not None or \
+            os.path.isdir(os.path.join(path, 'wireless'))
+
+    @property
+    def monitor(self):
+        return self.type in (ARPHRD_IEEE80211_RADIOTAP,
+                             ARPHRD_IEEE80211_PRISM)
+
+    def __repr__(self):
+        return "<NetInterface %s %s %s %s>" % (self.name, self.phy,
+                                               self.driver, self.operstate)
+
+
+class Discovery(object):
+    """The interfaces of /sys/class/net, cached until rtnetlink says a
+       link changed. Without rtnetlink nothing is cached.
+    """
+
+    _header = struct.Struct('IHHII')
+    _attr = struct.Struct('HH')
+
+    def __init__(self, root=SYSFS_NET, listen=True):
+        self.root = root
+        self.pid = os.getpid()
+        self.sock = None
+        if listen:
+            try:
+                sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                     NETLINK_ROUTE)
+                sock.bind((0, RTMGRP_LINK))
+                sock.setblocking(0)
+                self.sock = sock
+            except (socket.error, AttributeError):
+                pass
+        self._cache = None
+        self._generation = 0 # bumped by every invalidation
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._listeners = [] # added by start(), removed by stop()
+
+    def interfaces(self):
+        """returns {ifname: NetInterface} of all interfaces """
+        if self.sock is None:
+            return self._scan()
+        self.poll()
+        cache = self._cache
+        if cache is None:
+            generation = self._generation
+            cache = self._scan()
+            self._lock.acquire()
+            try:
+                # not if a change came in while scanning
+                if generation == self._generation:
+                    self._cache = cache
+            finally:
+                self._lock.release()
+        return cache
+
+    def get(self, ifname):
+        """returns the NetInterface of ifname, None if there is none """
+        return self.interfaces().get(ifname)
+
+    def wirelessNames(self):
+        return sorted(name for name, iface in self.interfaces().iteritems()
+                      if iface.wireless)
+
+    def _scan(self):
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return {}
+        return dict((name, NetInterface(name, self.root)) for name in names)
+
+    def invalidate(self):
+        self._lock.acquire()
+        try:
+            self._cache = None
+            self._generation += 1
+        finally:
+            self._lock.release()
+
+    def poll(self, timeout=0):
+        """Reads the pending rtnetlink messages, waiting up to timeout
+           seconds for the first. Returns the (ifname, event) changes and
+           tells the listeners.
+        """
+        if self.sock is None:
+            return []
+        changes = []
+        if timeout and not select.select([self.sock], [], [], timeout)[0]:
+            return changes
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except socket.error, e:
+                if e.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                if e.args[0] == errno.ENOBUFS:
+                    # the kernel dropped messages, assume anything changed
+                    changes.append((None, None))
+                    continue
+                raise
+            changes.extend(self.parseChanges(data))
+        if changes:
+            self.invalidate()
+            for ifname, event in changes:
+                for callback in list(_listeners):
+                    callback(ifname, event)
+        return changes
+
+    def parseChanges(self, data):
+        """(ifname, event) of the link messages in data. Wireless events
+           (scan completed etc.) travel as RTM_NEWLINK as well, they
+           aren't changes.
+        """
+        changes = []
+        offset = 0
+        while len(data) - offset >= NLMSG_HDRLEN:
+            length, msgtype = self._header.unpack_from(data, offset)[:2]
+            if length < NLMSG_HDRLEN:
+                break
+            end = offset + length
+            if msgtype in (RTM_NEWLINK, RTM_DELLINK):
+                ifname = None
+                wireless = False
+                attr = offset + NLMSG_HDRLEN + IFINFOMSG_LEN
+                while end - attr >= 4:
+                    alen, atype = self._attr.unpack_from(data, attr)
+                    if alen < 4:
+                        break
+                    if atype == IFLA_IFNAME:
+                        ifname = data[attr + 4:attr + alen].split('\0', 1)[0]
+                    elif atype == IFLA_WIRELESS:
+                        wireless = True
+                    attr += (alen + 3) & ~3
+                if not wireless:
+                    event = "new" if msgtype == RTM_NEWLINK else "del"
+                    changes.append((ifname, event))
+            offset += (length + 3) & ~3
+        return changes
+
+    def run(self):
+        """Handles link changes as they come until stop() is called."""
+        while not self._stop.isSet():
+            self.poll(0.5)
+
+    def start(self, *listeners):
+        """Runs poll() on a daemon thread, so the listeners hear about
+           changes straight away. listeners are added with addListener()
+           until stop()."""
+        for callback in listeners:
+            if callback not in _listeners:
+                addListener(callback)
+                self._listeners.append(callback)
+        if self.sock is None or \
+                self._thread is not None and self._thread.isAlive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="Discovery")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        for callback in self._listeners:
+            removeListener(callback)
+        self._listeners = []
+
+    def close(self):
+        self.stop()
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+_shared = None
+_sharedLock = threading.Lock()
+
+def getDiscovery():
+    """returns the Discovery shared by this process """
+    global _shared
+    _sharedLock.acquire()
+    try:
+        if _shared is None or _shared.pid != os.getpid():
+            _shared = Discovery()
+        return _shared
+    finally:
+        _sharedLock.release()
+
+def getInterfaces():
+    """returns {ifname: NetInterface}, see Discovery.interfaces() """
+    return getDiscovery().interfaces()
+
+
+def getDriverName(ifname, root=SYSFS_NET):
+    """returns the (driver, bus) pairs of the module driving ifname, empty
+       if it has none (not all interfaces have drivers)
+
+       >>> getDriverName('wlan0')
+       [('iwlwifi', 'pci')]
+    """
+    path = os.path.join(root, ifname, 'device', 'driver', 'module',
+                        'drivers')
+    try:
+        entries = os.listdir(path)
+    except OSError:
+        return []
+    ret = []
+    for entry in entries:
+        spl = entry.split(":")
+        if len(spl) < 2:
+            continue
+        ret.append((spl[1], spl[0]))
+    return ret
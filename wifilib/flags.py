@@ -32,6 +32,7 @@ IW_ESSID_MAX_SIZE = 16
 SIOCIWFIRST   = 0x8B00    # FIRST ioctl identifier
 SIOCGIFCONF   = 0x8912    # ifconf struct
 SIOCGIWNAME   = 0x8B01    # get name == wireless protocol
+SIOCSIWFREQ   = 0x8B04    # set channel/frequency
 SIOCGIWFREQ   = 0x8B05    # get channel/frequency
 SIOCSIWMODE   = 0x8B06    # set the operation mode
 SIOCGIWMODE   = 0x8B07    # get operation mode
@@ -62,6 +63,10 @@ IW_POWER_MIN = 0x0001       # Value is a minimum
 IW_POWER_MAX = 0x0002       # Value is a maximum
 IW_POWER_RELATIVE = 0x0004  # Value is not in seconds/ms/us
 
+# Frequency flags
+IW_FREQ_AUTO = 0x00         # Let the driver decide
+IW_FREQ_FIXED = 0x01        # Force a specific value
+
 # Retry limits 
 IW_RETRY_TYPE = 0xF000      # Type of parameter
 
@@ -97,6 +102,7 @@ IWHT_QUAL = 10
 IWEVFIRST     = 0x8C00    # FIRST event identifier
 IWEVQUAL      = 0x8C01    # Quality statistics from scan
 IWEVCUSTOM    = 0x8C02    # Custom Ascii string from Driver
+IWEVGENIE     = 0x8C05    # Generic IE (WPA, RSN, WMM, ..)
 IWEVLAST      = 0x8C0A    # LAST event identifier
 
 
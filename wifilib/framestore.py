@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+#
+# framestore.py
+# Column oriented on-disk store of decoded frame summaries.
+#
+# Layout:
+#	<root>/<YYYYmmddTHH>/<column>.col
+#
+# Every segment directory holds one hour (by default) of frames, and every
+# column is a flat little-endian array of fixed width values, one entry per
+# frame, in capture order. Columns are appended in batches, so a partially
+# written batch (e.g. after a crash) shows up as some columns being longer
+# than others, possibly ending in a partial value. Readers use the shortest
+# column, and a writer reopening a segment first cuts every column back to
+# that many whole rows, so appended rows stay aligned.
+#
+# With NumPy installed, readers map each column with np.memmap, so a query
+# only touches the pages of the columns it actually looks at. Without NumPy
+# the requested columns are read and unpacked in full instead.
+
+import os
+import time
+import calendar
+import struct
+
+from macaddr import macToInt
+
+try:
+	import numpy
+except ImportError:
+	numpy = None
+
+
+# name, struct code, numpy dtype
+COLUMNS = [
+	("ts",		"d", "<f8"),	# capture time, unix seconds
+	("channel",	"H", "<u2"),	# MHz, 0 if unknown
+	("signal",	"b", "<i1"),	# dBm, SIGNAL_UNKNOWN if unknown
+	("type",	"B", "<u1"),
+	("subtype",	"B", "<u1"),
+	("flags",	"B", "<u1"),	# second frame control byte
+	("length",	"H", "<u2"),	# frame body length
+	("src",		"Q", "<u8"),	# MAC addresses as 48 bit integers
+	("dest",	"Q", "<u8"),
+	("bssid",	"Q", "<u8"),
+]
+COLUMN_NAMES = [c[0] for c in COLUMNS]
+COLUMN_CODES = dict((c[0], c[1]) for c in COLUMNS)
+COLUMN_DTYPES = dict((c[0], c[2]) for c in COLUMNS)
+
+SIGNAL_UNKNOWN = -128
+SEGMENT_FORMAT = "%Y%m%dT%H"
+
+
+def summarize(ts, radioFrame, wifiFrame):
+	"""Returns the column values (in COLUMNS order) for a decoded frame."""
+	channel = signal = None
+	if radioFrame is not None:
+		channel = radioFrame.getChannel()
+		signal = radioFrame.getSignalStrength()
+	if signal is None:
+		signal = SIGNAL_UNKNOWN
+	fcflags = (wifiFrame.toDS | wifiFrame.fromDS << 1 | wifiFrame.moreFrag << 2
+		| wifiFrame.retryFlag << 3 | wifiFrame.powerMngtFlag << 4
+		| wifiFrame.moreDataFlag << 5 | wifiFrame.WEPFlag << 6)
+	return (ts, channel or 0, signal, wifiFrame.type, wifiFrame.subtype,
+		fcflags, len(wifiFrame.data), wifiFrame.srcMac() or 0,
+		wifiFrame.destMac() or 0, wifiFrame.bssidMac() or 0)
+
+
+class FrameStoreWriter(object):
+	"""Appends frame summaries to a store, one batch at a time.
+
+	root           - directory of the store, created if missing.
+	batchSize      - rows buffered in memory before they are written out.
+	segmentSeconds - length of the time partitions, a whole number of
+	                 hours up to a day.
+	"""
+
+	def __init__(self, root, batchSize=8192, segmentSeconds=3600):
+		if segmentSeconds % 3600 or not 0 < segmentSeconds <= 86400:
+			raise ValueError("segmentSeconds must be whole hours, at most a day")
+		self.root = root
+		self.batchSize = batchSize
+		self.segmentSeconds = segmentSeconds
+		if not os.path.isdir(root):
+			os.makedirs(root)
+		self._rows = []
+		self._segment = None
+		self._segmentStart = None
+		self._segmentEnd = None
+
+	def append(self, ts, radioFrame, wifiFrame):
+		"""Adds a decoded frame captured at time ts."""
+		self.appendRow(summarize(ts, radioFrame, wifiFrame))
+
+	def appendRow(self, row):
+		"""Adds a row of column values, in COLUMNS order."""
+		ts = row[0]
+		if self._segment is None or ts >= self._segmentEnd or ts < self._segmentStart:
+			self.flush()
+			self._openSegment(ts)
+		self._rows.append(row)
+		if len(self._rows) >= self.batchSize:
+			self.flush()
+
+	def _openSegment(self, ts):
+		start = int(ts) - int(ts) % self.segmentSeconds
+		self._segmentStart = start
+		self._segmentEnd = start + self.segmentSeconds
+		self._segment = os.path.join(self.root,
+			time.strftime(SEGMENT_FORMAT, time.gmtime(start)))
+		if not os.path.isdir(self._segment):
+			os.makedirs(self._segment)
+			return
+		# drop what a torn batch left behind before appending after it
+		rows = _rows(self._segment)
+		for name in COLUMN_NAMES:
+			path = os.path.join(self._segment, name + '.col')
+			size = rows * struct.calcsize(COLUMN_CODES[name])
+			if _size(path) > size:
+				fp = open(path, 'r+b')
+				try:
+					fp.truncate(size)
+				finally:
+					fp.close()
+
+	def flush(self):
+		"""Writes the buffered rows to the current segment."""
+		if not self._rows:
+			return
+		n = len(self._rows)
+		for i, values in enumerate(zip(*self._rows)):
+			name = COLUMN_NAMES[i]
+			data = struct.pack('<%d%s' % (n, COLUMN_CODES[name]), *values)
+			fp = open(os.path.join(self._segment, name + '.col'), 'ab')
+			try:
+				fp.write(data)
+			finally:
+				fp.close()
+		self._rows = []
+
+	def close(self):
+		self.flush()
+
+
+class FrameStore(object):
+	"""Read access to a store written by FrameStoreWriter.
+
+	>>> store = FrameStore('/var/lib/wifidec/store')
+	>>> for seg, cols in store.scan(time.time() - 6*3600, columns=['ts', 'src'],
+	...                             mac=0x001122334455):
+	...     print seg, len(cols['ts'])
+	"""
+
+	def __init__(self, root):
+		self.root = root
+
+	def segments(self, start=None, end=None):
+		"""Returns the segment directories overlapping [start, end), oldest first."""
+		if not os.path.isdir(self.root):
+			return []
+		result = []
+		for name in sorted(os.listdir(self.root)):
+			try:
+				segStart = calendar.timegm(time.strptime(name, SEGMENT_FORMAT))
+			except ValueError:
+				continue
+			# segments are at most a day long, check the bounds loosely and
+			# let the ts column do the exact filtering
+			if end is not None and segStart >= end:
+				continue
+			if start is not None and segStart + 86400 <= start:
+				continue
+			result.append(name)
+		return result
+
+	def columns(self, segment, names=None):
+		"""Maps the requested columns of a segment, trimmed to equal length."""
+		if names is None:
+			names = COLUMN_NAMES
+		path = os.path.join(self.root, segment)
+		rows = _rows(path)
+		cols = {}
+		for name in names:
+			cols[name] = _load(os.path.join(path, name + '.col'), name, rows)
+		return cols
+
+	def scan(self, start=None, end=None, columns=None, mac=None, bssid=None):
+		"""Yields (segment, {column: values}) for frames matching the filters.
+
+		start, end - capture time bounds (unix seconds), [start, end)
+		mac        - 48 bit address matched against src or dest
+		bssid      - 48 bit address matched against bssid
+		"""
+		if columns is None:
+			columns = COLUMN_NAMES
+		needed = set(columns) | set(["ts"])
+		if mac is not None:
+			needed.update(["src", "dest"])
+		if bssid is not None:
+			needed.add("bssid")
+		for segment in self.segments(start, end):
+			cols = self.columns(segment, needed)
+			if numpy is not None:
+				mask = numpy.ones(len(cols["ts"]), dtype=bool)
+				if start is not None:
+					mask &= cols["ts"] >= start
+				if end is not None:
+					mask &= cols["ts"] < end
+				if mac is not None:
+					mask &= (cols["src"] == mac) | (cols["dest"] == mac)
+				if bssid is not None:
+					mask &= cols["bssid"] == bssid
+				if not mask.any():
+					continue
+				yield segment, dict((name, cols[name][mask]) for name in columns)
+			else:
+				keep = [i for i in xrange(len(cols["ts"]))
+					if _matches(cols, i, start, end, mac, bssid)]
+				if not keep:
+					continue
+				yield segment, dict((name, [cols[name][i] for i in keep])
+					for name in columns)
+
+
+def _matches(cols, i, start, end, mac, bssid):
+	ts = cols["ts"][i]
+	if start is not None and ts < start:
+		return False
+	if end is not None and ts >= end:
+		return False
+	if mac is not None and cols["src"][i] != mac and cols["dest"][i] != mac:
+		return False
+	if bssid is not None and cols["bssid"][i] != bssid:
+		return False
+	return True
+
+def _size(path):
+	try:
+		return os.path.getsize(path)
+	except OSError:
+		return 0
+
+def _rows(segment):
+	"""Number of whole rows in a segment, i.e. of the shortest column."""
+	rows = None
+	for name in COLUMN_NAMES:
+		size = _size(os.path.join(segment, name + '.col'))
+		count = size // struct.calcsize(COLUMN_CODES[name])
+		if rows is None or count < rows:
+			rows = count
+	return rows
+
+def _load(path, name, rows):
+	if numpy is not None:
+		if rows == 0:
+			return numpy.zeros(0, dtype=COLUMN_DTYPES[name])
+		return numpy.memmap(path, dtype=COLUMN_DTYPES[name], mode='r',
+			shape=(rows,))
+	code = COLUMN_CODES[name]
+	fp = open(path, 'rb')
+	try:
+		data = fp.read(rows * struct.calcsize(code))
+	finally:
+		fp.close()
+	return struct.unpack('<%d%s' % (rows, code), data)
@@ -20,46 +20,54 @@
 #    Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307
 #    USA 
 
+import os
 import struct
 import array
 import math
 import fcntl
 import socket
 import time
-import re
+import select
+import Queue
+import traceback
+import ctypes
+import threading
 
 import pythonwifi.flags
 from types import StringType
 
+import channels
+import discovery
+
 
 KILO = 10**3
 MEGA = 10**6
 GIGA = 10**9
 
+# rtnetlink (scan complete events) and SIOCGIFINDEX, which python-wifi's
+# flags don't have
+SIOCGIFINDEX = 0x8933
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1 # multicast group of link messages
+RTM_NEWLINK = 16
+NLMSG_HDRLEN = 16
+IFINFOMSG_LEN = 16
+IFLA_WIRELESS = 11 # attribute holding a wireless event stream
+
 
 def getNICnames():
-    """ extract wireless device names of /proc/net/wireless 
+    """ extract wireless device names of /sys/class/net (cached, see
+        discovery.py)
         
         returns empty list if no devices are present
 
         >>> getNICnames()
         ['eth1', 'wifi0']
     """
-    device = re.compile('[a-z]{2,4}[0-9]') 
-    ifnames = []
-    
-    fp = open('/proc/net/wireless', 'r')
-    data = fp.readlines()
-    for line in data:
-        try:
-            ifnames.append(device.search(line).group())
-        except AttributeError:
-            pass 
-    # if we couldn't lookup the devices, try to ask the kernel
-    if ifnames == []:
-        ifnames = getConfiguredNICnames()
-    
-    return ifnames
+    if not os.path.isdir(discovery.SYSFS_NET):
+        # if we couldn't lookup the devices, try to ask the kernel
+        return getConfiguredNICnames()
+    return discovery.getDiscovery().wirelessNames()
 
 
 def getConfiguredNICnames():
@@ -70,7 +78,7 @@ def getConfiguredNICnames():
     """
     iwstruct = Iwstruct()
     ifnames = []
-    buff = array.array('c', '\0'*1024)
+    buff = getIoctlContext().buffer(1024)
     caddr_t, length = buff.buffer_info()
     datastr = iwstruct.pack('iP', length, caddr_t)
     try:
@@ -80,8 +88,7 @@ def getConfiguredNICnames():
 
     # get the interface names out of the buffer
     for i in range(0, 1024, 32):
-        ifname = buff.tostring()[i:i+32]
-        ifname = struct.unpack('32s', ifname)[0]
+        ifname = unpackFrom('32s', buff, i)
         ifname = ifname.split('\0', 1)[0]
         if ifname:
             # verify if ifnames are really wifi devices
@@ -93,17 +100,261 @@ def getConfiguredNICnames():
     return ifnames  
 
 
+def getIfindex(ifname):
+    """returns the interface index of ifname
+
+       >>> getIfindex('wlan0')
+       3
+    """
+    iwstruct = Iwstruct()
+    ifreq = struct.pack('16si', ifname, 0)
+    try:
+        result = iwstruct._fcntl(SIOCGIFINDEX, ifreq)
+    except IOError, (i, error):
+        return i, error
+    return unpackFrom('16si', result)[1]
+
+
+SCAN_BACKEND = "wext"
+
+def getScanner(ifname, backend=None):
+    """returns the object to scan ifname with, which offers scan(),
+       iterScan() and scanAsync() like Iwscan
+
+       backend: "wext" for Iwscan, "nl80211" for nl80211.Nl80211Scan, or
+                "auto" for nl80211 where the kernel has it.
+                SCAN_BACKEND by default.
+    """
+    if backend is None:
+        backend = SCAN_BACKEND
+    if backend == "wext":
+        return Iwscan(ifname)
+    import nl80211
+    if backend == "nl80211":
+        return nl80211.Nl80211Scan(ifname)
+    if backend == "auto":
+        try:
+            nl = nl80211.getNl80211()
+            nl.getInterfaces(ifname)
+            if not nl.canScan():
+                return Iwscan(ifname) # it could only poll
+        except IOError:
+            return Iwscan(ifname)
+        return nl80211.Nl80211Scan(ifname, nl)
+    raise ValueError("unknown scan backend %r" % backend)
+
+
 def makedict(**kwargs):
     return kwargs
 
 
+_structs = {}
+
+def getStruct(fmt):
+    """returns a compiled struct.Struct for fmt, shared by all callers """
+    compiled = _structs.get(fmt)
+    if compiled is None:
+        compiled = _structs[fmt] = struct.Struct(fmt)
+    return compiled
+
+def unpackFrom(fmt, data, offset=0):
+    """unpacks fmt from data at offset, without copying data
+
+       Keeps no state, so it is safe to use from any number of threads.
+       A single value is returned as is rather than as a 1-tuple.
+    """
+    value = getStruct(fmt).unpack_from(data, offset)
+    if len(value) == 1:
+        return value[0]
+    return value
+
+
+class IoctlContext(object):
+    """Per process state shared by all ioctl calls: a single socket to issue
+       them on, and request buffers which are reused rather than allocated
+       for every call.
+
+       Buffers are kept per thread, so any number of threads can issue
+       ioctls at the same time. Each thread has one buffer per purpose
+       (by default the size asked for, "scan" for scan results), grown
+       when a larger one is asked for, so a thread keeps a handful of
+       buffers however often it asks. A buffer returned by buffer() stays
+       valid until the same thread asks for one of the same purpose again.
+    """
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.sockfd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._local = threading.local()
+
+    def buffer(self, size, purpose=None):
+        """returns a zeroed array('c') of at least size bytes """
+        if purpose is None:
+            purpose = size
+        try:
+            buffers = self._local.buffers
+        except AttributeError:
+            buffers = self._local.buffers = {}
+        buff = buffers.get(purpose)
+        if buff is None or len(buff) < size:
+            buff = buffers[purpose] = array.array('c', '\0'*size)
+        else:
+            caddr_t, length = buff.buffer_info()
+            ctypes.memset(caddr_t, 0, length)
+        return buff
+
+    def close(self):
+        self.sockfd.close()
+
+
+_ioctlContext = None
+_ioctlContextLock = threading.Lock()
+
+def getIoctlContext():
+    """returns the IoctlContext of this process, creating it on first use
+       (and again after a fork, so children don't share the parent's
+       socket)
+    """
+    global _ioctlContext
+    context = _ioctlContext
+    if context is None or context.pid != os.getpid():
+        _ioctlContextLock.acquire()
+        try:
+            context = _ioctlContext
+            if context is None or context.pid != os.getpid():
+                context = _ioctlContext = IoctlContext()
+        finally:
+            _ioctlContextLock.release()
+    return context
+
+
+class WirelessSnapshot(object):
+    """Read-only record of everything Wireless.snapshot() read, one
+       attribute per getter, holding what the getter would return
+       (including its (errno, message) tuple on failure)
+    """
+
+    FIELDS = ('name', 'apaddr', 'essid', 'bitrate', 'frequency', 'mode',
+              'txpower', 'rts', 'fragmentation', 'sensitivity', 'retrylimit',
+              'powermanagement', 'statistics')
+    __slots__ = ('ifname', 'time') + FIELDS
+
+    def __init__(self, ifname, time, values):
+        set = object.__setattr__
+        set(self, 'ifname', ifname)
+        set(self, 'time', time)
+        for field in self.FIELDS:
+            set(self, field, values[field])
+
+    def __setattr__(self, name, value):
+        raise AttributeError("WirelessSnapshot is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("WirelessSnapshot is read-only")
+
+
 class Wireless(object):
-    """Access to wireless interfaces"""
+    """Access to wireless interfaces
+
+       With a ttl (seconds), the getters are answered from a snapshot()
+       of at most that age, so polling many attributes of many
+       interfaces costs one round of ioctls per interface and ttl.
+    """
     
-    def __init__(self, ifname):
-        self.sockfd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    def __init__(self, ifname, ttl=0):
+        self.sockfd = getIoctlContext().sockfd
         self.ifname = ifname
         self.iwstruct = Iwstruct()
+        self.ttl = ttl
+        self._snapshot = None
+
+    def snapshot(self, ttl=None):
+        """returns a WirelessSnapshot of the interface, reusing the last
+           one if it isn't older than ttl (self.ttl by default) seconds
+
+            >>> from iwlibs import Wireless
+            >>> wifi = Wireless('eth1')
+            >>> snap = wifi.snapshot()
+            >>> snap.essid, snap.frequency
+            ('romanofski', '2.417GHz')
+        """
+        if ttl is None:
+            ttl = self.ttl
+        now = time.time()
+        snap = self._snapshot
+        if snap is not None and ttl and now - snap.time < ttl:
+            return snap
+        snap = WirelessSnapshot(self.ifname, now, self._readAll())
+        self._snapshot = snap
+        return snap
+
+    def _readAll(self):
+        """issues all the get ioctls back to back, on one Iwstruct and
+           request buffer
+        """
+        flags = pythonwifi.flags
+        iwstruct = self.iwstruct
+        ifname = self.ifname
+        values = {}
+
+        status, result = iwstruct.iw_get_ext(ifname, flags.SIOCGIWNAME)
+        if status > 0:
+            # not wireless, or no such device: everything else fails alike
+            for field in WirelessSnapshot.FIELDS:
+                values[field] = (status, result)
+            return values
+        values['name'] = result.split('\0')[0]
+
+        buff, datastr = iwstruct.pack_wrq(32)
+        status, result = iwstruct.iw_get_ext(ifname, flags.SIOCGIWAP,
+                                             data=datastr)
+        values['apaddr'] = (status, result) if status > 0 \
+            else iwstruct.getMAC(result)
+
+        buff, datastr = iwstruct.pack_wrq(32)
+        status, result = iwstruct.iw_get_ext(ifname, flags.SIOCGIWESSID,
+                                             data=datastr)
+        values['essid'] = (status, result) if status > 0 \
+            else buff.tostring().strip('\x00')
+
+        for field, ioctl, getter in (
+                ('bitrate', flags.SIOCGIWRATE, Iwfreq.getBitrate),
+                ('frequency', flags.SIOCGIWFREQ, Iwfreq.getFrequency),
+                ('txpower', flags.SIOCGIWTXPOW, Iwfreq.getTransmitPower)):
+            status, result = iwstruct.iw_get_ext(ifname, ioctl)
+            values[field] = (status, result) if status > 0 \
+                else getter(Iwfreq(result))
+
+        status, result = iwstruct.iw_get_ext(ifname, flags.SIOCGIWMODE)
+        values['mode'] = (status, result) if status > 0 \
+            else self._modeName(result)
+
+        for field, ioctl in (('rts', flags.SIOCGIWRTS),
+                             ('fragmentation', flags.SIOCGIWFRAG),
+                             ('sensitivity', flags.SIOCGIWSENS),
+                             ('retrylimit', flags.SIOCGIWRETRY),
+                             ('powermanagement', flags.SIOCGIWPOWER)):
+            status, result = iwstruct.iw_get_ext(ifname, ioctl)
+            values[field] = (status, result) if status > 0 \
+                else Iwparam(ifname, ioctl, result).getValue()
+
+        buff, datastr = iwstruct.pack_wrq(32)
+        status, result = iwstruct.iw_get_ext(ifname, flags.SIOCGIWSTATS,
+                                             data=datastr)
+        if status > 0:
+            values['statistics'] = (status, result)
+        else:
+            iwstats = Iwstats(ifname, buff.tostring())
+            values['statistics'] = (iwstats.status, iwstats.qual,
+                                    iwstats.discard, iwstats.missed_beacon)
+        return values
+
+    def _modeName(self, result):
+        mode = unpackFrom('i', result)
+        try:
+            return pythonwifi.flags.modes[mode]
+        except IndexError:
+            return mode
 
     def getAPaddr(self):
         """ returns accesspoint mac address 
@@ -126,6 +377,8 @@ class Wireless(object):
             >>> wifi.getAPaddr()
             (19, 'No such device')
         """
+        if self.ttl:
+            return self.snapshot().apaddr
         buff, datastr = self.iwstruct.pack_wrq(32)
         status, result = self.iwstruct.iw_get_ext(self.ifname, 
                                                   pythonwifi.flags.SIOCGIWAP,
@@ -143,6 +396,8 @@ class Wireless(object):
             >>> wifi.getBitrate()
             '11 Mb/s'
         """
+        if self.ttl:
+            return self.snapshot().bitrate
         i, result = self.iwstruct.iw_get_ext(self.ifname, 
                                             pythonwifi.flags.SIOCGIWRATE)
         if i > 0:
@@ -159,7 +414,7 @@ class Wireless(object):
             >>> num == len(rates)
             True
         """
-        iwrange = Iwrange(self.ifname)
+        iwrange = Iwrange.get(self.ifname)
         if iwrange.errorflag:
             return (iwrange.errorflag, iwrange.error)
         return (iwrange.num_bitrates, iwrange.bitrates)
@@ -174,7 +429,7 @@ class Wireless(object):
             >>> num == len(rates)
             True
             """
-        iwrange = Iwrange(self.ifname)
+        iwrange = Iwrange.get(self.ifname)
         if iwrange.errorflag:
             return (iwrange.errorflag, iwrange.error)
         return (iwrange.num_channels, iwrange.frequencies)
@@ -187,6 +442,8 @@ class Wireless(object):
             >>> wifi.getEssid()
             'romanofski'
         """
+        if self.ttl:
+            return self.snapshot().essid
         essid = ""
         buff, s = self.iwstruct.pack_wrq(32)
         i, result = self.iwstruct.iw_get_ext(self.ifname, 
@@ -202,6 +459,7 @@ class Wireless(object):
         # Warning! untested code XXX
         if len(essid) > pythonwifi.flags.IW_ESSID_MAX_SIZE:
             return "essid to big"
+        self._snapshot = None
         buff, datastr = self.iwstruct.pack_test(essid, 32)
         status, result = self.iwstruct.iw_get_ext(self.ifname, 
                                              pythonwifi.flags.SIOCSIWESSID, 
@@ -237,6 +495,8 @@ class Wireless(object):
             >>> wifi.getFragmentation()
             'off'
         """
+        if self.ttl:
+            return self.snapshot().fragmentation
         iwparam = Iwparam(self.ifname, pythonwifi.flags.SIOCGIWFRAG)
         if iwparam.errorflag:
             return (iwparam.errorflag, iwparam.error)
@@ -250,6 +510,8 @@ class Wireless(object):
             >>> wifi.getFrequency()
             '2.417GHz' 
         """
+        if self.ttl:
+            return self.snapshot().frequency
         status, result = self.iwstruct.iw_get_ext(self.ifname, 
                                                   pythonwifi.flags.SIOCGIWFREQ)
         if status > 0:
@@ -257,6 +519,28 @@ class Wireless(object):
         iwfreq = Iwfreq(result)
         return iwfreq.getFrequency()
 
+    def setFrequency(self, freq):
+        """sets the frequency of the card
+
+           freq - frequency in Hz. Values below 1000 are interpreted by
+                  the kernel as a channel number instead.
+        """
+        self._snapshot = None
+        m, e = freq, 0
+        while m >= GIGA:
+            m = m / 10
+            e += 1
+        datastr = self.iwstruct.pack('ihBB', int(m), e, 0,
+                                     pythonwifi.flags.IW_FREQ_FIXED)
+        status, result = self.iwstruct.iw_get_ext(self.ifname,
+                                             pythonwifi.flags.SIOCSIWFREQ,
+                                             data=datastr)
+        if status > 0:
+            return (status, result)
+
+    def setChannel(self, channel):
+        """tunes the card to the given channel number """
+        return self.setFrequency(int(channel))
 
     def getMode(self):
         """returns currently set operation mode 
@@ -266,22 +550,24 @@ class Wireless(object):
             >>> wifi.getMode()
             'Managed' 
         """
+        if self.ttl:
+            return self.snapshot().mode
         status, result = self.iwstruct.iw_get_ext(self.ifname, 
                                              pythonwifi.flags.SIOCGIWMODE)
         if status > 0:
             return (status, result)
-        mode = self.iwstruct.unpack('i', result[:4])[0]
-        return result[mode]
+        return self._modeName(result)
 
     def setMode(self, mode):
         """sets the operation mode """
         try:
-            this_modes = [x.lower() for x in modes]
+            this_modes = [x.lower() for x in pythonwifi.flags.modes]
             mode = mode.lower()
             wifimode = this_modes.index(mode)
         except ValueError:
             return "Invalid operation mode!"
 
+        self._snapshot = None
         datastr = self.iwstruct.pack('I', wifimode)
         status, result = self.iwstruct.iw_get_ext(self.ifname, 
                                              pythonwifi.flags.SIOCSIWMODE, 
@@ -297,6 +583,8 @@ class Wireless(object):
             >>> wifi.getWirelessName()
             'IEEE 802.11-DS'
         """
+        if self.ttl:
+            return self.snapshot().name
         status, result = self.iwstruct.iw_get_ext(self.ifname, 
                                              pythonwifi.flags.SIOCGIWNAME)
         if status > 0:
@@ -311,6 +599,8 @@ class Wireless(object):
             >>> wifi.getPowermanagement()
             'off'
         """
+        if self.ttl:
+            return self.snapshot().powermanagement
         iwparam = Iwparam(self.ifname, pythonwifi.flags.SIOCGIWPOWER)
         if iwparam.errorflag:
             return (iwparam.errorflag, iwparam.error)
@@ -328,6 +618,8 @@ class Wireless(object):
             >>> wifi.getRetrylimit()
             16
         """
+        if self.ttl:
+            return self.snapshot().retrylimit
         iwparam = Iwparam(self.ifname, pythonwifi.flags.SIOCGIWRETRY)
         if iwparam.errorflag:
             return (iwparam.errorflag, iwparam.error)
@@ -351,6 +643,8 @@ class Wireless(object):
             >>> wifi.getRTS()
             'off'
         """
+        if self.ttl:
+            return self.snapshot().rts
         iwparam = Iwparam(self.ifname, pythonwifi.flags.SIOCGIWRTS)
         if iwparam.errorflag:
             return (iwparam.errorflag, iwparam.error)
@@ -374,6 +668,8 @@ class Wireless(object):
             'off'
 
         """
+        if self.ttl:
+            return self.snapshot().sensitivity
         iwparam = Iwparam(self.ifname, pythonwifi.flags.SIOCGIWSENS)
         if iwparam.errorflag:
             return (iwparam.errorflag, iwparam.error)
@@ -387,6 +683,8 @@ class Wireless(object):
             >>> wifi.getTXPower()
             '17 dBm'
         """
+        if self.ttl:
+            return self.snapshot().txpower
         status, result = self.iwstruct.iw_get_ext(self.ifname, 
                                                   pythonwifi.flags.SIOCGIWTXPOW)
         if status > 0:
@@ -398,52 +696,59 @@ class Wireless(object):
         """returns statistics information which can also be found in
            /proc/net/wireless 
         """
+        if self.ttl:
+            statistics = self.snapshot().statistics
+            if isinstance(statistics[0], int):
+                return statistics # the (errno, message) of the failure
+            return list(statistics)
         iwstats = Iwstats(self.ifname)
         if iwstats.errorflag > 0:
             return (iwstats.errorflag, iwstats.error)
         return [iwstats.status, iwstats.qual, iwstats.discard,
             iwstats.missed_beacon]
 
-    def scan(self):
-        """returns Iwscanresult objects, after a successful scan"""
-        iwscan = Iwscan(self.ifname)
-        return iwscan.scan()
+    def scan(self, backend=None):
+        """returns Iwscanresult objects (or nl80211 results, see
+           getScanner()), after a successful scan"""
+        return getScanner(self.ifname, backend).scan()
+
+    def getStations(self):
+        """returns nl80211 StationInfo of the stations the interface
+           knows: the AP it is associated to, or its clients when it is one
+        """
+        import nl80211
+        try:
+            return nl80211.getNl80211().getStations(self.ifname)
+        except IOError, (i, error):
+            return i, error
 
 
 class Iwstruct(object):
     """basic class to handle iwstruct data """
     
     def __init__(self):
-        self.idx = 0
-        self.sockfd = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-    def parse_data(self, fmt, data):
-        """ unpacks raw C data """
-        size = struct.calcsize(fmt)
-        idx = self.idx
+        self.context = getIoctlContext()
+        self.sockfd = self.context.sockfd
 
-        datastr = data[idx:idx + size]
-        self.idx = idx+size
-        value = struct.unpack(fmt, datastr)
-
-        # take care of a tuple like (int, )
-        if len(value) == 1:
-            return value[0]
-        else:
-            return value
+    def parse_data(self, fmt, data, offset=0):
+        """ unpacks raw C data at offset, see unpackFrom() """
+        return unpackFrom(fmt, data, offset)
     
     def pack(self, fmt, *args):
         """ calls struct.pack and returns the result """
         return struct.pack(fmt, *args)
 
-    def pack_wrq(self, buffsize):
+    def pack_wrq(self, buffsize, purpose=None):
         """ packs wireless request data for sending it to the kernel """
         # Prepare a buffer
         # We need the address of our buffer and the size for it. The
         # ioctl itself looks for the pointer to the address in our
         # memory and the size of it.
         # Dont change the order how the structure is packed!!!
-        buff = array.array('c', '\0'*buffsize)
+        # The buffer is reused by the next pack_wrq() of the same purpose
+        # on this thread, so read the result out before packing another.
+        # It may be larger than buffsize, the kernel is told its full size.
+        buff = self.context.buffer(buffsize, purpose)
         caddr_t, length = buff.buffer_info()
         datastr = struct.pack('Pi', caddr_t, length)
         return buff, datastr
@@ -458,7 +763,7 @@ class Iwstruct(object):
 
     def unpack(self, fmt, packed_data):
         """ unpacks data with given format """
-        return struct.unpack(fmt, packed_data)
+        return getStruct(fmt).unpack(packed_data)
 
     def _fcntl(self, request, args):
         return fcntl.ioctl(self.sockfd.fileno(), request, args)
@@ -482,14 +787,14 @@ class Iwstruct(object):
 
     def getMAC(self, packed_data):
         """ extracts mac addr from packed data and returns it as str """
-        mac_addr = struct.unpack('xxBBBBBB', packed_data[:8])
+        mac_addr = unpackFrom('xxBBBBBB', packed_data)
         return "%02X:%02X:%02X:%02X:%02X:%02X" % mac_addr
 
 
 class Iwparam(object):
     """class to hold iwparam data """
     
-    def __init__(self, ifname, ioctl):
+    def __init__(self, ifname, ioctl, data=None):
         # (i) value, (b) fixed, (b) disabled, (b) flags
         self.fmt = "ibbH"
         self.value = 0
@@ -500,7 +805,10 @@ class Iwparam(object):
         self.error = ""
         self.ioctl = ioctl 
         self.ifname = ifname
-        self.update()
+        if data is None:
+            self.update()
+        else:
+            self._parse(data)
     
     def getValue(self):
         """returns the value if not disabled """
@@ -562,31 +870,25 @@ class Iwparam(object):
     
     def _parse(self, data):
         """ unpacks iwparam data """
-        iwstruct = Iwstruct()
         self.value, self.fixed, self.disabled, self.flags =\
-            iwstruct.parse_data(self.fmt, data)
+            unpackFrom(self.fmt, data)
         
 class Iwfreq(object):
     """ class to hold iwfreq data
-        delegates to Iwstruct class
+        decodes with the shared unpackFrom(), so it is cheap to create
     """
     
-    def __init__(self, data=None):
-        self.fmt = "ihbb"
+    fmt = "ihbb"
+
+    def __init__(self, data=None, offset=0):
         if data is not None:
-            self.frequency = self.parse(data)
+            self.frequency = self.parse(data, offset)
         else:
             self.frequency = 0
-        self.iwstruct = Iwstruct()
-        
-    def __getattr__(self, attr):
-        return getattr(self.iwstruct, attr)
 
-    def parse(self, data):
+    def parse(self, data, offset=0):
         """ unpacks iwparam"""
-        
-        size = struct.calcsize(self.fmt)
-        m, e, dummy, pad = struct.unpack(self.fmt, data[:size])
+        m, e, dummy, pad = unpackFrom(self.fmt, data, offset)
         # XXX well, its not *the* frequency - we need a better name
         if e == 0:
             return m
@@ -636,14 +938,13 @@ class Iwfreq(object):
         """returns channel information given by frequency
 
            returns None if frequency can't be converted
-           freq = frequency to convert (int)
-           iwrange = Iwrange object
+           freq = frequency to convert in Hz (int)
+           iwrange = Iwrange object (unused, the channel tables in
+                     channels.py cover every band)
         """
         if freq < KILO:
             return None
-
-        # XXX
-        # for frequency in iwrange.frequencies
+        return channels.frequencyToChannel(int(round(float(freq) / MEGA)))
 
 
     def mw2dbm(self, mwatt):
@@ -666,7 +967,7 @@ class Iwfreq(object):
 class Iwstats(object):
     """ class to hold iwstat data """
 
-    def __init__(self, ifname):
+    def __init__(self, ifname, data=None):
         # (2B) status, 4B iw_quality, 6i iw_discarded
         self.fmt = "2B4B6i"
         self.status = 0
@@ -676,7 +977,10 @@ class Iwstats(object):
         self.ifname = ifname
         self.errorflag = 0
         self.error = ""
-        self.update()
+        if data is None:
+            self.update()
+        else:
+            self._parse(data)
 
     def update(self):
         """updates Iwstats object by a system call to the kernel 
@@ -694,9 +998,7 @@ class Iwstats(object):
     
     def _parse(self, data):
         """ unpacks iwstruct data """
-        iwstruct = Iwstruct()
-        iwqual = Iwquality()
-        iwstats_data = iwstruct.parse_data(self.fmt, data)
+        iwstats_data = unpackFrom(self.fmt, data)
         
         self.status = iwstats_data[0:2]
         self.qual.quality, self.qual.siglevel, self.qual.nlevel, \
@@ -717,10 +1019,9 @@ class Iwquality(object):
         self.updated = 0
         self.fmt = "4B"
 
-    def parse(self, data):
+    def parse(self, data, offset=0):
         """ unpacks iwquality data """
-        iwstruct = Iwstruct()
-        qual, siglevel, nlevel, iwflags = iwstruct.parse_data(self.fmt, data)
+        qual, siglevel, nlevel, iwflags = unpackFrom(self.fmt, data, offset)
 
         # compute signal and noise level
         self.siglevel = siglevel
@@ -799,20 +1100,56 @@ class Iwpoint(object):
     def _parse(self, data):
         """ unpacks iwpoint data
         """
-        iwstruct = Iwstruct()
         ptr, ptr, ptr, ptr, self.fields, self.flags = \
-            iwstruct.parse_data(self.fmt, data)
+            unpackFrom(self.fmt, data)
         self.key = [ptr, ptr, ptr, ptr]
 
 
 class Iwrange(object):
-    """holds iwrange struct """
+    """holds iwrange struct
+
+       Range data practically never changes for an interface, so use
+       Iwrange.get() to share one instance per ifname instead of asking
+       the kernel every time, and Iwrange.invalidate() once the interface
+       went away or was reconfigured. watchLinks() does the latter as
+       rtnetlink reports the changes.
+    """
     IW_MAX_FREQUENCIES = 32
+    fmt = "iiihb6ii4B4Bi32i2i2i2i2i3h8h2b2bhi8i2b3h2i2ihB17x"\
+        + IW_MAX_FREQUENCIES*"ihbb"
+
+    _cache = {}
+    _cacheLock = threading.Lock()
+
+    @classmethod
+    def get(cls, ifname):
+        """returns the cached Iwrange of ifname, querying the kernel on
+           first use. Failed queries aren't cached.
+        """
+        iwrange = cls._cache.get(ifname)
+        if iwrange is None:
+            iwrange = cls(ifname)
+            if not iwrange.errorflag:
+                cls._cacheLock.acquire()
+                try:
+                    iwrange = cls._cache.setdefault(ifname, iwrange)
+                finally:
+                    cls._cacheLock.release()
+        return iwrange
+
+    @classmethod
+    def invalidate(cls, ifname=None):
+        """drops the cached Iwrange of ifname, or of all interfaces """
+        cls._cacheLock.acquire()
+        try:
+            if ifname is None:
+                cls._cache.clear()
+            else:
+                cls._cache.pop(ifname, None)
+        finally:
+            cls._cacheLock.release()
 
     def __init__(self, ifname):
-        self.fmt = "iiihb6ii4B4Bi32i2i2i2i2i3h8h2b2bhi8i2b3h2i2ihB17x"\
-            + self.IW_MAX_FREQUENCIES*"ihbb"
-        
         self.ifname = ifname
         self.errorflag = 0
         self.error = ""
@@ -885,8 +1222,9 @@ class Iwrange(object):
         self._parse(data)
         
     def _parse(self, data):
-        iwstruct = Iwstruct()
-        result = iwstruct.parse_data(self.fmt, data)
+        result = unpackFrom(self.fmt, data)
+        self.bitrates = []
+        self.frequencies = []
         
         # XXX there is maybe a much more elegant way to do this
         self.throughput, self.min_nwid, self.max_nwid = result[0:3]
@@ -934,47 +1272,279 @@ class Iwrange(object):
                 break
 
 
-class Iwscan(object):
-    """class to handle AP scanning"""
-    
+def _linkChanged(ifname, event):
+    Iwrange.invalidate(ifname)
+
+def watchLinks():
+    """starts the shared Discovery (see discovery.py), dropping the cached
+       Iwrange of interfaces as they change. Discovery.stop() ends it.
+    """
+    shared = discovery.getDiscovery()
+    shared.start(_linkChanged)
+    return shared
+
+
+class ScanEvents(object):
+    """Listens on rtnetlink for the wireless event the kernel sends once
+       a scan has completed, so waiting for results doesn't need polling.
+
+       Open it before triggering the scan, or the event may be missed.
+    """
+
+    _header = struct.Struct('IHHII')
+    _ifinfo = struct.Struct('BxHiII')
+    _attr = struct.Struct('HH')
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                  NETLINK_ROUTE)
+        self.sock.bind((0, RTMGRP_LINK))
+
+    def wait(self, ifindex, timeout):
+        """waits up to timeout seconds for a scan complete event of
+           ifindex, returns True if it arrived
+        """
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            readable = select.select([self.sock], [], [], remaining)[0]
+            if not readable:
+                return False
+            if self.scanCompleted(self.sock.recv(65536), ifindex):
+                return True
+
+    def scanCompleted(self, data, ifindex):
+        """True if the netlink messages in data hold a scan complete
+           event of ifindex
+        """
+        offset = 0
+        while len(data) - offset >= NLMSG_HDRLEN:
+            length, msgtype = self._header.unpack_from(data, offset)[:2]
+            if length < NLMSG_HDRLEN:
+                break
+            end = offset + length
+            body = offset + NLMSG_HDRLEN
+            if msgtype == RTM_NEWLINK and \
+                    self._ifinfo.unpack_from(data, body)[2] == ifindex:
+                attr = body + IFINFOMSG_LEN
+                while end - attr >= 4:
+                    alen, atype = self._attr.unpack_from(data, attr)
+                    if alen < 4:
+                        break
+                    if atype == IFLA_WIRELESS and \
+                            self._hasScanEvent(data, attr + 4, attr + alen):
+                        return True
+                    attr += (alen + 3) & ~3
+            offset += (length + 3) & ~3
+        return False
+
+    def _hasScanEvent(self, data, offset, end):
+        while end - offset >= pythonwifi.flags.IW_EV_LCP_LEN:
+            length, cmd = self._attr.unpack_from(data, offset)
+            if cmd == pythonwifi.flags.SIOCGIWSCAN:
+                return True
+            if length < pythonwifi.flags.IW_EV_LCP_LEN:
+                break
+            offset += length
+        return False
+
+    def close(self):
+        self.sock.close()
+
+
+class _ScanWorker(object):
+    """Runs the ScanRequests of one interface one after the other on a
+       single daemon thread, which keeps its ioctl buffers between scans.
+    """
+
     def __init__(self, ifname):
+        self.pid = os.getpid()
+        self.queue = Queue.Queue()
+        self._thread = threading.Thread(target=self._run,
+                                        name="Scan %s" % ifname)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            request = self.queue.get()
+            try:
+                request._run()
+            except Exception:
+                traceback.print_exc() # a failing callback
+            request = None
+
+
+_scanWorkers = {}
+_scanWorkersLock = threading.Lock()
+
+def _getScanWorker(ifname):
+    """returns the _ScanWorker of ifname, starting it on first use (and
+       again after a fork, which leaves the threads behind)
+    """
+    _scanWorkersLock.acquire()
+    try:
+        worker = _scanWorkers.get(ifname)
+        if worker is None or worker.pid != os.getpid():
+            worker = _scanWorkers[ifname] = _ScanWorker(ifname)
+        return worker
+    finally:
+        _scanWorkersLock.release()
+
+
+class ScanRequest(object):
+    """A scan running in the background, returned by Iwscan.scanAsync()
+
+       The scans of an interface are run one after the other by a worker
+       thread of that interface, different interfaces scan concurrently.
+
+       >>> request = Iwscan('wlan0').scanAsync()
+       >>> request.result(timeout=10)
+       [<Iwscanresult ...>, ...]
+    """
+
+    def __init__(self, iwscan, fullscan, timeout, callback=None):
+        self.iwscan = iwscan
+        self.fullscan = fullscan
+        self.timeout = timeout
+        self.callback = callback
+        self.aplist = None
+        self.exception = None
+        self.finished = None # time.time() the scan ended at
+        self._done = threading.Event()
+        _getScanWorker(iwscan.ifname).queue.put(self)
+
+    def _run(self):
+        try:
+            self.aplist = self.iwscan.scan(self.fullscan, self.timeout)
+        except Exception, e:
+            self.exception = e
+        self.finished = time.time()
+        self._done.set()
+        if self.callback is not None:
+            self.callback(self)
+
+    def done(self):
+        return self._done.is_set()
+
+    def result(self, timeout=None):
+        """waits for the scan and returns its results, re-raising the
+           exception if it failed
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError("scan of %s still running" % self.iwscan.ifname)
+        if self.exception is not None:
+            raise self.exception
+        return self.aplist
+
+
+class Iwscan(object):
+    """class to handle AP scanning
+
+       Waiting for results backs off exponentially from SCAN_POLL_MIN to
+       SCAN_POLL_MAX seconds between polls, and is cut short by the scan
+       complete event if useEvents is set and rtnetlink is available.
+    """
+
+    SCAN_TIMEOUT = 10.0
+    SCAN_POLL_MIN = 0.05
+    SCAN_POLL_MAX = 1.0
+
+    def __init__(self, ifname, useEvents=True):
         self.ifname = ifname
-        self.range = Iwrange(ifname)
+        self.range = Iwrange.get(ifname)
         self.errorflag = 0
         self.error = ""
         self.stream = None
         self.aplist = None
+        self.useEvents = useEvents
                 
-    def scan(self, fullscan=True):
+    def scan(self, fullscan=True, timeout=None):
         """Completes a scan for available access points,
            and returns them in Iwscanresult format
            
            fullscan: If False, data is read from a cache of the last scan
                      If True, a scan is conducted, and then the data is read
+           timeout:  seconds to wait for results before raising a
+                     RuntimeError, SCAN_TIMEOUT by default
         """
+        self._waitForScan(fullscan, timeout)
+        return self.aplist
+
+    def iterScan(self, fullscan=True, timeout=None):
+        """Like scan(), but yields the Iwscanresult objects while the
+           event stream is being parsed
+        """
+        self._waitForScan(fullscan, timeout, parse=False)
+        return parseScanEvents(self.stream, self.range)
+
+    def scanAsync(self, fullscan=True, timeout=None, callback=None):
+        """Runs scan() in the background and returns a ScanRequest
+           for its results. callback, if given, is called with the
+           ScanRequest once it is done.
+        """
+        return ScanRequest(self, fullscan, timeout, callback)
+
+    def _openEvents(self):
+        if not self.useEvents:
+            return None, None
+        ifindex = getIfindex(self.ifname)
+        if isinstance(ifindex, tuple):
+            return None, None
+        try:
+            return ScanEvents(), ifindex
+        except (socket.error, AttributeError):
+            # no rtnetlink (or no AF_NETLINK at all), poll with backoff
+            return None, None
+
+    def _waitForScan(self, fullscan, timeout=None, parse=True):
+        """Triggers a scan (if fullscan) and waits until its results
+           have been read into self.stream
+        """
+        if timeout is None:
+            timeout = self.SCAN_TIMEOUT
+        deadline = time.time() + timeout
+        events = ifindex = None
         # By default everything is fine, do not wait
-        result = 1
+        delay = 0
         if fullscan:
+            events, ifindex = self._openEvents()
             self.setScan()
             if self.errorflag > pythonwifi.flags.EPERM:
+                if events is not None:
+                    events.close()
                 errormsg = "setScan failure %s %s" % (str(self.errorflag),
                                                    str(self.error))
                 raise RuntimeError(errormsg)
-                return None
             elif self.errorflag < pythonwifi.flags.EPERM:
                 # Permission was NOT denied, therefore we must WAIT to get results
-                result = 250
-        
-        while (result > 0):
-            time.sleep(result/1000)
-            result = self.getScan()
+                delay = self.SCAN_POLL_MIN
+
+        try:
+            while True:
+                if delay:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise RuntimeError("scan of %s timed out after %ss" %
+                                           (self.ifname, timeout))
+                    if events is not None:
+                        events.wait(ifindex, min(delay, remaining))
+                    else:
+                        time.sleep(min(delay, remaining))
+                result = self.getScan(parse)
+                if not result > 0:
+                    break
+                delay = min(max(delay * 2, self.SCAN_POLL_MIN),
+                            self.SCAN_POLL_MAX)
+        finally:
+            if events is not None:
+                events.close()
         
         if result < 0 or self.errorflag != 0:
             raise RuntimeError, 'getScan failure ' + str(self.errorflag) + " " + str(self.error)
         
-        return self.aplist
-        
-        
     def setScan(self):
         """Triggers the scan, if we have permission
         """
@@ -987,10 +1557,13 @@ class Iwscan(object):
             self.error = result
         return result
         
-    def getScan(self):
+    def getScan(self, parse=True):
         """Retreives results, stored from the most recent scan
            Returns 0 if successful, a delay if the data isn't ready yet
            or -1 if something really nasty happened
+
+           The raw event stream is kept in self.stream, and unless parse
+           is False it is parsed into self.aplist.
         """
         iwstruct = Iwstruct()
         i = pythonwifi.flags.E2BIG
@@ -998,7 +1571,7 @@ class Iwscan(object):
 
         # Keep resizing the buffer until it's large enough to hold the scan
         while (i == pythonwifi.flags.E2BIG):
-            buff, datastr = iwstruct.pack_wrq(bufflen)
+            buff, datastr = iwstruct.pack_wrq(bufflen, "scan")
             i, result = iwstruct.iw_get_ext(self.ifname, 
                                             pythonwifi.flags.SIOCGIWSCAN,
                                             data=datastr)
@@ -1018,82 +1591,104 @@ class Iwscan(object):
 
         pbuff, reslen = iwstruct.unpack('Pi', datastr)
         if reslen > 0:
-            # Initialize the stream, and turn it into an enumerator
-            self.aplist = self._parse(buff.tostring())
+            # copy the events out once, the ioctl buffer gets reused
+            self.stream = buff.tostring()[:reslen]
+            if parse:
+                self.aplist = self._parse(self.stream)
             return 0
 
     def _parse(self, data):
         """Parse the event stream, and return a list of Iwscanresult objects
         """
-        iwstruct = Iwstruct()
-        scanresult = None
-        aplist = []
-
-        # Run through the stream, until broken
-        while 1:
-            # If we're the stream doesn't have enough space left for a
-            # header, break
-            if len(data) < pythonwifi.flags.IW_EV_LCP_LEN:
-                break;
-
-            # Unpack the header
-            length, cmd = iwstruct.unpack('HH', data[:4])
-            # If the header says the following data is shorter than the
-            # header, then break
-            if length < pythonwifi.flags.IW_EV_LCP_LEN:
-                break;
-
-            # Put the events into their respective result data
-            if cmd == pythonwifi.flags.SIOCGIWAP:
-                if scanresult is not None:
-                    aplist.append(scanresult)
-                scanresult = Iwscanresult(
-                    data[pythonwifi.flags.IW_EV_LCP_LEN:length], self.range)
-            elif scanresult is None:
-                raise RuntimeError, 'Attempting to add an event without AP data'
-            else:
-                scanresult.addEvent(cmd,
-                                    data[pythonwifi.flags.IW_EV_LCP_LEN:length])
+        return list(parseScanEvents(data, self.range))
+
 
-            # We're finished with the preveious event
-            data = data[length:]
+_eventHeader = struct.Struct('HH')
 
-        if scanresult is None:
-            raise RuntimeError(
-                "No scanresult. You probably don't have permissions to scan.")
+def parseScanEvents(data, iwrange=None):
+    """Parses a SIOCGIWSCAN event stream, yielding an Iwscanresult for
+       each access point as soon as all of its events have been read.
 
-        # Don't forgset the final result
-        if scanresult.bssid != "00:00:00:00:00:00":
-            aplist.append(scanresult)
+       The stream is walked by offset through a memoryview, and the
+       results only keep the offsets of their events in it, so nothing is
+       copied while parsing.
+    """
+    view = memoryview(data)
+    size = len(view)
+    lcp = pythonwifi.flags.IW_EV_LCP_LEN
+    unpack = _eventHeader.unpack_from
+    scanresult = None
+    offset = 0
+
+    # Run through the stream, until broken
+    while size - offset >= lcp:
+        length, cmd = unpack(view, offset)
+        # If the header says the following data is shorter than the
+        # header, then break
+        if length < lcp:
+            break
+
+        # Put the events into their respective result data
+        if cmd == pythonwifi.flags.SIOCGIWAP:
+            if scanresult is not None:
+                yield scanresult
+            scanresult = Iwscanresult(data, iwrange, offset + lcp)
+        elif scanresult is None:
+            raise RuntimeError, 'Attempting to add an event without AP data'
         else:
-            raise RuntimeError, 'Attempting to add an AP without a bssid'
-        return aplist
+            scanresult.addEvent(cmd, data, offset + lcp, offset + length)
+
+        # We're finished with the previous event
+        offset += length
+
+    if scanresult is None:
+        raise RuntimeError(
+            "No scanresult. You probably don't have permissions to scan.")
+
+    # Don't forget the final result
+    if scanresult.bssid != "00:00:00:00:00:00":
+        yield scanresult
+    else:
+        raise RuntimeError, 'Attempting to add an AP without a bssid'
 
 
 class Iwscanresult(object):
     """An object to contain all the events associated with a single scanned AP
+
+       Only the bssid is decoded up front. The other events are kept as
+       (data, start, end) references into the scan stream, and decoded
+       (once) when their attribute is first read. Events this class
+       doesn't know are counted in self.unknown, and can still be read
+       with getEvents().
     """
-    
-    def __init__(self, data, iwrange):
-        """Initialize the scan result with the access point data"""
-        self.iwstruct = Iwstruct()
+
+    __slots__ = ('range', 'bssid', 'events', 'unknown', '_decoded')
+
+    def __init__(self, data, iwrange, start=0):
+        """Initialize the scan result with the access point data, which
+           starts at data[start]"""
         self.range = iwrange
         self.bssid = "%02X:%02X:%02X:%02X:%02X:%02X" % (
-            struct.unpack('BBBBBB', data[2:8]))
-        self.essid = None
-        self.mode = None
-        self.rate = []
-        self.quality = Iwquality() 
-        self.frequency = None
-        self.encode = None
-        self.custom = []
-        self.protocol = None
-
-    def addEvent(self, cmd, data):
+            unpackFrom('6B', data, start + 2))
+        self.events = {} # cmd -> [(data, start, end), ...]
+        self.unknown = 0
+        self._decoded = {}
+
+    _known = frozenset([
+        pythonwifi.flags.SIOCGIWESSID, pythonwifi.flags.SIOCGIWMODE,
+        pythonwifi.flags.SIOCGIWRATE, pythonwifi.flags.IWEVQUAL,
+        pythonwifi.flags.SIOCGIWFREQ, pythonwifi.flags.SIOCGIWENCODE,
+        pythonwifi.flags.IWEVCUSTOM, pythonwifi.flags.SIOCGIWNAME,
+        pythonwifi.flags.IWEVGENIE])
+
+    def addEvent(self, cmd, data, start=0, end=None):
         """Attempts to add the data from an event to a scanresult
            Only certain data is accept, in which case the result is True
            If the event data is invalid, None is returned
            If the data is valid but unused, False is returned
+
+           data[start:end] is the event payload, so a whole scan stream
+           can be passed without slicing it.
         """
         if cmd <= pythonwifi.flags.SIOCIWLAST:
             if cmd < pythonwifi.flags.SIOCIWFIRST:
@@ -1103,32 +1698,102 @@ class Iwscanresult(object):
                 return None
         else:
             return None
-            
-        if cmd == pythonwifi.flags.SIOCGIWESSID:
-            self.essid = data[4:]
-        elif cmd == pythonwifi.flags.SIOCGIWMODE:
-            self.mode = data[self.iwstruct.unpack('i', data[:4])[0]]
-        elif cmd == pythonwifi.flags.SIOCGIWRATE:
-            # TODO, deal with multiple rates, or at least the highest rate
-            freqsize = struct.calcsize("ihbb")
-            while len(data) >= freqsize:
-                iwfreq = Iwfreq(data)
-                self.rate.append(iwfreq.getBitrate())
-                data = data[freqsize:]
-        elif cmd == pythonwifi.flags.IWEVQUAL:
-            self.quality.parse(data)
-        elif cmd == pythonwifi.flags.SIOCGIWFREQ:
-            self.frequency = Iwfreq(data)
-        elif cmd == pythonwifi.flags.SIOCGIWENCODE:
-            self.encode = data
-        elif cmd == pythonwifi.flags.IWEVCUSTOM:
-            self.custom.append(data[1:])
-        elif cmd == pythonwifi.flags.SIOCGIWNAME:
-            self.protocol = data[:len(data)-2]
-        else:
-            print "Cmd:", cmd
-            return False
-        return True
+
+        if end is None:
+            end = len(data)
+        try:
+            self.events[cmd].append((data, start, end))
+        except KeyError:
+            self.events[cmd] = [(data, start, end)]
+        if cmd in self._known:
+            return True
+        self.unknown += 1
+        return False
+
+    def getEvents(self, cmd):
+        """returns the payloads of all events of type cmd """
+        return [data[start:end] for data, start, end in self.events.get(cmd, ())]
+
+    def _last(self, cmd):
+        events = self.events.get(cmd)
+        if events:
+            return events[-1]
+        return None, 0, 0
+
+    def _decode(self, name, decoder):
+        try:
+            return self._decoded[name]
+        except KeyError:
+            value = self._decoded[name] = decoder()
+            return value
+
+    def _essid(self):
+        data, start, end = self._last(pythonwifi.flags.SIOCGIWESSID)
+        if data is None:
+            return None
+        return data[start + 4:end]
+
+    def _mode(self):
+        data, start, end = self._last(pythonwifi.flags.SIOCGIWMODE)
+        if data is None:
+            return None
+        mode = unpackFrom('i', data, start)
+        try:
+            return pythonwifi.flags.modes[mode]
+        except IndexError:
+            return mode
+
+    def _rate(self):
+        rates = []
+        freqsize = getStruct(Iwfreq.fmt).size
+        for data, start, end in self.events.get(pythonwifi.flags.SIOCGIWRATE, ()):
+            for offset in xrange(start, end - freqsize + 1, freqsize):
+                rates.append(Iwfreq(data, offset).getBitrate())
+        return rates
+
+    def _quality(self):
+        quality = Iwquality()
+        data, start, end = self._last(pythonwifi.flags.IWEVQUAL)
+        if data is not None:
+            quality.parse(data, start)
+        return quality
+
+    def _frequency(self):
+        data, start, end = self._last(pythonwifi.flags.SIOCGIWFREQ)
+        if data is None:
+            return None
+        return Iwfreq(data, start)
+
+    def _encode(self):
+        data, start, end = self._last(pythonwifi.flags.SIOCGIWENCODE)
+        if data is None:
+            return None
+        return data[start:end]
+
+    def _custom(self):
+        # iw_point payloads: length and flags, then the text
+        return [data[start + 4:end] for data, start, end
+                in self.events.get(pythonwifi.flags.IWEVCUSTOM, ())]
+
+    def _ies(self):
+        return ''.join(data[start + 4:end] for data, start, end
+                       in self.events.get(pythonwifi.flags.IWEVGENIE, ()))
+
+    def _protocol(self):
+        data, start, end = self._last(pythonwifi.flags.SIOCGIWNAME)
+        if data is None:
+            return None
+        return data[start:end - 2]
+
+    essid = property(lambda self: self._decode('essid', self._essid))
+    mode = property(lambda self: self._decode('mode', self._mode))
+    rate = property(lambda self: self._decode('rate', self._rate))
+    quality = property(lambda self: self._decode('quality', self._quality))
+    frequency = property(lambda self: self._decode('frequency', self._frequency))
+    encode = property(lambda self: self._decode('encode', self._encode))
+    custom = property(lambda self: self._decode('custom', self._custom))
+    ies = property(lambda self: self._decode('ies', self._ies))
+    protocol = property(lambda self: self._decode('protocol', self._protocol))
 
     def display(self):
         print "ESSID:", self.essid
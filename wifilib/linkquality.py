@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+#
+# linkquality.py
+# Samples link quality (SIOCGIWSTATS) of one or more interfaces on a
+# background thread and keeps a fixed amount of history for each.
+#
+# Every series is a preallocated ring buffer of doubles, so memory stays
+# flat however long the sampler runs. Alongside the values each ring
+# keeps a sum, a min and a max segment tree (mean/min/max over any window
+# in O(log n)). Series with a known value range (quality, signal, noise)
+# also keep a histogram of their quantized values which answers
+# percentiles over any window in O(log n), see _Histogram; percentiles of
+# the other series sort a copy of the window.
+#
+# Sample times come from a monotonic clock, window() bisects them.
+#
+# >>> sampler = LinkSampler(['wlan0'], rate=10, history=300)
+# >>> sampler.start()
+# >>> link = sampler.histories['wlan0']
+# >>> link.signal.mean(link.window(10)), link.signal.min(link.window(60))
+# (-52.3, -61.0)
+# >>> link.signal.percentile(90, link.window(60))
+# -49.0
+
+import bisect
+import operator
+import threading
+from array import array
+
+import pythonwifi.flags
+from interfaces import Iwstruct, Iwstats
+from clock import monotonic
+
+
+INFINITY = float('inf')
+
+
+class _SegmentTree(object):
+    """min or max over ranges of ring positions"""
+
+    def __init__(self, capacity, combine, empty):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.size = size
+        self.combine = combine
+        self.empty = empty
+        self.tree = array('d', [empty]) * (2 * size)
+
+    def set(self, index, value):
+        tree = self.tree
+        combine = self.combine
+        i = index + self.size
+        tree[i] = value
+        i >>= 1
+        while i:
+            tree[i] = combine(tree[2 * i], tree[2 * i + 1])
+            i >>= 1
+
+    def query(self, lo, hi):
+        """combines positions [lo, hi) """
+        tree = self.tree
+        combine = self.combine
+        result = self.empty
+        lo += self.size
+        hi += self.size
+        while lo < hi:
+            if lo & 1:
+                result = combine(result, tree[lo])
+                lo += 1
+            if hi & 1:
+                hi -= 1
+                result = combine(result, tree[hi])
+            lo >>= 1
+            hi >>= 1
+        return result
+
+
+class _Histogram(object):
+    """Counts of the values appended to a RingSeries, quantized to
+    `step` wide buckets from lo to hi (values outside are counted in the
+    first or last bucket), for percentiles over the last n samples.
+
+    A Fenwick tree holds the counts of all values appended so far and is
+    copied every `block` samples. The counts of a window are the tree
+    minus the copy taken at the first block boundary inside the window,
+    plus the (fewer than block) samples between the window start and that
+    boundary, so the k-th smallest is found in one descent of the tree.
+    """
+
+    def __init__(self, capacity, lo, hi, step=1.0, block=64):
+        self.lo = lo
+        self.step = step
+        self.buckets = int((hi - lo) / step) + 1
+        self.block = block
+        # enough copies to cover a full ring, whatever its alignment
+        self.slots = capacity // block + 3
+        self.size = self.buckets + 1
+        self.tree = array('l', [0]) * self.size
+        self.copies = array('l', [0]) * (self.size * self.slots)
+        top = 1
+        while top * 2 <= self.buckets:
+            top *= 2
+        self.top = top
+
+    def bucket(self, value):
+        bucket = int(round((value - self.lo) / self.step))
+        return min(max(bucket, 0), self.buckets - 1)
+
+    def add(self, count, value):
+        """adds the value appended after count others """
+        tree = self.tree
+        i = self.bucket(value) + 1
+        while i < self.size:
+            tree[i] += 1
+            i += i & -i
+        count += 1
+        if count % self.block == 0:
+            slot = (count // self.block) % self.slots
+            self.copies[slot * self.size:(slot + 1) * self.size] = tree
+
+    def kth(self, boundary, extra, k):
+        """value of the k-th (from 1) smallest of the samples appended
+           since the copy at boundary, plus the sorted buckets extra """
+        tree = self.tree
+        copies = self.copies
+        base = (boundary // self.block) % self.slots * self.size
+        left = bisect.bisect_left
+        pos = 0
+        step = self.top
+        while step:
+            nxt = pos + step
+            if nxt < self.size:
+                # buckets [pos, nxt)
+                n = tree[nxt] - copies[base + nxt] + \
+                    left(extra, nxt) - left(extra, pos)
+                if n < k:
+                    pos = nxt
+                    k -= n
+            step >>= 1
+        return self.lo + pos * self.step
+
+
+class RingSeries(object):
+    """The last `capacity` values of one measurement.
+
+    Windows are given as a number of samples, counting back from the most
+    recent one (see LinkHistory.window() to turn seconds into samples).
+    histogram=(lo, hi[, step]) makes percentiles O(log n), on values
+    quantized to step, see _Histogram.
+    """
+
+    def __init__(self, capacity, histogram=None):
+        self.capacity = capacity
+        self.values = array('d', [0.0]) * capacity
+        self.count = 0 # values appended in total
+        # the sum tree recomputes every node from its children, so unlike
+        # a running total it doesn't lose precision however long it runs
+        self._sum = _SegmentTree(capacity, operator.add, 0.0)
+        self._min = _SegmentTree(capacity, min, INFINITY)
+        self._max = _SegmentTree(capacity, max, -INFINITY)
+        self._histogram = None
+        if histogram is not None:
+            self._histogram = _Histogram(capacity, *histogram)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, value):
+        pos = self.count % self.capacity
+        self.values[pos] = value
+        self._sum.set(pos, value)
+        self._min.set(pos, value)
+        self._max.set(pos, value)
+        if self._histogram is not None:
+            self._histogram.add(self.count, value)
+        self.count += 1
+
+    def _clip(self, samples):
+        n = len(self)
+        if samples is None or samples > n:
+            return n
+        return samples
+
+    def last(self):
+        if not self.count:
+            return None
+        return self.values[(self.count - 1) % self.capacity]
+
+    def mean(self, samples=None):
+        samples = self._clip(samples)
+        if not samples:
+            return None
+        total = sum(self._sum.query(lo, hi) for lo, hi in self._ranges(samples))
+        return total / samples
+
+    def _ranges(self, samples):
+        """ring position ranges [lo, hi) holding the last samples values """
+        end = self.count % self.capacity or self.capacity
+        start = end - samples
+        if start >= 0:
+            return ((start, end),)
+        return ((start + self.capacity, self.capacity), (0, end))
+
+    def min(self, samples=None):
+        samples = self._clip(samples)
+        if not samples:
+            return None
+        return min(self._min.query(lo, hi) for lo, hi in self._ranges(samples))
+
+    def max(self, samples=None):
+        samples = self._clip(samples)
+        if not samples:
+            return None
+        return max(self._max.query(lo, hi) for lo, hi in self._ranges(samples))
+
+    def window(self, samples=None):
+        """returns the last samples values, oldest first """
+        samples = self._clip(samples)
+        result = array('d')
+        for lo, hi in self._ranges(samples) if samples else ():
+            result.extend(self.values[lo:hi])
+        return result
+
+    def percentile(self, p, samples=None):
+        """nearest rank percentile (0-100) of the last samples values.
+           O(log n) with a histogram (quantized), else sorts the window.
+        """
+        samples = self._clip(samples)
+        if not samples:
+            return None
+        rank = int(round(p / 100.0 * (samples - 1)))
+        histogram = self._histogram
+        if histogram is not None:
+            start = self.count - samples
+            block = histogram.block
+            boundary = -(-start // block) * block
+            if boundary < self.count:
+                extra = sorted(histogram.bucket(self.values[i % self.capacity])
+                               for i in xrange(start, boundary))
+                return histogram.kth(boundary, extra, rank + 1)
+        return sorted(self.window(samples))[rank]
+
+
+class LinkHistory(object):
+    """History of one interface: a RingSeries per measurement and the
+       sample times. Discard counters are kept as sampled (cumulative)."""
+
+    SERIES = ('quality', 'signal', 'noise', 'nwid', 'code', 'fragment',
+              'retries', 'misc', 'missedBeacon')
+    # value ranges of iw_quality, for O(log n) percentiles
+    HISTOGRAMS = {'quality': (0, 255), 'signal': (-256, -1),
+                  'noise': (-256, -1)}
+
+    def __init__(self, ifname, capacity):
+        self.ifname = ifname
+        self.capacity = capacity
+        self.times = RingSeries(capacity)
+        for name in self.SERIES:
+            setattr(self, name, RingSeries(capacity,
+                                           self.HISTOGRAMS.get(name)))
+        self.errors = 0
+
+    def add(self, now, iwstats):
+        qual = iwstats.qual
+        discard = iwstats.discard
+        self.quality.append(qual.quality)
+        self.signal.append(qual.signallevel)
+        self.noise.append(qual.noiselevel)
+        self.nwid.append(discard['nwid'])
+        self.code.append(discard['code'])
+        self.fragment.append(discard['fragment'])
+        self.retries.append(discard['retries'])
+        self.misc.append(discard['misc'])
+        self.missedBeacon.append(iwstats.missed_beacon)
+        self.times.append(now) # last, so readers never see a partial sample
+
+    def window(self, seconds, now=None):
+        """returns how many of the samples are at most seconds old """
+        times = self.times
+        n = len(times)
+        if not n:
+            return 0
+        if now is None:
+            now = times.last()
+        limit = now - seconds
+        # the times are ascending from the oldest sample on, find the
+        # first one within the window across the (up to) two ring runs
+        older = 0
+        for lo, hi in times._ranges(n):
+            i = bisect.bisect_left(times.values, limit, lo, hi)
+            if i < hi:
+                return n - older - (i - lo)
+            older += hi - lo
+        return 0
+
+
+class LinkSampler(object):
+    """Polls SIOCGIWSTATS of every interface `rate` times a second,
+       keeping `history` seconds of samples per interface.
+    """
+
+    def __init__(self, ifnames, rate=10.0, history=300.0, clock=monotonic):
+        self.rate = rate
+        self.interval = 1.0 / rate
+        self.clock = clock
+        capacity = max(1, int(rate * history))
+        self.histories = dict((ifname, LinkHistory(ifname, capacity))
+                              for ifname in ifnames)
+        self._thread = None
+        self._stop = threading.Event()
+
+    def sample(self, now=None):
+        """Takes one sample of every interface."""
+        if now is None:
+            now = self.clock()
+        iwstruct = Iwstruct()
+        for ifname, history in self.histories.iteritems():
+            buff, datastr = iwstruct.pack_wrq(32)
+            status, result = iwstruct.iw_get_ext(ifname,
+                                                 pythonwifi.flags.SIOCGIWSTATS,
+                                                 data=datastr)
+            if status > 0:
+                history.errors += 1
+                continue
+            history.add(now, Iwstats(ifname, buff.tostring()))
+
+    def run(self):
+        """Samples until stop() is called."""
+        deadline = self.clock()
+        while not self._stop.isSet():
+            self.sample()
+            deadline += self.interval
+            delay = deadline - self.clock()
+            if delay < 0:
+                # fell behind, don't try to catch up with a burst
+                deadline = self.clock()
+                delay = 0
+            self._stop.wait(delay)
+
+    def start(self):
+        """Runs the sampler on a daemon thread and returns immediately."""
+        if self._thread is not None and self._thread.isAlive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run,
+                                        name="LinkSampler")
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# macaddr.py
+# MAC addresses as 48 bit integers, cached display strings and OUI vendor
+# lookup.
+#
+# Frames carry addresses as 6 byte strings. Converting them to ints once
+# gives cheap hashing and comparison for anything keyed by address, and
+# formatMac() only builds each display string once.
+#
+# Vendor names come from a file in the IEEE oui.txt format. A small one is
+# bundled next to this module; point OUI_PATH (or loadOui()) at the full
+# list from http://standards-oui.ieee.org/oui/oui.txt for real coverage.
+# The file is only read on the first vendor() call.
+
+import os
+import re
+import bisect
+import struct
+import array
+import threading
+
+BROADCAST = 0xFFFFFFFFFFFF
+OUI_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "oui.txt")
+
+_MAC = struct.Struct('>HI')
+_FORMAT_CACHE_SIZE = 1 << 16
+_formatCache = {}
+
+
+def macToInt(addr):
+	"""Converts a 6 byte address string to an int. Anything else (missing
+	   addresses, truncated frames) gives None."""
+	if isinstance(addr, str) and len(addr) == 6:
+		hi, lo = _MAC.unpack(addr)
+		return (hi << 32) | lo
+	return None
+
+def intToMac(value):
+	"""Converts an int back to the 6 byte string used in frames."""
+	return _MAC.pack(value >> 32, value & 0xFFFFFFFF)
+
+def formatMac(value):
+	"""Returns 'aa:bb:cc:dd:ee:ff' for an int (or 6 byte string) address."""
+	if isinstance(value, str):
+		value = macToInt(value)
+	if value is None:
+		return None
+	text = _formatCache.get(value)
+	if text is None:
+		if len(_formatCache) >= _FORMAT_CACHE_SIZE:
+			_formatCache.clear()
+		text = _formatCache[value] = ':'.join(
+			'%02x' % ((value >> shift) & 0xFF) for shift in (40, 32, 24, 16, 8, 0))
+	return text
+
+def parseMac(text):
+	"""Converts 'aa:bb:cc:dd:ee:ff' (or with '-' separators) to an int."""
+	return int(text.replace(':', '').replace('-', ''), 16)
+
+def isMulticast(value):
+	return bool((value >> 40) & 0x01)
+
+def isLocal(value):
+	"""True for locally administered (e.g. randomised) addresses."""
+	return bool((value >> 40) & 0x02)
+
+
+_OUI_LINE = re.compile(r'^([0-9A-Fa-f]{2})-([0-9A-Fa-f]{2})-([0-9A-Fa-f]{2})\s+\(hex\)\s+(.*?)\s*$')
+
+class OuiTable(object):
+	"""Sorted array of 24 bit prefixes with a parallel list of vendor names."""
+
+	def __init__(self, path=None):
+		self.path = path or OUI_PATH
+		self.prefixes = None
+		self.vendors = None
+		self._lock = threading.Lock()
+
+	def load(self):
+		entries = {}
+		fp = open(self.path, 'r')
+		try:
+			for line in fp:
+				m = _OUI_LINE.match(line)
+				if m:
+					prefix = int(m.group(1) + m.group(2) + m.group(3), 16)
+					entries[prefix] = m.group(4)
+		finally:
+			fp.close()
+		names = {} # share the strings of vendors with many prefixes
+		prefixes = array.array('I')
+		vendors = []
+		for prefix in sorted(entries):
+			prefixes.append(prefix)
+			vendors.append(names.setdefault(entries[prefix], entries[prefix]))
+		self.vendors = vendors
+		self.prefixes = prefixes
+
+	def lookup(self, value):
+		"""Returns the vendor name for an address (int or 6 byte string)."""
+		if self.prefixes is None:
+			self._lock.acquire()
+			try:
+				if self.prefixes is None:
+					self.load()
+			finally:
+				self._lock.release()
+		if isinstance(value, str):
+			value = macToInt(value)
+		if value is None:
+			return None
+		oui = value >> 24
+		i = bisect.bisect_left(self.prefixes, oui)
+		if i < len(self.prefixes) and self.prefixes[i] == oui:
+			return self.vendors[i]
+		return None
+
+
+_table = OuiTable()
+
+def loadOui(path):
+	"""Switches vendor() to another oui.txt, e.g. the full IEEE list."""
+	global _table
+	_table = OuiTable(path)
+
+def vendor(value):
+	"""Returns the vendor of an address, None if unknown."""
+	return _table.lookup(value)
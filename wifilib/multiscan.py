@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+#
+# multiscan.py
+# Scans on several radios at once and merges what they saw.
+#
+# Every interface is scanned in its own thread (scanAsync), so the
+# whole scan takes about as long as the slowest radio. APs heard by more
+# than one radio are merged by BSSID, keeping the result with the
+# strongest signal.
+#
+# >>> report = scanAll()
+# >>> for bssid, ap in report.aps.iteritems():
+# ...     print bssid, ap.essid, ap.quality.signallevel, report.seenBy[bssid]
+# >>> for ifname, timing in report.interfaces.iteritems():
+# ...     print ifname, timing.elapsed, timing.count, timing.error
+
+import time
+import Queue
+
+from interfaces import getScanner, getNICnames
+
+
+class InterfaceScan(object):
+    """Timing and outcome of the scan on one interface."""
+
+    __slots__ = ('ifname', 'started', 'elapsed', 'count', 'error')
+
+    def __init__(self, ifname, started):
+        self.ifname = ifname
+        self.started = started
+        self.elapsed = None
+        self.count = 0
+        self.error = None
+
+
+class ScanReport(object):
+    """Merged results of a scan over several interfaces.
+
+    aps:        bssid -> Iwscanresult with the best signal
+    seenBy:     bssid -> names of the interfaces which heard it
+    interfaces: ifname -> InterfaceScan
+    """
+
+    def __init__(self):
+        self.aps = {}
+        self.seenBy = {}
+        self.interfaces = {}
+        self.elapsed = None
+
+    def add(self, ifname, aplist):
+        for ap in aplist:
+            best = self.aps.get(ap.bssid)
+            if best is None:
+                self.aps[ap.bssid] = ap
+                self.seenBy[ap.bssid] = [ifname]
+                continue
+            self.seenBy[ap.bssid].append(ifname)
+            if ap.quality.signallevel > best.quality.signallevel:
+                self.aps[ap.bssid] = ap
+
+
+def iterScans(ifnames=None, fullscan=True, timeout=None, backend=None):
+    """Starts a scan on every interface (all of getNICnames() by default)
+       and yields (InterfaceScan, aplist) in the order they finish.
+       backend is passed on to getScanner().
+       aplist is None if the scan failed, the exception is in
+       InterfaceScan.error.
+    """
+    if ifnames is None:
+        ifnames = getNICnames()
+    done = Queue.Queue()
+    pending = {}
+    for ifname in ifnames:
+        timing = InterfaceScan(ifname, time.time())
+        try:
+            request = getScanner(ifname, backend).scanAsync(fullscan, timeout,
+                                                          done.put)
+        except Exception, e:
+            timing.elapsed = time.time() - timing.started
+            timing.error = e
+            yield timing, None
+            continue
+        pending[request] = timing
+
+    while pending:
+        request = done.get()
+        timing = pending.pop(request)
+        # when the scan ended, not when we got around to it
+        timing.elapsed = request.finished - timing.started
+        try:
+            aplist = request.result(0) or []
+        except Exception, e:
+            timing.error = e
+            yield timing, None
+            continue
+        timing.count = len(aplist)
+        yield timing, aplist
+
+def scanAll(ifnames=None, fullscan=True, timeout=None, backend=None):
+    """Scans on all interfaces concurrently, returns a ScanReport."""
+    started = time.time()
+    report = ScanReport()
+    for timing, aplist in iterScans(ifnames, fullscan, timeout, backend):
+        report.interfaces[timing.ifname] = timing
+        if aplist is not None:
+            report.add(timing.ifname, aplist)
+    report.elapsed = time.time() - started
+    return report
+
+
+if __name__ == "__main__":
+    import sys
+    report = scanAll(sys.argv[1:] or None)
+    for ifname in sorted(report.interfaces):
+        timing = report.interfaces[ifname]
+        print "%s: %d APs in %.2fs%s" % (ifname, timing.count, timing.elapsed,
+            " (%s)" % timing.error if timing.error else "")
+    for bssid in sorted(report.aps):
+        ap = report.aps[bssid]
+        print bssid, ap.essid, ap.quality.signallevel, ",".join(report.seenBy[bssid])
+    print "total %.2fs" % report.elapsed
@@ -0,0 +1,578 @@
+#!/usr/bin/env python
+#
+# nl80211.py
+# nl80211 backend, talking generic netlink to cfg80211 instead of going
+# through the Wireless Extensions ioctls, which modern drivers only
+# emulate (and which truncate IEs and know nothing about HT/VHT/HE).
+#
+# Covers scan trigger and dump, station info and interface info. Scans
+# look like Iwscan (see interfaces.getScanner()) and their results carry
+# the same attributes as Iwscanresult, plus the raw IEs.
+#
+# Replies are read into one reused buffer and a single recv() typically
+# holds many dump messages, which are all parsed by offset in one pass.
+#
+# The socket is injectable, so the code can run against recorded
+# messages instead of a kernel. The socket also hands out the socket scan
+# events are read from and maps interface names to indexes, so a replay
+# needs nothing from the machine it runs on:
+#
+# >>> nl = Nl80211(ReplaySocket(chunks, events, {'wlan0': 3}))
+# >>> nl.getInterfaces()
+#
+# and RecordingSocket() records such chunks from the real thing. Recorded
+# fixtures and the script checking them are in fixtures/nl80211/.
+
+import os
+import time
+import struct
+import select
+import socket
+import threading
+
+from interfaces import Iwquality, Iwfreq, ScanRequest, getIfindex
+
+
+NETLINK_GENERIC = 16
+SOL_NETLINK = 270
+NETLINK_ADD_MEMBERSHIP = 1
+
+NLM_F_REQUEST = 0x1
+NLM_F_MULTI = 0x2
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLA_TYPE_MASK = 0x3fff # strips the nested and byte order flags
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+CTRL_ATTR_MCAST_GROUPS = 7
+CTRL_ATTR_MCAST_GRP_NAME = 1
+CTRL_ATTR_MCAST_GRP_ID = 2
+
+# nl80211 commands
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_CMD_GET_STATION = 17
+NL80211_CMD_GET_SCAN = 32
+NL80211_CMD_TRIGGER_SCAN = 33
+NL80211_CMD_NEW_SCAN_RESULTS = 34
+NL80211_CMD_SCAN_ABORTED = 35
+
+# nl80211 attributes
+NL80211_ATTR_WIPHY = 1
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_IFTYPE = 5
+NL80211_ATTR_MAC = 6
+NL80211_ATTR_STA_INFO = 21
+NL80211_ATTR_WIPHY_FREQ = 38
+NL80211_ATTR_SCAN_SSIDS = 45
+NL80211_ATTR_BSS = 47
+
+NL80211_BSS_BSSID = 1
+NL80211_BSS_FREQUENCY = 2
+NL80211_BSS_TSF = 3
+NL80211_BSS_BEACON_INTERVAL = 4
+NL80211_BSS_CAPABILITY = 5
+NL80211_BSS_INFORMATION_ELEMENTS = 6
+NL80211_BSS_SIGNAL_MBM = 7
+NL80211_BSS_STATUS = 9
+NL80211_BSS_SEEN_MS_AGO = 10
+NL80211_BSS_BEACON_IES = 11
+
+NL80211_STA_INFO_INACTIVE_TIME = 1
+NL80211_STA_INFO_RX_BYTES = 2
+NL80211_STA_INFO_TX_BYTES = 3
+NL80211_STA_INFO_SIGNAL = 7
+NL80211_STA_INFO_TX_BITRATE = 8
+NL80211_STA_INFO_RX_PACKETS = 9
+NL80211_STA_INFO_TX_PACKETS = 10
+NL80211_STA_INFO_TX_RETRIES = 11
+NL80211_STA_INFO_TX_FAILED = 12
+NL80211_STA_INFO_SIGNAL_AVG = 13
+NL80211_STA_INFO_RX_BITRATE = 14
+
+NL80211_RATE_INFO_BITRATE = 1 # u16, 100kbit/s
+NL80211_RATE_INFO_BITRATE32 = 5 # u32, 100kbit/s
+
+IFTYPES = {
+    1: 'Ad-Hoc',
+    2: 'Managed',
+    3: 'Master',
+    4: 'AP VLAN',
+    5: 'WDS',
+    6: 'Monitor',
+    7: 'Mesh Point',
+    8: 'P2P Client',
+    9: 'P2P GO',
+}
+
+_nlmsghdr = struct.Struct('IHHII')
+_genlmsghdr = struct.Struct('BBH')
+_nlattr = struct.Struct('HH')
+_u8 = struct.Struct('B')
+_s8 = struct.Struct('b')
+_u16 = struct.Struct('H')
+_u32 = struct.Struct('I')
+_s32 = struct.Struct('i')
+_u64 = struct.Struct('Q')
+
+NLMSG_HDRLEN = _nlmsghdr.size
+GENL_HDRLEN = _genlmsghdr.size
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+def packAttr(atype, payload):
+    """returns a netlink attribute, padded to 4 bytes """
+    length = _nlattr.size + len(payload)
+    return _nlattr.pack(length, atype) + payload + '\0' * (_align(length) - length)
+
+def parseAttrs(data, offset=0, end=None):
+    """returns {type: payload} of the attributes in data[offset:end] """
+    view = memoryview(data)
+    if end is None:
+        end = len(view)
+    attrs = {}
+    while end - offset >= _nlattr.size:
+        length, atype = _nlattr.unpack_from(view, offset)
+        if length < _nlattr.size:
+            break
+        attrs[atype & NLA_TYPE_MASK] = view[offset + _nlattr.size:offset + length].tobytes()
+        offset += _align(length)
+    return attrs
+
+def parseMessages(data, seq=None):
+    """yields (msgtype, flags, seq, offset, length) of every netlink
+       message in data, skipping those of other requests if seq is given
+    """
+    view = memoryview(data)
+    size = len(view)
+    offset = 0
+    while size - offset >= NLMSG_HDRLEN:
+        length, msgtype, flags, mseq, pid = _nlmsghdr.unpack_from(view, offset)
+        if length < NLMSG_HDRLEN:
+            break
+        if seq is None or mseq == seq:
+            yield msgtype, flags, mseq, offset, length
+        offset += _align(length)
+
+
+class NetlinkSocket(object):
+    """A NETLINK_GENERIC socket receiving into one reused buffer """
+
+    def __init__(self, bufsize=65536):
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                  NETLINK_GENERIC)
+        self.sock.bind((0, 0))
+        self.buff = bytearray(bufsize)
+        self.view = memoryview(self.buff)
+
+    def send(self, data):
+        self.sock.send(data)
+
+    def recv(self):
+        """returns a view of the received messages, valid until the next
+           recv()
+        """
+        return self.view[:self.sock.recv_into(self.buff)]
+
+    def wait(self, timeout):
+        return bool(select.select([self.sock], [], [], timeout)[0])
+
+    def join(self, group):
+        self.sock.setsockopt(SOL_NETLINK, NETLINK_ADD_MEMBERSHIP, group)
+
+    def eventSocket(self):
+        """returns a new socket to join multicast groups on """
+        return NetlinkSocket(len(self.buff))
+
+    def ifindex(self, ifname):
+        """returns the interface index of ifname, packed as in the
+           attributes
+        """
+        ifindex = getIfindex(ifname)
+        if isinstance(ifindex, tuple):
+            raise IOError(*ifindex)
+        return _u32.pack(ifindex)
+
+    def close(self):
+        self.sock.close()
+
+
+class RecordingSocket(NetlinkSocket):
+    """A NetlinkSocket which keeps a copy of everything it receives in
+       self.chunks, of what its event sockets receive in self.events and
+       the interface indexes it looked up in self.ifindexes, for use with
+       ReplaySocket
+    """
+
+    def __init__(self, bufsize=65536):
+        NetlinkSocket.__init__(self, bufsize)
+        self.chunks = []
+        self.events = []
+        self.ifindexes = {}
+
+    def recv(self):
+        data = NetlinkSocket.recv(self)
+        self.chunks.append(data.tobytes())
+        return data
+
+    def eventSocket(self):
+        sock = RecordingSocket(len(self.buff))
+        sock.chunks = self.events
+        return sock
+
+    def ifindex(self, ifname):
+        ifindex = NetlinkSocket.ifindex(self, ifname)
+        self.ifindexes[ifname] = _u32.unpack(ifindex)[0]
+        return ifindex
+
+
+class ReplaySocket(object):
+    """Stands in for a NetlinkSocket, handing out recorded chunks in order.
+
+       Sequence numbers in the replies are rewritten to that of the last
+       request sent, so recordings don't depend on the numbering of the
+       session they came from. Sent requests are kept in self.sent.
+       Event sockets hand out the recorded events, interface indexes come
+       from the recorded ifindexes.
+    """
+
+    def __init__(self, chunks, events=(), ifindexes=None):
+        self.chunks = list(chunks)
+        self.events = list(events)
+        self.ifindexes = dict(ifindexes or {})
+        self.sent = []
+        self.groups = []
+        self.seq = 0
+
+    def send(self, data):
+        self.sent.append(data)
+        self.seq = _nlmsghdr.unpack_from(data)[3]
+
+    def recv(self):
+        data = bytearray(self.chunks.pop(0))
+        for msgtype, flags, seq, offset, length in parseMessages(str(data)):
+            if seq:
+                _u32.pack_into(data, offset + 8, self.seq)
+        return memoryview(data)
+
+    def wait(self, timeout):
+        return bool(self.chunks)
+
+    def join(self, group):
+        self.groups.append(group)
+
+    def eventSocket(self):
+        sock = ReplaySocket((), (), self.ifindexes)
+        sock.chunks = self.events # consumed across event sockets
+        return sock
+
+    def ifindex(self, ifname):
+        if ifname not in self.ifindexes:
+            raise IOError(19, "No such device")
+        return _u32.pack(self.ifindexes[ifname])
+
+    def close(self):
+        pass
+
+
+class InterfaceInfo(object):
+    """What nl80211 knows about an interface """
+
+    __slots__ = ('ifindex', 'ifname', 'wiphy', 'iftype', 'mac', 'frequency')
+
+    def __init__(self, attrs):
+        self.ifindex = _get(attrs, NL80211_ATTR_IFINDEX, _u32)
+        self.ifname = attrs.get(NL80211_ATTR_IFNAME, '').rstrip('\0')
+        self.wiphy = _get(attrs, NL80211_ATTR_WIPHY, _u32)
+        self.iftype = IFTYPES.get(_get(attrs, NL80211_ATTR_IFTYPE, _u32))
+        self.mac = _formatMac(attrs.get(NL80211_ATTR_MAC))
+        self.frequency = _get(attrs, NL80211_ATTR_WIPHY_FREQ, _u32) # MHz
+
+
+class StationInfo(object):
+    """Counters of a station: the AP when managed, each client when an AP.
+       Bitrates are in Mbit/s, signals in dBm.
+    """
+
+    __slots__ = ('mac', 'inactiveTime', 'rxBytes', 'txBytes', 'rxPackets',
+                 'txPackets', 'txRetries', 'txFailed', 'signal', 'signalAvg',
+                 'txBitrate', 'rxBitrate')
+
+    def __init__(self, attrs):
+        self.mac = _formatMac(attrs.get(NL80211_ATTR_MAC))
+        info = parseAttrs(attrs.get(NL80211_ATTR_STA_INFO, ''))
+        self.inactiveTime = _get(info, NL80211_STA_INFO_INACTIVE_TIME, _u32)
+        self.rxBytes = _get(info, NL80211_STA_INFO_RX_BYTES, _u32)
+        self.txBytes = _get(info, NL80211_STA_INFO_TX_BYTES, _u32)
+        self.rxPackets = _get(info, NL80211_STA_INFO_RX_PACKETS, _u32)
+        self.txPackets = _get(info, NL80211_STA_INFO_TX_PACKETS, _u32)
+        self.txRetries = _get(info, NL80211_STA_INFO_TX_RETRIES, _u32)
+        self.txFailed = _get(info, NL80211_STA_INFO_TX_FAILED, _u32)
+        self.signal = _get(info, NL80211_STA_INFO_SIGNAL, _s8)
+        self.signalAvg = _get(info, NL80211_STA_INFO_SIGNAL_AVG, _s8)
+        self.txBitrate = _bitrate(info.get(NL80211_STA_INFO_TX_BITRATE))
+        self.rxBitrate = _bitrate(info.get(NL80211_STA_INFO_RX_BITRATE))
+
+
+class Nl80211Result(object):
+    """A scanned BSS, with the attributes of Iwscanresult (bssid, essid,
+       mode, rate, quality, frequency, protocol) where nl80211 has them.
+    """
+
+    __slots__ = ('bssid', 'essid', 'mode', 'rate', 'quality', 'frequency',
+                 'protocol', 'mhz', 'signal', 'capability', 'privacy',
+                 'beaconInterval', 'tsf', 'seenMsAgo', 'associated', 'ies')
+
+    def __init__(self, bss):
+        self.bssid = _formatMac(bss.get(NL80211_BSS_BSSID))
+        self.mhz = _get(bss, NL80211_BSS_FREQUENCY, _u32)
+        self.frequency = Iwfreq()
+        if self.mhz:
+            self.frequency.frequency = float(self.mhz) * 10**6
+        mbm = _get(bss, NL80211_BSS_SIGNAL_MBM, _s32)
+        self.signal = mbm / 100.0 if mbm is not None else None
+        self.quality = Iwquality()
+        if self.signal is not None:
+            self.quality.siglevel = int(self.signal) + 0x100
+        self.capability = _get(bss, NL80211_BSS_CAPABILITY, _u16) or 0
+        self.privacy = bool(self.capability & 0x0010)
+        if self.capability & 0x0002:
+            self.mode = 'Ad-Hoc'
+        elif self.capability & 0x0001:
+            self.mode = 'Master'
+        else:
+            self.mode = None
+        self.beaconInterval = _get(bss, NL80211_BSS_BEACON_INTERVAL, _u16)
+        self.tsf = _get(bss, NL80211_BSS_TSF, _u64)
+        self.seenMsAgo = _get(bss, NL80211_BSS_SEEN_MS_AGO, _u32)
+        self.associated = NL80211_BSS_STATUS in bss
+        self.protocol = None
+        self.ies = bss.get(NL80211_BSS_INFORMATION_ELEMENTS) or \
+            bss.get(NL80211_BSS_BEACON_IES, '')
+        self.essid = None
+        self.rate = []
+        offset = 0
+        while offset + 2 <= len(self.ies):
+            eid, length = ord(self.ies[offset]), ord(self.ies[offset + 1])
+            value = self.ies[offset + 2:offset + 2 + length]
+            if eid == 0:
+                self.essid = value
+            elif eid in (1, 50): # supported and extended rates
+                for rate in value:
+                    iwfreq = Iwfreq()
+                    iwfreq.frequency = (ord(rate) & 0x7f) * 500000
+                    self.rate.append(iwfreq.getBitrate())
+            offset += 2 + length
+
+
+def _get(attrs, atype, fmt):
+    value = attrs.get(atype)
+    if value is None or len(value) < fmt.size:
+        return None
+    return fmt.unpack_from(value)[0]
+
+def _formatMac(value):
+    if value is None or len(value) != 6:
+        return None
+    return "%02X:%02X:%02X:%02X:%02X:%02X" % struct.unpack('6B', value)
+
+def _bitrate(value):
+    if value is None:
+        return None
+    rate = parseAttrs(value)
+    bitrate = _get(rate, NL80211_RATE_INFO_BITRATE32, _u32)
+    if bitrate is None:
+        bitrate = _get(rate, NL80211_RATE_INFO_BITRATE, _u16)
+    if bitrate is None:
+        return None
+    return bitrate / 10.0
+
+
+class Nl80211(object):
+    """Requests to the nl80211 generic netlink family.
+
+       sock is the socket requests go out on, a NetlinkSocket by default.
+       Its eventSocket() provides the sockets listening for multicast
+       events (scan done), its ifindex() the interface indexes.
+       Requests on one instance are serialised, so it can be shared
+       between threads.
+    """
+
+    def __init__(self, sock=None):
+        self.sock = sock if sock is not None else NetlinkSocket()
+        self.seq = int(time.time()) & 0xffffff
+        self.pid = os.getpid()
+        self.familyId = None
+        self.groups = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        self.sock.close()
+
+    def _resolve(self):
+        if self.familyId is not None:
+            return
+        for cmd, attrs in self._request(GENL_ID_CTRL, CTRL_CMD_GETFAMILY,
+                [(CTRL_ATTR_FAMILY_NAME, 'nl80211\0')], dump=False):
+            self.familyId = _get(attrs, CTRL_ATTR_FAMILY_ID, _u16)
+            for group in parseAttrs(attrs.get(CTRL_ATTR_MCAST_GROUPS, '')).itervalues():
+                group = parseAttrs(group)
+                name = group.get(CTRL_ATTR_MCAST_GRP_NAME, '').rstrip('\0')
+                self.groups[name] = _get(group, CTRL_ATTR_MCAST_GRP_ID, _u32)
+        if self.familyId is None:
+            raise IOError(2, "nl80211 not available")
+
+    def request(self, cmd, attrs=(), dump=False):
+        """sends an nl80211 command, returns the attribute dicts of all
+           replies
+        """
+        self._resolve()
+        return self._request(self.familyId, cmd, attrs, dump)
+
+    def _request(self, family, cmd, attrs, dump):
+        payload = _genlmsghdr.pack(cmd, 1, 0) + \
+            ''.join(packAttr(atype, value) for atype, value in attrs)
+        flags = NLM_F_REQUEST | (NLM_F_DUMP if dump else NLM_F_ACK)
+        self._lock.acquire()
+        try:
+            self.seq += 1
+            seq = self.seq
+            self.sock.send(_nlmsghdr.pack(NLMSG_HDRLEN + len(payload), family,
+                                          flags, seq, 0) + payload)
+            replies = []
+            while True:
+                data = self.sock.recv()
+                for msgtype, mflags, mseq, offset, length in parseMessages(data, seq):
+                    if msgtype == NLMSG_DONE:
+                        return replies
+                    if msgtype == NLMSG_ERROR:
+                        error = -_s32.unpack_from(data, offset + NLMSG_HDRLEN)[0]
+                        if error:
+                            raise IOError(error, os.strerror(error))
+                        return replies # the ack of a non-dump request
+                    start = offset + NLMSG_HDRLEN
+                    replies.append((_u8.unpack_from(data, start)[0],
+                                    parseAttrs(data, start + GENL_HDRLEN,
+                                               offset + length)))
+        finally:
+            self._lock.release()
+
+    def getInterfaces(self, ifname=None):
+        """returns InterfaceInfo of ifname, or of all interfaces """
+        if ifname is None:
+            replies = self.request(NL80211_CMD_GET_INTERFACE, dump=True)
+        else:
+            ifindex = self.sock.ifindex(ifname)
+            replies = self.request(NL80211_CMD_GET_INTERFACE,
+                                   [(NL80211_ATTR_IFINDEX, ifindex)])
+        return [InterfaceInfo(attrs) for cmd, attrs in replies]
+
+    def getStations(self, ifname):
+        """returns StationInfo of the stations known to ifname """
+        ifindex = self.sock.ifindex(ifname)
+        replies = self.request(NL80211_CMD_GET_STATION,
+                               [(NL80211_ATTR_IFINDEX, ifindex)],
+                               dump=True)
+        return [StationInfo(attrs) for cmd, attrs in replies]
+
+    def canScan(self):
+        """True if the kernel sends scan events, which triggerScan() waits
+           for. Old kernels have no "scan" multicast group.
+        """
+        self._resolve()
+        return 'scan' in self.groups
+
+    def triggerScan(self, ifname, timeout):
+        """starts an active scan on ifname and waits until it completes.
+           Raises IOError without the "scan" multicast group, see canScan().
+        """
+        if not self.canScan():
+            raise IOError(95, "nl80211 has no scan multicast group")
+        ifindex = self.sock.ifindex(ifname) # packed, as in the attributes
+        events = self.sock.eventSocket()
+        try:
+            events.join(self.groups['scan'])
+            self.request(NL80211_CMD_TRIGGER_SCAN,
+                         [(NL80211_ATTR_IFINDEX, ifindex),
+                          (NL80211_ATTR_SCAN_SSIDS, packAttr(1, ''))])
+            deadline = time.time() + timeout
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not events.wait(remaining):
+                    raise RuntimeError("scan of %s timed out after %ss" %
+                                       (ifname, timeout))
+                data = events.recv()
+                for msgtype, flags, seq, offset, length in parseMessages(data):
+                    if msgtype != self.familyId:
+                        continue
+                    start = offset + NLMSG_HDRLEN
+                    cmd = _u8.unpack_from(data, start)[0]
+                    if cmd not in (NL80211_CMD_NEW_SCAN_RESULTS,
+                                   NL80211_CMD_SCAN_ABORTED):
+                        continue
+                    attrs = parseAttrs(data, start + GENL_HDRLEN, offset + length)
+                    if attrs.get(NL80211_ATTR_IFINDEX) != ifindex:
+                        continue
+                    if cmd == NL80211_CMD_SCAN_ABORTED:
+                        raise RuntimeError("scan of %s aborted" % ifname)
+                    return
+        finally:
+            events.close()
+
+    def getScan(self, ifname):
+        """returns the BSS attribute dicts of the last scan results """
+        ifindex = self.sock.ifindex(ifname)
+        replies = self.request(NL80211_CMD_GET_SCAN,
+                               [(NL80211_ATTR_IFINDEX, ifindex)],
+                               dump=True)
+        return [parseAttrs(attrs[NL80211_ATTR_BSS]) for cmd, attrs in replies
+                if NL80211_ATTR_BSS in attrs]
+
+
+_shared = None
+_sharedLock = threading.Lock()
+
+def getNl80211():
+    """returns an Nl80211 shared by the process """
+    global _shared
+    _sharedLock.acquire()
+    try:
+        if _shared is None or _shared.pid != os.getpid():
+            _shared = Nl80211()
+        return _shared
+    finally:
+        _sharedLock.release()
+
+
+class Nl80211Scan(object):
+    """Scanning with nl80211, used like Iwscan """
+
+    SCAN_TIMEOUT = 10.0
+
+    def __init__(self, ifname, nl=None):
+        self.ifname = ifname
+        self.nl = nl if nl is not None else getNl80211()
+        self.aplist = None
+
+    def scan(self, fullscan=True, timeout=None):
+        self.aplist = list(self.iterScan(fullscan, timeout))
+        return self.aplist
+
+    def iterScan(self, fullscan=True, timeout=None):
+        if fullscan:
+            if timeout is None:
+                timeout = self.SCAN_TIMEOUT
+            self.nl.triggerScan(self.ifname, timeout)
+        return (Nl80211Result(bss) for bss in self.nl.getScan(self.ifname))
+
+    def scanAsync(self, fullscan=True, timeout=None, callback=None):
+        return ScanRequest(self, fullscan, timeout, callback)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+#
+# offline.py
+# Decodes pcap captures with RadiotapFrame / WifiFrame and aggregates them
+# into frame counts, an access point table and a station table.
+#
+# Large captures are cut into record aligned chunks (only the record headers
+# are read to find the cut points) and the chunks are decoded in a process
+# pool. Chunk results are merged in file order, so the result is exactly
+# what a sequential pass over the whole file produces.
+#
+# >>> agg = decodeFile('capture.pcap', processes=8)
+# >>> agg.aps[0x001122334455]['ssid']
+
+import multiprocessing
+
+import pcap
+from macaddr import formatMac
+from wifistruct import RadiotapFrame, WifiFrame
+
+CHUNK_BYTES = 64 * 1024 * 1024
+
+
+class Aggregate(object):
+	"""Per capture (or per chunk) summary.
+
+	counts   - (type, subtype) -> frames
+	aps      - bssid -> {ssid, first, last, frames, signal}
+	stations - address -> {first, last, frames, bssid}
+	Addresses are 48 bit ints (see macaddr).
+	errors   - records which failed to decode
+	badFCS   - records dropped because of a bad FCS
+	"""
+
+	def __init__(self):
+		self.frames = 0
+		self.errors = 0
+		self.badFCS = 0
+		self.counts = {}
+		self.aps = {}
+		self.stations = {}
+
+	def add(self, ts, radioFrame, wifiFrame):
+		self.frames += 1
+		key = (wifiFrame.type, wifiFrame.subtype)
+		self.counts[key] = self.counts.get(key, 0) + 1
+		signal = radioFrame.getSignalStrength() if radioFrame else None
+
+		if wifiFrame.isBeacon() or wifiFrame.isProbeResp():
+			bssid = wifiFrame.bssidMac()
+			ap = self.aps.get(bssid)
+			if ap is None:
+				ap = self.aps[bssid] = {"ssid": wifiFrame.ssid(), "first": ts,
+					"last": ts, "frames": 0, "signal": signal}
+			ap["last"] = ts
+			ap["frames"] += 1
+			if signal is not None and (ap["signal"] is None or signal > ap["signal"]):
+				ap["signal"] = signal
+		elif wifiFrame.type != 1:
+			src = wifiFrame.srcMac()
+			if src is not None:
+				station = self.stations.get(src)
+				if station is None:
+					station = self.stations[src] = {"first": ts, "last": ts,
+						"frames": 0, "bssid": None}
+				station["last"] = ts
+				station["frames"] += 1
+				bssid = wifiFrame.bssidMac()
+				if bssid is not None and bssid != src:
+					station["bssid"] = bssid
+
+	def merge(self, other):
+		"""Folds in the aggregate of the records which follow ours."""
+		self.frames += other.frames
+		self.errors += other.errors
+		self.badFCS += other.badFCS
+		for key, count in other.counts.iteritems():
+			self.counts[key] = self.counts.get(key, 0) + count
+		for bssid, theirs in other.aps.iteritems():
+			ours = self.aps.get(bssid)
+			if ours is None:
+				self.aps[bssid] = theirs
+				continue
+			ours["last"] = theirs["last"]
+			ours["frames"] += theirs["frames"]
+			if theirs["signal"] is not None and (ours["signal"] is None
+					or theirs["signal"] > ours["signal"]):
+				ours["signal"] = theirs["signal"]
+		for addr, theirs in other.stations.iteritems():
+			ours = self.stations.get(addr)
+			if ours is None:
+				self.stations[addr] = theirs
+				continue
+			ours["last"] = theirs["last"]
+			ours["frames"] += theirs["frames"]
+			if theirs["bssid"] is not None:
+				ours["bssid"] = theirs["bssid"]
+		return self
+
+
+def chunkOffsets(path, chunkBytes=CHUNK_BYTES):
+	"""Returns [(start, end)] record aligned offset ranges covering the
+	   capture, each about chunkBytes long."""
+	reader = pcap.PcapReader(path)
+	try:
+		chunks = []
+		start = last = pcap.GLOBAL_HEADER_SIZE
+		for ts, offset, caplen in reader.recordHeaders():
+			if offset - start >= chunkBytes:
+				chunks.append((start, offset))
+				start = offset
+			last = offset + pcap.RECORD_HEADER_SIZE + caplen
+		if last > start:
+			chunks.append((start, last))
+		return chunks
+	finally:
+		reader.close()
+
+def decodeChunk(args):
+	"""Decodes the records in [start, end) of a capture. Runs in the pool."""
+	path, start, end, verifyFCS = args
+	agg = Aggregate()
+	reader = pcap.PcapReader(path)
+	try:
+		radiotap = reader.linktype == pcap.LINKTYPE_IEEE802_11_RADIOTAP
+		for ts, offset, data in reader.records(start, end):
+			try:
+				if radiotap:
+					radioFrame = RadiotapFrame(data)
+					if radioFrame.badFCS():
+						agg.badFCS += 1
+						continue
+					wifiFrame = WifiFrame(radioFrame.payload, False,
+						radioFrame.hasFCS())
+					if verifyFCS and wifiFrame.verifyFCS() is False:
+						agg.badFCS += 1
+						continue
+					wifiFrame.deepDecode()
+				else:
+					radioFrame = None
+					wifiFrame = WifiFrame(data, True)
+			except Exception:
+				agg.errors += 1
+				continue
+			agg.add(ts, radioFrame, wifiFrame)
+	finally:
+		reader.close()
+	return agg
+
+def decodeFile(path, processes=None, chunkBytes=CHUNK_BYTES, verifyFCS=False):
+	"""Decodes a capture and returns its Aggregate.
+
+	Frames flagged as having a bad FCS by radiotap are always dropped,
+	verifyFCS also drops frames whose FCS doesn't match their CRC32.
+
+	processes - pool size, defaults to the number of CPUs. 1 decodes in
+	            this process without a pool.
+	"""
+	if processes is None:
+		processes = multiprocessing.cpu_count()
+	chunks = [(path, start, end, verifyFCS)
+		for start, end in chunkOffsets(path, chunkBytes)]
+	total = Aggregate()
+	if processes <= 1 or len(chunks) <= 1:
+		for chunk in chunks:
+			total.merge(decodeChunk(chunk))
+		return total
+	pool = multiprocessing.Pool(min(processes, len(chunks)))
+	try:
+		# imap hands results back in chunk order, which keeps the merge
+		# deterministic whatever order the workers finish in
+		for agg in pool.imap(decodeChunk, chunks):
+			total.merge(agg)
+	finally:
+		pool.close()
+		pool.join()
+	return total
+
+
+if __name__ == "__main__":
+	import sys
+	agg = decodeFile(sys.argv[1])
+	print "Frames:", agg.frames, "Errors:", agg.errors, "Bad FCS:", agg.badFCS
+	for bssid in sorted(agg.aps):
+		ap = agg.aps[bssid]
+		print formatMac(bssid), ap["ssid"], ap["frames"], ap["signal"]
+	print "Stations:", len(agg.stations)
@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#
+# output.py
+# Buffered, structured output for decoded frames.
+#
+# A sink is built once with the list of fields it emits. Each field maps to
+# an extractor, so per frame only the emitted fields are ever computed and
+# formatted. Formatted records are collected into a buffer and written out
+# in one call once it fills up, instead of several print statements per
+# frame.
+#
+# >>> sink = getSink('jsonl', fields=['ts', 'type', 'src', 'ssid'])
+# >>> sink.write(radioFrame, wifiFrame, time.time())
+# >>> sink.flush()
+
+import sys
+import time
+import json
+
+from macaddr import formatMac, vendor
+
+
+def _typeName(wf):
+	return '-'.join(wf.getType())
+
+# field name -> extractor(ts, radioFrame, wifiFrame)
+# radioFrame may be None when only the 802.11 frame is available.
+FIELDS = {
+	"ts":		lambda ts, rt, wf: ts,
+	"type":		lambda ts, rt, wf: _typeName(wf),
+	"ssid":		lambda ts, rt, wf: wf.ssid(),
+	"src":		lambda ts, rt, wf: formatMac(wf.srcMac()),
+	"dest":		lambda ts, rt, wf: formatMac(wf.destMac()),
+	"bssid":	lambda ts, rt, wf: formatMac(wf.bssidMac()),
+	"vendor":	lambda ts, rt, wf: vendor(wf.srcMac()),
+	"retry":	lambda ts, rt, wf: int(wf.retryFlag),
+	"payload":	lambda ts, rt, wf: len(wf.data),
+	"channel":	lambda ts, rt, wf: rt.getChannel() if rt else None,
+	"channelNumber":	lambda ts, rt, wf: rt.getChannelNumber() if rt else None,
+	"band":		lambda ts, rt, wf: rt.getBand() if rt else None,
+	"signal":	lambda ts, rt, wf: rt.getSignalStrength() if rt else None,
+	"antenna":	lambda ts, rt, wf: rt.getAntenna() if rt else None,
+	"hopChannel":	lambda ts, rt, wf: rt.hopChannel if rt else None,
+}
+
+DEFAULT_FIELDS = ["ts", "type", "ssid", "src", "dest", "bssid", "channel",
+		"signal", "payload"]
+
+
+class OutputSink(object):
+	"""Base class for buffered frame sinks.
+
+	Formats records as the text sink does: 'key' + value for every field,
+	joined by separator, between start and end. Subclasses override
+	_key(), _value() and these strings where their format differs.
+
+	Buffered records are written once bufsize is reached, once the oldest
+	of them is maxDelay seconds old, or right away when out is a terminal.
+	Capture loops call flushDue() while waiting for frames, so a quiet
+	channel doesn't hold back what was buffered.
+	"""
+
+	start = ''
+	separator = ' '
+	end = '\n'
+
+	def __init__(self, out=None, fields=None, bufsize=64*1024, maxDelay=1.0):
+		if fields is None:
+			fields = DEFAULT_FIELDS
+		for name in fields:
+			if name not in FIELDS:
+				raise ValueError("Unknown output field: " + name)
+		self.out = out or sys.stdout
+		self.fields = list(fields)
+		self.extractors = [FIELDS[name] for name in self.fields]
+		# management IEs only need decoding if something reads them
+		self.deepDecode = "ssid" in self.fields
+		self.bufsize = bufsize
+		self.maxDelay = maxDelay
+		isatty = getattr(self.out, 'isatty', None)
+		self.interactive = bool(isatty and isatty())
+		self._keys = [self._key(name) for name in self.fields]
+		self._buf = []
+		self._buffered = 0
+		self._since = None # when the oldest buffered record was written
+		self.count = 0
+
+	def _key(self, name):
+		return name + '='
+
+	def _value(self, value):
+		"""Returns the text of a value, None to leave the field out."""
+		if value is None:
+			return None
+		return str(value)
+
+	def _format(self, values):
+		parts = []
+		for key, value in zip(self._keys, values):
+			text = self._value(value)
+			if text is not None:
+				parts.append(key + text)
+		return self.start + self.separator.join(parts) + self.end
+
+	def write(self, radioFrame, wifiFrame, ts=None):
+		"""Formats a frame into the buffer, flushing it if due."""
+		values = [f(ts, radioFrame, wifiFrame) for f in self.extractors]
+		line = self._format(values)
+		if not self._buf:
+			self._since = time.time()
+		self._buf.append(line)
+		self._buffered += len(line)
+		self.count += 1
+		if self.interactive or self._buffered >= self.bufsize:
+			self.flush()
+		else:
+			self.flushDue()
+
+	def flushDue(self):
+		"""Flushes if the oldest buffered record is maxDelay seconds old."""
+		if self._buf:
+			age = time.time() - self._since
+			# a clock stepping back counts as due
+			if age >= self.maxDelay or age < 0:
+				self.flush()
+
+	def flush(self):
+		if self._buf:
+			self.out.write(''.join(self._buf))
+			self._buf = []
+			self._buffered = 0
+		self.out.flush()
+
+	def close(self):
+		self.flush()
+
+
+class JsonLinesSink(OutputSink):
+	"""One JSON object per line."""
+
+	start = '{'
+	separator = ', '
+	end = '}\n'
+
+	def _key(self, name):
+		return json.dumps(name) + ': '
+
+	def _value(self, value):
+		return json.dumps(value, encoding='latin1')
+
+
+class CsvSink(OutputSink):
+	"""Comma separated values, with a header line."""
+
+	separator = ','
+
+	def __init__(self, *args, **kwargs):
+		OutputSink.__init__(self, *args, **kwargs)
+		self._buf.append(','.join(self.fields) + '\n')
+		self._since = time.time()
+
+	def _key(self, name):
+		return ''
+
+	def _value(self, value):
+		if value is None:
+			return ''
+		if isinstance(value, basestring):
+			if ',' in value or '"' in value or '\n' in value:
+				value = '"' + value.replace('"', '""') + '"'
+			return value
+		return str(value)
+
+
+class TextSink(OutputSink):
+	"""Compact 'field=value' text, one frame per line."""
+
+
+SINKS = {
+	"jsonl": JsonLinesSink,
+	"csv": CsvSink,
+	"text": TextSink,
+}
+
+def getSink(name, out=None, fields=None, bufsize=64*1024, maxDelay=1.0):
+	"""Returns a sink for the given format name (jsonl, csv or text)."""
+	if name not in SINKS:
+		raise ValueError("Unknown output format: " + name)
+	return SINKS[name](out, fields, bufsize, maxDelay)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# pcap.py
+# Minimal reader for classic libpcap capture files, for decoding captures
+# offline with RadiotapFrame / WifiFrame instead of a live monitor socket.
+#
+# >>> for ts, offset, pkt in PcapReader('capture.pcap'):
+# ...     obj = WifiFrame(RadiotapFrame(pkt).payload, True)
+
+import os
+import struct
+
+LINKTYPE_IEEE802_11 = 105
+LINKTYPE_IEEE802_11_RADIOTAP = 127
+
+_MAGIC_USEC = 0xa1b2c3d4
+_MAGIC_NSEC = 0xa1b23c4d
+
+GLOBAL_HEADER_SIZE = 24
+RECORD_HEADER_SIZE = 16
+
+
+class PcapReader(object):
+	"""Reads a pcap file record by record.
+
+	Records are identified by the file offset of their record header, which
+	stays valid across reopening the file and can be handed to readAt().
+	"""
+
+	def __init__(self, path):
+		self.path = path
+		self.fp = open(path, 'rb')
+		header = self.fp.read(GLOBAL_HEADER_SIZE)
+		if len(header) < GLOBAL_HEADER_SIZE:
+			raise ValueError("Truncated pcap global header")
+		for endian in ('<', '>'):
+			magic = struct.unpack(endian + 'I', header[:4])[0]
+			if magic in (_MAGIC_USEC, _MAGIC_NSEC):
+				break
+		else:
+			raise ValueError("Not a pcap file: " + path)
+		self.endian = endian
+		self.tsScale = 1e-6 if magic == _MAGIC_USEC else 1e-9
+		(self.versionMajor, self.versionMinor, self.thiszone, self.sigfigs,
+			self.snaplen, self.linktype) = struct.unpack(endian + 'HHiIII', header[4:])
+		self._record = struct.Struct(endian + 'IIII')
+
+	def close(self):
+		self.fp.close()
+
+	def __del__(self):
+		try:
+			self.fp.close()
+		except AttributeError:
+			pass
+
+	def _readHeader(self, offset):
+		"""Returns (ts, caplen) of the record at offset, or None at EOF."""
+		self.fp.seek(offset)
+		header = self.fp.read(RECORD_HEADER_SIZE)
+		if len(header) < RECORD_HEADER_SIZE:
+			return None
+		sec, frac, caplen, origlen = self._record.unpack(header)
+		return sec + frac * self.tsScale, caplen
+
+	def records(self, offset=GLOBAL_HEADER_SIZE, end=None):
+		"""Yields (ts, offset, data) for every complete record starting at
+		   offset, stopping before end if given."""
+		fp = self.fp
+		fp.seek(offset)
+		unpack = self._record.unpack
+		scale = self.tsScale
+		while end is None or offset < end:
+			if fp.tell() != offset:
+				fp.seek(offset) # readAt() was called in between
+			header = fp.read(RECORD_HEADER_SIZE)
+			if len(header) < RECORD_HEADER_SIZE:
+				break
+			sec, frac, caplen, origlen = unpack(header)
+			data = fp.read(caplen)
+			if len(data) < caplen:
+				break # truncated final record, still being written
+			yield sec + frac * scale, offset, data
+			offset += RECORD_HEADER_SIZE + caplen
+
+	def __iter__(self):
+		return self.records()
+
+	def recordHeaders(self, offset=GLOBAL_HEADER_SIZE, end=None):
+		"""Like records(), but only reads the record headers and seeks over
+		   the data. Yields (ts, offset, caplen)."""
+		size = os.fstat(self.fp.fileno()).st_size
+		while end is None or offset < end:
+			result = self._readHeader(offset)
+			if result is None:
+				break
+			ts, caplen = result
+			if offset + RECORD_HEADER_SIZE + caplen > size:
+				break
+			yield ts, offset, caplen
+			offset += RECORD_HEADER_SIZE + caplen
+
+	def recordPrefixes(self, offset=GLOBAL_HEADER_SIZE, end=None, size=64):
+		"""Like records(), but only reads the first size bytes of each
+		   record (enough for its headers) and seeks over the rest.
+		   Yields (ts, offset, caplen, prefix)."""
+		fp = self.fp
+		fileSize = os.fstat(fp.fileno()).st_size
+		unpack = self._record.unpack
+		scale = self.tsScale
+		while end is None or offset < end:
+			if fp.tell() != offset:
+				fp.seek(offset) # skipping data, or readAt() was called
+			header = fp.read(RECORD_HEADER_SIZE)
+			if len(header) < RECORD_HEADER_SIZE:
+				break
+			sec, frac, caplen, origlen = unpack(header)
+			if offset + RECORD_HEADER_SIZE + caplen > fileSize:
+				break # truncated final record, still being written
+			yield sec + frac * scale, offset, caplen, fp.read(min(caplen, size))
+			offset += RECORD_HEADER_SIZE + caplen
+
+	def readAt(self, offset):
+		"""Returns (ts, data) for the record starting at offset."""
+		result = self._readHeader(offset)
+		if result is None:
+			raise EOFError("No record at offset %d" % offset)
+		ts, caplen = result
+		return ts, self.fp.read(caplen)
+
+	def frame(self, data):
+		"""Returns the 802.11 frame of a record, skipping radiotap if present."""
+		if self.linktype == LINKTYPE_IEEE802_11_RADIOTAP:
+			return data[struct.unpack('<H', data[2:4])[0]:]
+		return data
@@ -45,6 +45,29 @@ RTAP_RTS_RETRIES = 16
 RTAP_DATA_RETRIES = 17
 RTAP_EXT = 31 # Denotes extended "present" fields.
 
+# Bits of the RTAP_FLAGS field
+RTAP_F_CFP = 0x01
+RTAP_F_SHORTPRE = 0x02
+RTAP_F_WEP = 0x04
+RTAP_F_FRAG = 0x08
+RTAP_F_FCS = 0x10 # Frame includes the FCS at the end
+RTAP_F_DATAPAD = 0x20
+RTAP_F_BADFCS = 0x40 # Frame failed the FCS check
+
+# Channel flags, the upper 16 bits of the RTAP_CHANNEL field
+RTAP_CHAN_TURBO = 0x0010
+RTAP_CHAN_CCK = 0x0020
+RTAP_CHAN_OFDM = 0x0040
+RTAP_CHAN_2GHZ = 0x0080
+RTAP_CHAN_5GHZ = 0x0100
+RTAP_CHAN_PASSIVE = 0x0200
+RTAP_CHAN_DYN = 0x0400 # Dynamic CCK-OFDM
+RTAP_CHAN_GFSK = 0x0800
+RTAP_CHAN_GSM = 0x1000 # 900MHz
+RTAP_CHAN_STURBO = 0x2000 # Static Turbo
+RTAP_CHAN_HALF = 0x4000 # Half rate (10MHz)
+RTAP_CHAN_QUARTER = 0x8000 # Quarter rate (5MHz)
+
 _PREAMBLE_FORMAT = "<BxHI"
 _PREAMBLE_SIZE = struct.calcsize(_PREAMBLE_FORMAT)
 
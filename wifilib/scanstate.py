@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+#
+# scanstate.py
+# Keeps the access points of successive scans keyed by BSSID and works out
+# what changed between them, so consumers only handle the changes.
+#
+# Takes the results of Iwscan/Nl80211Scan (objects) as well as the dicts of
+# wifiscan.scan(). Each update() is a single pass over the new results and
+# the known APs: O(n), and subscribers are only called when something
+# actually changed.
+#
+# >>> state = ScanState(signalThreshold=5)
+# >>> state.subscribe(lambda delta: sys.stdout.write(str(delta) + "\n"))
+# >>> while True:
+# ...     state.update(Iwscan('wlan0').scan())
+
+import time
+
+import pythonwifi.flags
+import channels
+
+
+class APState(object):
+    """What is known about one access point."""
+
+    __slots__ = ('bssid', 'essid', 'signal', 'channel', 'security',
+                 'firstSeen', 'lastSeen', 'missed', 'reportedSignal',
+                 'result')
+
+    def __init__(self, bssid, now):
+        self.bssid = bssid
+        self.firstSeen = now
+        self.lastSeen = now
+        self.missed = 0
+        self.essid = self.signal = self.channel = self.security = None
+        self.reportedSignal = None # signal when last reported to subscribers
+        self.result = None # the scan result it was last updated from
+
+    def __repr__(self):
+        return "<AP %s %r ch %s %s %s>" % (self.bssid, self.essid,
+            self.channel, self.signal, self.security)
+
+
+class ScanDelta(object):
+    """Changes between two scans.
+
+    appeared:    APStates seen for the first time
+    disappeared: APStates no longer seen
+    changed:     (APState, names of the changed fields) pairs
+    """
+
+    __slots__ = ('time', 'appeared', 'disappeared', 'changed')
+
+    def __init__(self, now):
+        self.time = now
+        self.appeared = []
+        self.disappeared = []
+        self.changed = []
+
+    def __nonzero__(self):
+        return bool(self.appeared or self.disappeared or self.changed)
+
+    def __str__(self):
+        return "+%d -%d ~%d" % (len(self.appeared), len(self.disappeared),
+                                len(self.changed))
+
+
+def _wpaSecurity(ies):
+    """Returns WPA2/WPA from the RSN or WPA IE, None without either."""
+    offset = 0
+    wpa = None
+    while offset + 2 <= len(ies):
+        eid, length = ord(ies[offset]), ord(ies[offset + 1])
+        if eid == 48:
+            return "WPA2"
+        if eid == 221 and ies[offset + 2:offset + 6] == '\x00\x50\xf2\x01':
+            wpa = "WPA"
+        offset += 2 + length
+    return wpa
+
+def describe(ap):
+    """Returns (bssid, essid, signal, channel, security) of a scan result.
+
+       For Iwscanresult/Nl80211Result, signal is in dBm and channel comes
+       from the frequency. For wifiscan dicts, signal is the quality in %.
+    """
+    if isinstance(ap, dict):
+        quality = ap.get("Quality")
+        signal = int(quality.split()[0]) if quality else None
+        channel = ap.get("Channel")
+        return (ap.get("Address"), ap.get("Name"), signal,
+                int(channel) if channel else None, ap.get("Encryption"))
+
+    signal = ap.quality.signallevel if ap.quality.siglevel else None
+    channel = None
+    if ap.frequency is not None and ap.frequency.frequency:
+        channel = channels.frequencyToChannel(
+            int(round(float(ap.frequency.frequency) / 10**6)))
+    privacy = getattr(ap, 'privacy', None)
+    if privacy is None:
+        # Iwscanresult: flags of the SIOCGIWENCODE iw_point
+        encode = ap.encode
+        privacy = bool(encode) and len(encode) >= 4 and not \
+            (ord(encode[2]) | ord(encode[3]) << 8) & pythonwifi.flags.IW_ENCODE_DISABLED
+    security = "Open"
+    if privacy:
+        security = _wpaSecurity(ap.ies or '') or "WEP"
+    return ap.bssid, ap.essid, signal, channel, security
+
+
+class ScanState(object):
+    """Access points by BSSID, updated from successive scans.
+
+    signalThreshold - change in signal (since it was last reported) which
+                      counts as a change.
+    missingScans    - consecutive scans an AP has to be missing from to
+                      be reported as gone: it goes on the missingScans'th
+                      miss in a row. Scans routinely miss a few APs.
+    """
+
+    def __init__(self, signalThreshold=5, missingScans=2, clock=time.time):
+        self.signalThreshold = signalThreshold
+        self.missingScans = missingScans
+        self.clock = clock
+        self.aps = {}
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        """callback(ScanDelta) is called after every update that changed
+           something."""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        self.subscribers.remove(callback)
+
+    def update(self, results, now=None):
+        """Merges the results of a scan, returns the ScanDelta."""
+        if now is None:
+            now = self.clock()
+        delta = ScanDelta(now)
+        aps = self.aps
+        seen = set()
+        for result in results:
+            bssid, essid, signal, channel, security = describe(result)
+            if bssid is None or bssid in seen:
+                continue
+            seen.add(bssid)
+            ap = aps.get(bssid)
+            if ap is None:
+                ap = aps[bssid] = APState(bssid, now)
+                ap.essid, ap.signal, ap.channel, ap.security = \
+                    essid, signal, channel, security
+                ap.reportedSignal = signal
+                ap.result = result
+                delta.appeared.append(ap)
+                continue
+
+            fields = []
+            if essid != ap.essid:
+                fields.append('essid')
+            if channel != ap.channel:
+                fields.append('channel')
+            if security != ap.security:
+                fields.append('security')
+            if signal is not None and (ap.reportedSignal is None or
+                    abs(signal - ap.reportedSignal) >= self.signalThreshold):
+                fields.append('signal')
+                ap.reportedSignal = signal
+            ap.essid, ap.signal, ap.channel, ap.security = \
+                essid, signal, channel, security
+            ap.lastSeen = now
+            ap.missed = 0
+            ap.result = result
+            if fields:
+                delta.changed.append((ap, fields))
+
+        if len(seen) < len(aps):
+            for bssid in [b for b in aps if b not in seen]:
+                ap = aps[bssid]
+                ap.missed += 1
+                if ap.missed >= self.missingScans:
+                    del aps[bssid]
+                    delta.disappeared.append(ap)
+
+        if delta:
+            for callback in list(self.subscribers):
+                callback(delta)
+        return delta
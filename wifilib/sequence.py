@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# sequence.py
+# Uses the sequence control field of 802.11 frames to drop retransmissions
+# and to put fragmented MSDUs back together.
+#
+# Both work on a shallow WifiFrame (deepdecode=False), so duplicates can be
+# thrown away before any of the expensive decoding happens:
+#
+# >>> retries = RetryFilter()
+# >>> frags = FragmentReassembler()
+# >>> obj = WifiFrame(radioFrame.payload)
+# >>> if not retries.isDuplicate(obj):
+# ...     obj = frags.reassemble(obj) # None until the last fragment
+# ...     if obj is not None:
+# ...         obj.deepDecode()
+
+import time
+from collections import OrderedDict
+
+
+class RetryFilter(object):
+	"""Duplicate detection as done by 802.11 receivers.
+
+	For each transmitter the (sequence, fragment) numbers of the last
+	`window` frames are remembered. A frame with the retry bit set whose
+	numbers are in the window is a retransmission of a frame we already
+	saw. Transmitters are kept in LRU order, at most maxTransmitters of them.
+	"""
+
+	def __init__(self, window=8, maxTransmitters=4096):
+		self.window = window
+		self.maxTransmitters = maxTransmitters
+		self.transmitters = OrderedDict()
+		self.duplicates = 0
+
+	def isDuplicate(self, wifiFrame):
+		"""Returns True if the frame is a retry of one already seen.
+		   Frames without sequence control (control frames) never are."""
+		if wifiFrame.sequenceNumber is None:
+			return False
+		key = (wifiFrame.sequenceNumber, wifiFrame.fragmentNumber)
+		tx = wifiFrame.addr2
+		recent = self.transmitters.pop(tx, None)
+		if recent is None:
+			recent = []
+			if len(self.transmitters) >= self.maxTransmitters:
+				self.transmitters.popitem(last=False)
+		self.transmitters[tx] = recent # (re)insert as most recently used
+
+		if wifiFrame.retryFlag and key in recent:
+			self.duplicates += 1
+			return True
+		recent.append(key)
+		if len(recent) > self.window:
+			del recent[0]
+		return False
+
+
+class FragmentReassembler(object):
+	"""Reassembles fragmented MSDUs.
+
+	Fragments are buffered per (transmitter, sequence number). Incomplete
+	MSDUs are dropped once they are older than timeout seconds, or when more
+	than maxPending are buffered (oldest first).
+	"""
+
+	def __init__(self, timeout=1.0, maxPending=256, clock=time.time):
+		self.timeout = timeout
+		self.maxPending = maxPending
+		self.clock = clock
+		self.pending = OrderedDict() # (transmitter, sequence) -> entry
+		self.dropped = 0
+
+	def add(self, wifiFrame, now=None):
+		"""Returns the complete MSDU body once all its fragments arrived,
+		   None while it is still incomplete. Unfragmented frames are
+		   returned straight away."""
+		frag = wifiFrame.fragmentNumber
+		fragmented = frag is not None and (frag or wifiFrame.moreFrag)
+		if fragmented or self.pending:
+			if now is None:
+				now = self.clock()
+			self.expire(now)
+		if not fragmented:
+			return wifiFrame.body()
+
+		key = (wifiFrame.addr2, wifiFrame.sequenceNumber)
+		entry = self.pending.get(key)
+		if entry is None:
+			if len(self.pending) >= self.maxPending:
+				self.pending.popitem(last=False)
+				self.dropped += 1
+			# [started, {fragment: body}, number of fragments once known]
+			entry = self.pending[key] = [now, {}, None]
+		fragments = entry[1]
+		fragments[frag] = wifiFrame.body()
+		if not wifiFrame.moreFrag:
+			entry[2] = frag + 1
+
+		# fragments may arrive out of order, so check every time
+		total = entry[2]
+		if total is None or len(fragments) < total:
+			return None
+		if not all(i in fragments for i in xrange(total)):
+			return None
+		del self.pending[key]
+		return ''.join(fragments[i] for i in xrange(total))
+
+	def reassemble(self, wifiFrame, now=None):
+		"""Like add(), but returns a frame to decode: wifiFrame itself if
+		   it isn't fragmented, a frame of the same class holding the
+		   whole MSDU once the last fragment arrived, None until then."""
+		frag = wifiFrame.fragmentNumber
+		if frag is None or not (frag or wifiFrame.moreFrag):
+			return wifiFrame
+		body = self.add(wifiFrame, now)
+		if body is None:
+			return None
+		header = bytearray(wifiFrame.raw[:wifiFrame.headerLength()])
+		header[1] &= ~0x04 # more fragments
+		header[22] &= 0xF0 # fragment number
+		return wifiFrame.__class__(str(header) + body, hasFCS=False)
+
+	def expire(self, now=None):
+		"""Drops incomplete MSDUs older than the timeout."""
+		if now is None:
+			now = self.clock()
+		limit = now - self.timeout
+		while self.pending:
+			key, entry = next(self.pending.iteritems())
+			if entry[0] > limit:
+				break
+			del self.pending[key]
+			self.dropped += 1
@@ -1,9 +1,15 @@
 #!/usr/bin/env python
+import sys
 import socket 
 import time
 import struct
+import zlib
 import radiotap
 import flags
+from sequence import RetryFilter, FragmentReassembler
+import dataframe
+import channels
+from macaddr import macToInt, formatMac
 
 class RadiotapFrame(object):
 	def __init__(self, data):
@@ -11,12 +17,52 @@ class RadiotapFrame(object):
         	self.length = struct.unpack('H', data[2:4])[0]
 	        self.payload = data[self.length:]
 		self.fields = radiotap.parse(data)
+		self.hopChannel = None # channel captured on, see ChannelHopper.tag()
 
 	def getChannel(self):
+		"""Frequency in MHz, from the lower half of the CHANNEL field."""
 		if radiotap.RTAP_CHANNEL in self.fields:
 			return self.fields[radiotap.RTAP_CHANNEL] & 0xFFFF # Fixes bug in representation
 		return None
 
+	def getChannelNumber(self):
+		if radiotap.RTAP_CHANNEL in self.fields:
+			return channels.FREQ_TO_CHANNEL.get(self.fields[radiotap.RTAP_CHANNEL] & 0xFFFF)
+		return None
+
+	def getChannelFlags(self):
+		"""RTAP_CHAN_* bits, from the upper half of the CHANNEL field."""
+		if radiotap.RTAP_CHANNEL in self.fields:
+			return self.fields[radiotap.RTAP_CHANNEL] >> 16
+		return None
+
+	def getBand(self):
+		if radiotap.RTAP_CHANNEL not in self.fields:
+			return None
+		value = self.fields[radiotap.RTAP_CHANNEL]
+		band = channels.FREQ_TO_BAND.get(value & 0xFFFF)
+		if band is None:
+			band = channels.flagsToBand(value >> 16)
+		return band
+
+	def getFlags(self):
+		if radiotap.RTAP_FLAGS in self.fields:
+			return self.fields[radiotap.RTAP_FLAGS]
+		return None
+
+	def hasFCS(self):
+		"""True/False if the radiotap flags say whether the frame ends in an
+		FCS, None if the header doesn't carry flags."""
+		flags = self.getFlags()
+		if flags is None:
+			return None
+		return bool(flags & radiotap.RTAP_F_FCS)
+
+	def badFCS(self):
+		"""True if the driver reported the frame as failing its FCS check."""
+		flags = self.getFlags()
+		return flags is not None and bool(flags & radiotap.RTAP_F_BADFCS)
+
 	def getSignalStrength(self):
 		if radiotap.RTAP_DBM_ANTSIGNAL in self.fields:
 			return self.fields[radiotap.RTAP_DBM_ANTSIGNAL]
@@ -44,7 +90,9 @@ class RadiotapFrame(object):
 #http://ilovewifi.blogspot.com.au/2012/07/80211-frame-types.html
 #http://www.wildpackets.com/images/compendium/802dot11_frame.gif
 class WifiFrame(object):
-	def __init__(self, data, deepdecode=False):
+	def __init__(self, data, deepdecode=False, hasFCS=None):
+		"""hasFCS - whether data ends in a 4 byte FCS, normally
+		RadiotapFrame.hasFCS(). None guesses from the frame length."""
 		self.version		= ord(data[0]) & 0b00000011
 		self.type		= (ord(data[0]) >> 2) & 0b00000011
 		self.subtype		= (ord(data[0]) >> 4) & 0b00001111
@@ -58,15 +106,25 @@ class WifiFrame(object):
 		self.durationID		= data[2:4]
 		self.addr1		= data[4:10]
 		self.addr2		= data[10:16] #FIXME: Not present for control frames
-		self.addr3		= data[16:24] #FIXME: Not present for control frames
-		self.seqControl		= data[24:26] #FIXME: Not present for control frames
-		self.addr4		= data[26:32] #FIXME: Not always present depending on type
+		self.addr3		= data[16:22] #FIXME: Not present for control frames
+		self.seqControl		= data[22:24] #FIXME: Not present for control frames
+		self.addr4		= data[24:30] #FIXME: Not always present depending on type
+		self.raw		= data
 		self.data		= data[36:]
 		self.fcs 		= ''
-		if len(self.data) > 4:
-			self.fcs	= self.data[-4:]
-			self.data	= self.data[:-4]
+		if hasFCS is None:
+			hasFCS = len(self.data) > 4 # nothing to go by, assume it's there
+		if hasFCS and len(data) >= 4:
+			self.fcs	= data[-4:]
+			self.data	= data[36:-4]
 		self.tags		= []#management frame information elements - only used on mngmt frames obviously
+		self._payload		= None # dissected data frame body, see dataPayload()
+		self.fragmentNumber	= None
+		self.sequenceNumber	= None
+		if self.type != 1 and len(self.seqControl) == 2:
+			seq = struct.unpack('<H', self.seqControl)[0]
+			self.fragmentNumber = seq & 0x000F
+			self.sequenceNumber = seq >> 4
 
 		if deepdecode:
 			self.deepDecode()
@@ -88,7 +146,6 @@ class WifiFrame(object):
 	def _decodeMngmt(self):
 		"""Called internally to decode the data section of management frames."""
 		i = 0
-		print self.type, self.subtype
 		while i < len(self.data):
 			tpe = ord(self.data[i])
                         length = ord(self.data[i+1])
@@ -96,8 +153,47 @@ class WifiFrame(object):
                         i += 2+length
 			self.tags.append((tpe,data))
 			
+	def verifyFCS(self):
+		"""Checks the FCS against a CRC32 of the frame. Returns None if the
+		frame has no FCS."""
+		if not self.fcs:
+			return None
+		crc = zlib.crc32(self.raw[:-4]) & 0xFFFFFFFF
+		return crc == struct.unpack('<I', self.fcs)[0]
+
+	def headerLength(self):
+		"""Returns the length of the MAC header, which depends on the type,
+		the DS bits and whether the frame carries QoS control."""
+		if self.type == 1:
+			return 10 # FIXME: RTS/PS-Poll/BAR carry a second address
+		length = 24
+		if self.toDS and self.fromDS:
+			length += 6
+		if self.type == 2 and self.subtype & 0x08:
+			length += 2 # QoS control
+			if ord(self.raw[1]) & 0x80:
+				length += 4 # HT control, signalled by the order bit
+		return length
+
+	def body(self):
+		"""Returns the frame body: everything between the MAC header and the FCS."""
+		end = len(self.raw) - len(self.fcs)
+		return self.raw[self.headerLength():end]
+
 	def isData(self):
 		return (self.type == 2)
+
+	def isProtected(self):
+		return self.WEPFlag
+
+	def dataPayload(self):
+		"""Dissects the body of a data frame on first use. Returns a
+		dataframe.DataPayload (ethertype, payload, eapolKey) or None for
+		protected, empty or non LLC/SNAP frames."""
+		if self._payload is None:
+			self._payload = dataframe.dissect(self) or False
+		return self._payload or None
+
 	def isBeacon(self):
 		return (self.subtype == 8) and (self.type == 0)
 
@@ -143,6 +239,18 @@ class WifiFrame(object):
 		if self.toDS == True and self.fromDS == True:
                         return 0
 
+	def srcMac(self):
+		"""Returns the source MAC as a 48 bit int."""
+		return macToInt(self.src())
+
+	def destMac(self):
+		"""Returns the destination MAC as a 48 bit int."""
+		return macToInt(self.dest())
+
+	def bssidMac(self):
+		"""Returns the BSSID as a 48 bit int, None if the frame has none."""
+		return macToInt(self.bssid())
+
 	def repeaterAddresses(self):
 		"""For frames which are repeated, returns a tuple
 		containing the transmitter and reciever station addresses"""
@@ -170,8 +278,8 @@ class WifiFrame(object):
 		else:
 			print "Type: ", '-'.join(self.getType())
 
-		print "Source: ", self.src().encode('hex')
-		print "Destination: ", self.dest().encode('hex')
+		print "Source: ", formatMac(self.srcMac())
+		print "Destination: ", formatMac(self.destMac())
 		print "Payload: ", len(self.data)
                 #if self.isManagement():
                 #        for tag in self.tags:
@@ -185,17 +293,79 @@ def createPacketSink(interface="mon0"):
         return rawSocket
 
 
-def main():
-        rawSocket = createPacketSink()
-        while True:
-                pkt = rawSocket.recvfrom(2548)[0] #each recv from call gets a most one packet
-		radioFrame = RadiotapFrame(pkt)
-		#print radioFrame
-                obj = WifiFrame(radioFrame.payload, True)
-                #if obj.isBeacon():
-                if not obj.isBeacon():
-                        obj.display()
+def main(interface="mon0", hop=False, output=None, fields=None, verifyFCS=False):
+	"""Captures from interface and prints decoded frames.
+
+	Frames the driver flagged as failing the FCS check are dropped before
+	decoding. verifyFCS additionally checks the CRC of every frame which
+	has an FCS, for drivers which pass bad frames on unflagged.
+	Retransmissions are dropped, and fragmented data frames are put back
+	together before they are decoded.
+
+	output - None for the verbose display(), or a format name from
+	         output.SINKS (jsonl, csv, text) for buffered structured output.
+	"""
+	rawSocket = createPacketSink(interface)
+	hopper = None
+	if hop:
+		from interfaces import Wireless
+		from channelhop import ChannelHopper
+		hopper = ChannelHopper(Wireless(interface).setChannel)
+		hopper.start()
+	retries = RetryFilter()
+	fragments = FragmentReassembler()
+	sink = None
+	if output:
+		import output as outputmod
+		sink = outputmod.getSink(output, fields=fields)
+		# wake up now and then to flush what a quiet channel left buffered
+		rawSocket.settimeout(sink.maxDelay)
+	try:
+		while True:
+			try:
+				pkt = rawSocket.recvfrom(2548)[0] #each recv from call gets a most one packet
+			except socket.timeout:
+				sink.flushDue()
+				continue
+			ts = time.time()
+			radioFrame = RadiotapFrame(pkt)
+			if hopper:
+				hopper.tag(radioFrame)
+			#print radioFrame
+			if radioFrame.badFCS():
+				continue
+			obj = WifiFrame(radioFrame.payload, hasFCS=radioFrame.hasFCS())
+			if verifyFCS and obj.verifyFCS() is False:
+				continue
+			if retries.isDuplicate(obj):
+				continue
+			if obj.isData():
+				# decoded and written once, when the last fragment is in
+				obj = fragments.reassemble(obj)
+				if obj is None:
+					continue
+			if sink is None or sink.deepDecode:
+				obj.deepDecode()
+			if hopper:
+				hopper.observe(obj.bssid(), radioFrame.getChannelNumber())
+			if sink:
+				sink.write(radioFrame, obj, ts)
+			#if obj.isBeacon():
+			elif not obj.isBeacon():
+				obj.display()
+	finally:
+		if sink:
+			sink.close()
 
 
 if __name__ == "__main__":
-	main()
+	import argparse
+	parser = argparse.ArgumentParser(description="Decode 802.11 frames from a monitor interface")
+	parser.add_argument("interface", nargs="?", default="mon0")
+	parser.add_argument("--hop", action="store_true", help="hop channels while capturing")
+	parser.add_argument("--format", choices=["jsonl", "csv", "text"], help="structured output format")
+	parser.add_argument("--fields", help="comma separated list of fields to output")
+	parser.add_argument("--verify-fcs", action="store_true", help="drop frames whose FCS doesn't match")
+	args = parser.parse_args()
+	main(args.interface, args.hop, args.format,
+		args.fields.split(",") if args.fields else None, args.verify_fcs)
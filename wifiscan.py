@@ -62,7 +62,8 @@ rules={"Name":get_name,
 def sort_cells(cells):
     sortby = "Quality"
     reverse = True
-    cells.sort(None, lambda el:el[sortby], reverse)
+    # cells without the column (None) go last
+    cells.sort(None, lambda el:el[sortby] or "", reverse)
 
 # You can choose which columns to display here, and most importantly in what order. Of
 # course, they must exist as keys in the dict rules.
@@ -93,15 +94,84 @@ def match(line,keyword):
     else:
         return None
 
+# parse_cell() fills the columns of the rules above in a single pass over the
+# cell, dispatching on the first three characters of each line. Rules which
+# aren't the ones above are still applied on their own.
+
+def _quality(value):
+    quality = value.split()[0].split('/')
+    return str(int(round(float(quality[0]) / float(quality[1]) * 100))).rjust(3) + " %"
+
+_prefixes={"ESS":("ESSID:", "Name", lambda value: value[1:-1]),
+           "Qua":("Quality=", "Quality", _quality),
+           "Cha":("Channel:", "Channel", None),
+           "Add":("Address: ", "Address", None),
+           "Enc":("Encryption key:", None, None),
+           "IE:":("IE:", None, None),
+           }
+
+_builtin_rules={"Name":get_name,
+                "Quality":get_quality,
+                "Channel":get_channel,
+                "Encryption":get_encryption,
+                "Address":get_address,
+                }
+
 def parse_cell(cell):
     """Applies the rules to the bunch of text describing a cell and returns the
-    corresponding dictionary"""
-    parsed_cell={}
-    for key in rules:
-        rule=rules[key]
-        parsed_cell.update({key:rule(cell)})
+    corresponding dictionary. Columns whose line is missing are None."""
+    parsed_cell={"Name":None, "Quality":None, "Channel":None, "Address":None}
+    key=None
+    ie=None
+    for line in cell:
+        line=line.lstrip()
+        entry=_prefixes.get(line[:3])
+        if entry==None:
+            continue
+        prefix, column, convert = entry
+        if not line.startswith(prefix):
+            continue
+        value=line[len(prefix):]
+        if column!=None:
+            # the first matching line counts, as with matching_line()
+            if parsed_cell[column]==None:
+                parsed_cell[column]=convert(value) if convert else value
+        elif prefix=="IE:":
+            # the last WPA IE counts
+            value=value.lstrip()
+            if value.startswith("WPA Version "):
+                ie="WPA v."+value[12:]
+            if value.startswith("IEEE 802.11i/WPA2"):
+                ie="WPA v.2"
+        elif key==None:
+            key=value
+    if key=="off":
+        parsed_cell["Encryption"]="Open"
+    else:
+        parsed_cell["Encryption"]=ie or "WEP"
+    for column in rules:
+        rule=rules[column]
+        if _builtin_rules.get(column) is not rule:
+            parsed_cell[column]=rule(cell)
     return parsed_cell
 
+def iter_cells(lines):
+    """Yields the parsed cells of iwlist scan output, each one as soon as the
+    line starting the next cell (or the end of lines) is read"""
+    cell=None
+    for line in lines:
+        # stripped once here, so parse_cell()'s lstrip() has nothing to do
+        line=line.strip()
+        if line[:5] == "Cell ":
+            if cell != None:
+                yield parse_cell(cell)
+            cell=[]
+            line = line[-27:]
+        if cell != None:
+            cell.append(line)
+    if cell != None:
+        yield parse_cell(cell)
+
 def print_table(table):
     widths=map(max,map(lambda l:map(len,l),zip(*table))) #functional magic
 
@@ -122,26 +192,36 @@ def print_cells(cells):
     for cell in cells:
         cell_properties=[]
         for column in columns:
-            cell_properties.append(cell[column])
+            # missing columns are None, print them empty
+            cell_properties.append(cell[column] or "")
         table.append(cell_properties)
     print_table(table)
 
-def main():
-    """Pretty prints the output of iwlist scan into a table"""
-    cells=[[]]
-    parsed_cells=[]
+# Column widths used when streaming, as the table can't be sized up front
 
-    for line in sys.stdin:
-        cell_line = match(line,"Cell ")
-        if cell_line != None:
-            cells.append([])
-            line = cell_line[-27:]
-        cells[-1].append(line.rstrip())
+stream_widths={"Name":32, "Address":17, "Quality":7, "Channel":7, "Encryption":10}
 
-    cells=cells[1:]
+def print_cell_stream(cell):
+    line=[]
+    for column in columns:
+        value=cell[column]
+        if value==None:
+            value=""
+        line.append(str(value).ljust(stream_widths.get(column, 10)+2))
+    print "".join(line)
+    sys.stdout.flush()
 
-    for cell in cells:
-        parsed_cells.append(parse_cell(cell))
+def main():
+    """Pretty prints the output of iwlist scan into a table. With --stream,
+    every cell is printed as soon as it is complete instead (unsorted)"""
+    if sys.argv[1:2] == ["--stream"]:
+        print_cell_stream(dict(zip(columns, columns)))
+        # readline(), iterating sys.stdin reads ahead
+        for cell in iter_cells(iter(sys.stdin.readline, "")):
+            print_cell_stream(cell)
+        return
+
+    parsed_cells=list(iter_cells(sys.stdin))
 
     sort_cells(parsed_cells)
 
@@ -149,21 +229,7 @@ def main():
 
 def scan(interface):
     data = subprocess.check_output(['iwlist', interface, "scan"])
-    cells=[[]]
-    parsed_cells=[]
-
-    for line in data.split('\n'):
-	cell_line = match(line,"Cell ")
-	if cell_line != None:
-	    cells.append([])
-	    line = cell_line[-27:]
-	cells[-1].append(line.rstrip())
-
-    cells=cells[1:]
-
-    for cell in cells:
-	parsed_cells.append(parse_cell(cell))
-    return parsed_cells
+    return list(iter_cells(data.split('\n')))
 
 def prettyPrintOutput(parsed_cells):
 	sort_cells(parsed_cells)